@@ -1,7 +1,16 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import math
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from service.logic import Logic
-from typing import Optional, Dict, List, Any, Union
+from service.executor import run_blocking
+from service.log import get_logger
+from service.logic import Logic, WARMUP_ON_STARTUP
+from service.requestScheduler import Overloaded
+from service.batchChat import BATCH_CHAT_CONCURRENCY, BATCH_CHAT_MAX_CONCURRENCY, BatchChat, split_lines
+from service.streaming import sse
+from typing import Optional, Dict, List, Any, Union, AsyncIterator
 from constant.chatRequest import ChatHistoryConstant
 app = FastAPI(
     title="通用ai客服 API",
@@ -11,6 +20,59 @@ app = FastAPI(
     redoc_url="/redoc" # 自定义 ReDoc 的访问路径)
 )
 logic = Logic()
+logger = get_logger(__name__)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded) -> JSONResponse:
+    """排队已满时返回 429，客户端按 Retry-After 重试"""
+    return JSONResponse(status_code=429, content={"success": False, "detail": exc.reason},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    logic.start_background_jobs()
+    if WARMUP_ON_STARTUP:
+        # 后台预热，不阻塞服务启动；完成前 /ready 返回 503
+        app.state.warmup = asyncio.create_task(logic.awarmup())
+        app.state.warmup.add_done_callback(_warmup_done)
+
+
+def _warmup_done(task: asyncio.Task) -> None:
+    """预热失败时记录异常，/ready 中返回失败原因"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error("预热失败", exc_info=(type(error), error, error.__traceback__))
+
+
+def _warmup_error() -> Optional[str]:
+    task = getattr(app.state, "warmup", None)
+    if task is None or not task.done() or task.cancelled() or task.exception() is None:
+        return None
+    return repr(task.exception())
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    logic.stop_background_jobs()
+
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {"success": True}
+
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    # 关闭预热时 readiness 可能需要连接数据库，放入线程池执行
+    readiness = await run_blocking(logic.readiness)
+    error = _warmup_error()
+    if error is not None:
+        readiness["warmup_error"] = error
+    return JSONResponse(status_code=200 if readiness["ready"] else 503,
+                        content={"success": readiness["ready"], "data": readiness})
 
 
 class ChatRequest(BaseModel):
@@ -23,7 +85,7 @@ class ChatRequest(BaseModel):
 @app.post("/chat")
 async def chat(request: ChatRequest) -> Dict[str, Any]:
     #try:
-    response = logic.generate_text_agent(
+    response = await logic.agenerate_text_agent(
         question=request.question,
         user_id=request.user_id,
         store_id=request.store_id,
@@ -34,10 +96,110 @@ async def chat(request: ChatRequest) -> Dict[str, Any]:
     # except Exception as e:
     #     raise HTTPException(status_code=500, detail=str(e))
 
+class ChatStreamRequest(ChatRequest):
+    include_steps: bool = False
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatStreamRequest) -> StreamingResponse:
+    """以 Server-Sent Events 推送 Final Answer 的 token，include_steps 为 true 时同时推送工具调用步骤"""
+    # 开始推送后无法再返回 429，过载检查放在响应之前
+    logic.check_admission(request.user_id)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in logic.astream_text_agent(
+                question=request.question,
+                user_id=request.user_id,
+                store_id=request.store_id,
+                chat_history=request.chat_history,
+                use_history=request.use_history,
+                include_steps=request.include_steps
+            ):
+                yield sse(event["event"], event["data"])
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/chat/batch")
+async def chat_batch(request: Request,
+                     concurrency: int = Query(BATCH_CHAT_CONCURRENCY, ge=1, le=BATCH_CHAT_MAX_CONCURRENCY),
+                     persist: bool = True) -> StreamingResponse:
+    """请求体为 JSONL，每行一个问题；按完成顺序以 NDJSON 逐条返回回答，index 为输入的行序号
+
+    persist 为 false 时不写入对话历史，也不读写回答缓存
+    """
+    runner = BatchChat(logic, concurrency=concurrency, persist=persist)
+
+    async def results() -> AsyncIterator[str]:
+        async for result in runner.arun(split_lines(request.stream())):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.post("/summarize/{user_id}")
 async def summarize(user_id: str) -> Dict[str, Any]:
     try:
-        success = logic.summarize_user_history(user_id)
+        success = await logic.asummarize_user_history(user_id)
         return {"success": success}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/summarize")
+async def summarize_all() -> Dict[str, Any]:
+    try:
+        return {"success": True, "data": await logic.asummarize_all()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/stats/summary")
+async def summary_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.summary_stats()}
+
+@app.delete("/cache/answers")
+async def invalidate_all_answers() -> Dict[str, Any]:
+    logic.invalidate_answer_cache()
+    return {"success": True}
+
+@app.delete("/cache/answers/{store_id}")
+async def invalidate_store_answers(store_id: str) -> Dict[str, Any]:
+    logic.invalidate_answer_cache(store_id)
+    return {"success": True}
+
+@app.get("/stats/answer-cache")
+async def answer_cache_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.answer_cache_stats()}
+
+@app.get("/stats/embedding")
+async def embedding_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.embedding_stats()}
+
+@app.get("/stats/writer")
+async def writer_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.writer_stats()}
+
+@app.get("/stats/tools")
+async def tool_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.tool_stats()}
+
+@app.get("/stats/scheduler")
+async def scheduler_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.scheduler_stats()}
+
+@app.get("/stats/router")
+async def route_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.route_stats()}
+
+@app.get("/stats/memory")
+async def memory_stats() -> Dict[str, Any]:
+    return {"success": True, "data": logic.memory_stats()}
+
+@app.get("/stats/metrics")
+async def metrics() -> Dict[str, Any]:
+    return {"success": True, "data": logic.metrics()}
+
+@app.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(logic.prometheus_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,51 @@
+"""测量每次请求构建 agent 的额外开销：每次重建 vs 执行器池复用
+
+运行: python -m benchmarks.bench_agent_pool
+"""
+import json
+import time
+
+from langchain.agents import AgentExecutor, create_react_agent
+
+from benchmarks.fakes import FakeReActChatModel, stub_tools
+from service.agentPool import AgentPool
+from service.prompt import ChatPrompt
+
+ROUNDS = 500
+
+
+def legacy_build(model: FakeReActChatModel) -> AgentExecutor:
+    """旧实现：每次请求重新生成提示模板、工具和执行器"""
+    ChatPrompt._agent_prompt = None
+    prompt = ChatPrompt().agent()
+    tools = stub_tools()
+    agent = create_react_agent(llm=model, tools=tools, prompt=prompt)
+    return AgentExecutor(agent=agent, tools=tools, max_iterations=3, verbose=True, handle_parsing_errors=True)
+
+
+def main() -> None:
+    model = FakeReActChatModel(latency=0)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        legacy_build(model)
+    legacy_us = (time.perf_counter() - start) * 1e6 / ROUNDS
+
+    pool = AgentPool()
+    prompt = ChatPrompt().agent()
+    tools = stub_tools()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        pool.get(model, prompt, tools)
+    pooled_us = (time.perf_counter() - start) * 1e6 / ROUNDS
+
+    print(json.dumps({
+        "rounds": ROUNDS,
+        "legacy_us_per_request": round(legacy_us, 1),
+        "pooled_us_per_request": round(pooled_us, 1),
+        "pool": pool.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""语义回答缓存：重复咨询场景下的命中率与节省的耗时
+
+问题按 Zipf 分布从每个店铺的常见问题中抽取，模拟客服流量中大量重复的发货/退货咨询。
+常见问题不含订单号等数字（带标识的问题不读写缓存），每次请求在独立的追踪中执行，与线上一致。
+
+运行: python -m benchmarks.bench_answer_cache
+"""
+import json
+import time
+
+import numpy as np
+
+from benchmarks.fakes import CountingEmbeddings, FakeReActChatModel, stub_tools
+from benchmarks.offline import install_stub_tools
+
+STORES = 5
+REQUESTS = 300
+TOPICS = ("发货", "退货", "换货", "开发票", "改地址", "用优惠券", "包邮", "保修")
+PHRASES = ("多久可以{}？", "怎么{}？", "请问能{}吗？", "{}有什么要求？", "想{}该找谁？")
+QUESTIONS = [phrase.format(topic) for topic in TOPICS for phrase in PHRASES]
+
+
+def main() -> None:
+    install_stub_tools()
+    from service.embedding import EmbeddingService
+    from service.llm import LLM
+    from service.tracing import start_trace
+
+    EmbeddingService._model = CountingEmbeddings()
+    llm = LLM()
+    llm.model = FakeReActChatModel(latency=0.05, token_latency=0)
+    llm.tools = stub_tools()
+
+    rng = np.random.default_rng(0)
+    ranks = np.minimum(rng.zipf(1.3, REQUESTS), len(QUESTIONS)) - 1
+    stores = rng.integers(0, STORES, REQUESTS)
+
+    hit_latency, miss_latency = [], []
+    for store, rank in zip(stores, ranks):
+        before = llm.answer_cache.hits
+        start = time.perf_counter()
+        with start_trace("bench"):
+            llm.generate_text_agent(question=QUESTIONS[rank], store_id=f"store-{store}", use_history=False)
+        elapsed = time.perf_counter() - start
+        (hit_latency if llm.answer_cache.hits > before else miss_latency).append(elapsed)
+
+    stats = llm.answer_cache.stats()
+    print(json.dumps({
+        "requests": REQUESTS,
+        "hit_rate": round(stats["hit_rate"], 3),
+        "saved_seconds": round(stats["saved_seconds"], 2),
+        "avg_hit_ms": round(float(np.mean(hit_latency)) * 1000, 2) if hit_latency else None,
+        "avg_miss_ms": round(float(np.mean(miss_latency)) * 1000, 2) if miss_latency else None,
+        "llm_calls": llm.model.calls,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
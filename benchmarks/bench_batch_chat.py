@@ -0,0 +1,74 @@
+"""批量对话吞吐：逐条调用 Logic.generate_text_agent vs BatchChat 有限并发回放
+
+使用假聊天模型（每次调用固定耗时）与假嵌入模型，回放分布在多个店铺与用户上的问题，
+输出每分钟回答的问题数与嵌入模型的调用次数。回放均不写入对话历史。
+
+运行: python -m benchmarks.bench_batch_chat [问题数]
+"""
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.offline import patch_services, prepare
+
+LATENCY = 0.05
+CONCURRENCY = (8, 32)
+
+
+def questions(count: int) -> List[Dict[str, Any]]:
+    return [{"id": i, "question": f"订单 {i} 什么时候发货？", "user_id": f"user-{i % 50}",
+             "store_id": f"store-{i % 10}"} for i in range(count)]
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare(tmp)
+        embeddings = patch_services(latency=LATENCY)
+        from service.batchChat import BatchChat, iterate
+        from service.logic import Logic
+
+        logic = Logic()
+        items = questions(count)
+        results: Dict[str, Any] = {}
+
+        calls = embeddings.calls
+        start = time.perf_counter()
+        for item in items:
+            logic.generate_text_agent(question=item["question"], user_id=item["user_id"],
+                                      store_id=item["store_id"], persist=False)
+        elapsed = time.perf_counter() - start
+        results["sequential"] = {"seconds": round(elapsed, 3),
+                                 "questions_per_minute": round(count * 60 / elapsed, 1),
+                                 "embed_calls": embeddings.calls - calls}
+
+        for concurrency in CONCURRENCY:
+            # 每轮使用不同的问题文本，避免命中上一轮的嵌入缓存
+            lines = [json.dumps({**item, "question": f"{item['question']} #{concurrency}"}, ensure_ascii=False)
+                     for item in items]
+
+            async def run() -> List[Dict[str, Any]]:
+                runner = BatchChat(logic, concurrency=concurrency, persist=False)
+                return [result async for result in runner.arun(iterate(lines))]
+
+            calls = embeddings.calls
+            start = time.perf_counter()
+            answers = asyncio.run(run())
+            elapsed = time.perf_counter() - start
+            results[f"batch_c{concurrency}"] = {
+                "seconds": round(elapsed, 3),
+                "questions_per_minute": round(count * 60 / elapsed, 1),
+                "succeeded": sum(1 for answer in answers if answer["success"]),
+                "embed_calls": embeddings.calls - calls,
+            }
+        logic.stop_background_jobs()
+
+    print(json.dumps({"questions": count, "llm_latency_s": LATENCY, "results": results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
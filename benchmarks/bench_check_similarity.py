@@ -0,0 +1,79 @@
+"""对比去重路径每轮对话的嵌入调用次数
+
+运行: python -m benchmarks.bench_check_similarity
+"""
+import json
+import time
+from typing import Any
+
+import numpy as np
+from langchain.schema import Document
+
+from benchmarks.fakes import CountingEmbeddings, FakeChromaDB
+from service.chatHistoryStrore import ChatHistoryStore
+
+TURNS = 200
+K = 3
+
+
+def legacy_check_similarity(store: ChatHistoryStore, user_id: str, text: str,
+                            threshold: float = 0.8, k: int = K) -> bool:
+    """旧实现：先嵌入查询，再对每个命中结果重新嵌入一次"""
+    text_vector = store.embedding_function.embed_query(text)
+    results = store.db.similarity_search_by_vector(
+        text_vector, k=k,
+        filter={"$and": [{"user_id": {"$eq": user_id}}, {"type": {"$eq": "conversation"}}]}
+    )
+    for result in results:
+        result_vector = store.embedding_function.embed_query(json.loads(result.page_content).get("user", ""))
+        a, b = np.asarray(text_vector), np.asarray(result_vector)
+        if a @ b / (np.linalg.norm(a) * np.linalg.norm(b)) > threshold:
+            return True
+    return False
+
+
+def run(check: Any, store: ChatHistoryStore, embeddings: CountingEmbeddings) -> dict:
+    """模拟 save_conversation：问题与回答各去重一次，只统计去重阶段的嵌入调用"""
+    dedup_calls = 0
+    start = time.perf_counter()
+    for i in range(TURNS):
+        question, answer = f"问题 {i}", f"回答 {i}"
+        before = embeddings.calls
+        check(question, answer)
+        dedup_calls += embeddings.calls - before
+        store.db.add_documents([store_doc(question, answer)])
+    elapsed = time.perf_counter() - start
+    return {"dedup_embed_calls_per_turn": dedup_calls / TURNS, "ms_per_turn": elapsed * 1000 / TURNS}
+
+
+def store_doc(question: str, answer: str) -> Document:
+    return Document(
+        page_content=json.dumps({"user": question, "bot": answer, "timestamp": ""}, ensure_ascii=False),
+        metadata={"type": "conversation", "user_id": "bench"}
+    )
+
+
+def main() -> None:
+    embeddings = CountingEmbeddings()
+    legacy = ChatHistoryStore(embedding_function=embeddings, db=FakeChromaDB(embeddings))
+    legacy_result = run(
+        lambda q, a: (legacy_check_similarity(legacy, "bench", q), legacy_check_similarity(legacy, "bench", a)),
+        legacy, embeddings
+    )
+
+    embeddings = CountingEmbeddings()
+    store = ChatHistoryStore(embedding_function=embeddings, db=FakeChromaDB(embeddings))
+
+    def vectorized(question: str, answer: str) -> None:
+        vectors = embeddings.embed_documents([question, answer])
+        store.check_similarity("bench", question, text_vector=vectors[0])
+        store.check_similarity("bench", answer, text_vector=vectors[1])
+        store._append_user_vector("bench", store._normalize(vectors[0])[0])
+
+    vectorized_result = run(vectorized, store, embeddings)
+    print(json.dumps({"k": K, "turns": TURNS, "legacy": legacy_result, "vectorized": vectorized_result},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
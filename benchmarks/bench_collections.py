@@ -0,0 +1,140 @@
+"""不同集合布局下的查询延迟：共用集合、按类型独立集合、按用户哈希分片
+
+每个用户写入若干轮对话与一条摘要，另外写入固定数量的知识库分段，分别测量
+读取用户对话、读取摘要、带用户过滤的向量召回三种查询的 p50/p99。
+
+运行: python -m benchmarks.bench_collections [用户数,用户数,...] [每用户轮数] [分片数]
+"""
+import json
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import chromadb
+import numpy as np
+
+from service.chroma import conversation_collection_name, conversation_collection_names
+
+DIM = 64
+KNOWLEDGE_CHUNKS = 2000
+QUERIES = 200
+BATCH = 5000
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return round(float(np.percentile(samples, q)), 3)
+
+
+def vectors(rng: np.random.Generator, count: int) -> List[List[float]]:
+    return rng.standard_normal((count, DIM), dtype=np.float32).tolist()
+
+
+def rows(users: int, turns: int):
+    """生成 (文档ID, 文档, 元数据) 行：每个用户若干轮对话与一条摘要，外加知识库分段"""
+    for u in range(users):
+        user_id = f"user-{u}"
+        for t in range(turns):
+            yield (f"{user_id}-{t}", json.dumps({"user": f"问题 {t}", "bot": f"回答 {t}"}, ensure_ascii=False),
+                   {"type": "conversation", "user_id": user_id, "timestamp": f"2024-01-01T00:{t:02d}:00"})
+        yield f"summary-{user_id}", f"用户 {u} 的摘要", {"type": "summary", "user_id": user_id}
+    for i in range(KNOWLEDGE_CHUNKS):
+        yield f"knowledge-{i}", f"知识库分段 {i}", {"type": "knowledge", "source": f"data/faq-{i % 50}.md"}
+
+
+def populate(client: Any, users: int, turns: int, route: Callable[[Dict[str, Any]], str]) -> float:
+    rng = np.random.default_rng(0)
+    collections: Dict[str, Any] = {}
+    buffers: Dict[str, List[tuple]] = {}
+
+    def flush(name: str) -> None:
+        batch = buffers.pop(name, [])
+        if not batch:
+            return
+        if name not in collections:
+            collections[name] = client.get_or_create_collection(name=name, embedding_function=None)
+        collections[name].add(ids=[r[0] for r in batch], documents=[r[1] for r in batch],
+                              metadatas=[r[2] for r in batch], embeddings=vectors(rng, len(batch)))
+
+    start = time.perf_counter()
+    for row in rows(users, turns):
+        name = route(row[2])
+        buffers.setdefault(name, []).append(row)
+        if len(buffers[name]) >= BATCH:
+            flush(name)
+    for name in list(buffers):
+        flush(name)
+    return time.perf_counter() - start
+
+
+def measure(client: Any, users: int, conversations: Callable[[str], str], summaries: str,
+            typed_filter: bool) -> Dict[str, Any]:
+    rng = np.random.default_rng(1)
+    picks = [f"user-{int(u)}" for u in rng.integers(0, users, QUERIES)]
+    queries = vectors(rng, QUERIES)
+
+    def where(user_id: str, kind: str) -> Dict[str, Any]:
+        if typed_filter:
+            return {"$and": [{"user_id": {"$eq": user_id}}, {"type": {"$eq": kind}}]}
+        return {"user_id": user_id}
+
+    timings: Dict[str, List[float]] = {"load_history": [], "load_summary": [], "search_history": []}
+    for user_id, query in zip(picks, queries):
+        conv = client.get_collection(name=conversations(user_id), embedding_function=None)
+        summary = client.get_collection(name=summaries, embedding_function=None)
+
+        start = time.perf_counter()
+        conv.get(where=where(user_id, "conversation"), include=["documents", "metadatas"])
+        timings["load_history"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        summary.get(where=where(user_id, "summary"), include=["documents", "metadatas"])
+        timings["load_summary"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        conv.query(query_embeddings=[query], n_results=3, where=where(user_id, "conversation"))
+        timings["search_history"].append((time.perf_counter() - start) * 1000)
+
+    return {name: {"p50_ms": percentile(samples, 50), "p99_ms": percentile(samples, 99)}
+            for name, samples in timings.items()}
+
+
+def main() -> None:
+    sizes = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1000, 10000, 100000]
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    shards = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    layouts = {
+        # 旧布局：所有文档共用一个集合，查询需要 user_id 与 type 双重过滤
+        "shared": (lambda meta: "langchain", lambda user_id: "langchain", "langchain", True),
+        # 按类型独立集合
+        "per_kind": (lambda meta: {"conversation": conversation_collection_name(meta.get("user_id", ""), 1),
+                                   "summary": "summaries"}.get(meta["type"], "knowledge"),
+                     lambda user_id: conversation_collection_name(user_id, 1), "summaries", False),
+        # 按类型独立集合，对话再按用户哈希分片
+        f"sharded_{shards}": (lambda meta: {"conversation": conversation_collection_name(meta.get("user_id", ""), shards),
+                                            "summary": "summaries"}.get(meta["type"], "knowledge"),
+                              lambda user_id: conversation_collection_name(user_id, shards), "summaries", False),
+    }
+
+    report: List[Dict[str, Any]] = []
+    for users in sizes:
+        for layout, (route, conversations, summaries, typed_filter) in layouts.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                client = chromadb.PersistentClient(path=tmp)
+                load_seconds = populate(client, users, turns, route)
+                result = measure(client, users, conversations, summaries, typed_filter)
+                report.append({
+                    "users": users,
+                    "layout": layout,
+                    "collections": len(conversation_collection_names(shards)) if layout.startswith("sharded") else 1,
+                    "load_seconds": round(load_seconds, 2),
+                    **result,
+                })
+
+    print(json.dumps({"turns_per_user": turns, "knowledge_chunks": KNOWLEDGE_CHUNKS, "queries": QUERIES,
+                      "results": report}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
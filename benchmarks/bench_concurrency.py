@@ -0,0 +1,58 @@
+"""并发 /chat 负载测试：对比同步串行与异步并发的总耗时
+
+运行: python -m benchmarks.bench_concurrency
+"""
+import asyncio
+import json
+import time
+
+from benchmarks.fakes import FakeReActChatModel
+from benchmarks.offline import install_stub_tools
+
+# service.llm 依赖的 service.tools 不在仓库中，导入前先装上桩工具模块
+install_stub_tools()
+
+from service.llm import LLM  # noqa: E402
+from service.prompt import ChatPrompt  # noqa: E402
+
+REQUESTS = 20
+LATENCY = 0.2
+
+
+def build_llm() -> LLM:
+    llm = LLM()
+    llm.model = FakeReActChatModel(latency=LATENCY)
+    return llm
+
+
+def run_sequential(llm: LLM) -> float:
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        llm.generate_text_agent(question=f"问题 {i}", prompt=ChatPrompt().agent(), tools=[], use_history=False)
+    return time.perf_counter() - start
+
+
+async def run_concurrent(llm: LLM) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        llm.agenerate_text_agent(question=f"问题 {i}", prompt=ChatPrompt().agent(), tools=[], use_history=False)
+        for i in range(REQUESTS)
+    ])
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    sequential = run_sequential(build_llm())
+    concurrent = asyncio.run(run_concurrent(build_llm()))
+    print(json.dumps({
+        "requests": REQUESTS,
+        "llm_latency_s": LATENCY,
+        "sequential_s": round(sequential, 3),
+        "concurrent_s": round(concurrent, 3),
+        # 接近 REQUESTS 说明请求完全重叠执行
+        "overlap_factor": round(sequential / concurrent, 2),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""CPU 上 all-MiniLM-L6-v2 的嵌入吞吐与 p99 延迟
+
+对比各推理后端，以及逐条计算与并发合批两种调用方式。
+
+运行: python -m benchmarks.bench_embedding [请求数] [并发数]
+"""
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from service.embedding import Embedding
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def texts(count: int) -> List[str]:
+    return [f"订单 SO{100000 + i} 什么时候发货？商品编号 SKU-{i % 97}" for i in range(count)]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    values = np.asarray(latencies) * 1000
+    return {
+        "embeddings_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
+
+
+def run(service: Embedding, items: List[str], concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+
+    def one(text: str) -> None:
+        start = time.perf_counter()
+        service.embed_query(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, items))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    items = texts(count)
+    results = {}
+    for backend in ("torch", "onnx", "onnx-int8"):
+        try:
+            unbatched = Embedding(MODEL, backend=backend, cache_size=0, batch_window_ms=0)
+            unbatched.embed_query("warmup")
+        except Exception as e:
+            results[backend] = {"error": str(e)}
+            continue
+        batched = Embedding(MODEL, backend=backend, cache_size=0, batch_window_ms=5)
+        batched._model = unbatched.model
+        cached = Embedding(MODEL, backend=backend, batch_window_ms=5)
+        cached._model = unbatched.model
+        cached.embed_documents(items)
+        results[backend] = {
+            "unbatched": run(unbatched, items, concurrency),
+            "micro_batched": run(batched, items, concurrency),
+            "cache_hit": run(cached, items, concurrency),
+        }
+    print(json.dumps({"requests": count, "concurrency": concurrency, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""对话记录解析：旧格式（JSON 字符串 + pydantic 对象）vs 新格式（结构化元数据 + __slots__ 记录）
+
+对同样的 10 万行数据库返回结果分别解析，输出耗时、解析结果占用的内存，以及每轮对话写入时需要嵌入的字符数。
+
+运行: python -m benchmarks.bench_history_records [行数]
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+from constant.chatRequest import ChatHistoryConstant
+from service.historyRecord import parse_rows, record_metadata
+
+
+def rows(count: int) -> Tuple[List[str], List[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+    """生成同一批对话的旧格式与新格式数据库行"""
+    base = datetime(2024, 1, 1)
+    legacy_docs, legacy_meta, docs, metas = [], [], [], []
+    for i in range(count):
+        timestamp = (base + timedelta(seconds=i)).isoformat()
+        question, answer = f"订单 {i} 什么时候发货？", f"您好，订单 {i} 已发货，预计两天内送达。"
+        legacy_docs.append(json.dumps({"user": question, "bot": answer, "timestamp": timestamp},
+                                      ensure_ascii=False))
+        legacy_meta.append({"timestamp": timestamp, "type": "conversation", "user_id": "bench", "seq": i})
+        docs.append(question)
+        metas.append(record_metadata("bench", answer, timestamp, i))
+    return legacy_docs, legacy_meta, docs, metas
+
+
+def parse_legacy(documents: List[str], metadatas: List[Dict[str, Any]]) -> List[ChatHistoryConstant]:
+    """旧实现：逐行 json.loads 并构建 pydantic 对象"""
+    history = []
+    for doc in documents:
+        data = json.loads(doc)
+        history.append(ChatHistoryConstant(user=data["user"], bot=data["bot"], timestamp=data.get("timestamp")))
+    return history
+
+
+def measure(parse: Callable[[List[str], List[Dict[str, Any]]], List[Any]],
+            documents: List[str], metadatas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    gc.collect()
+    start = time.perf_counter()
+    parse(documents, metadatas)
+    elapsed = time.perf_counter() - start
+
+    # 单独测量内存，避免 tracemalloc 的开销计入耗时
+    gc.collect()
+    tracemalloc.start()
+    result = parse(documents, metadatas)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": len(result), "parse_ms": round(elapsed * 1000, 1),
+            "retained_mb": round(retained / 1024 / 1024, 1), "peak_mb": round(peak / 1024 / 1024, 1),
+            "bytes_per_record": round(retained / max(len(result), 1), 1)}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    legacy_docs, legacy_meta, docs, metas = rows(count)
+
+    # 写入时嵌入的文本：旧格式为 问题 + 回答 + 整段 JSON，新格式为 问题 + 回答（问题向量即文档向量）
+    legacy_chars = sum(len(json.loads(d)["user"]) + len(json.loads(d)["bot"]) + len(d) for d in legacy_docs[:1000])
+    new_chars = sum(len(d) + len(m["bot"]) for d, m in zip(docs[:1000], metas[:1000]))
+
+    print(json.dumps({
+        "rows": count,
+        "legacy": {**measure(parse_legacy, legacy_docs, legacy_meta),
+                   "embedded_chars_per_turn": round(legacy_chars / 1000, 1), "embed_texts_per_turn": 3},
+        "structured": {**measure(parse_rows, docs, metas),
+                       "embedded_chars_per_turn": round(new_chars / 1000, 1), "embed_texts_per_turn": 2},
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""检索召回率与耗时：纯向量 vs 纯关键词（BM25）vs 混合检索
+
+合成语料包含多个店铺的订单、商品（SKU 编码）与各店铺共用的售后政策，查询带店铺过滤，
+输出各方式的 recall@k、MRR、单次查询 p50/p99，以及关键词索引的构建耗时与文件大小。
+
+向量一侧用字符袋嵌入代替 all-MiniLM-L6-v2：对中文与长串数字只保留“出现了哪些字符”，
+订单号、SKU 编码只差几位时向量几乎相同，与英文小模型在中文订单号上的表现类似。
+
+运行: python -m benchmarks.bench_hybrid_search [每个店铺的订单数]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.fakes import FakeChromaDB
+from benchmarks.offline import latency_stats
+from service.hybridSearch import HybridRetriever
+from service.keywordIndex import KeywordIndex
+
+STORES = 20
+PRODUCTS_PER_STORE = 50
+QUERIES = 300
+K = 3
+CITIES = ("北京", "上海", "广州", "深圳", "杭州", "成都", "武汉", "西安")
+PRODUCTS = ("纯棉T恤", "牛仔裤", "运动鞋", "羽绒服", "双肩包", "保温杯", "蓝牙耳机", "机械键盘")
+COLORS = ("黑色", "白色", "红色", "蓝色", "灰色")
+POLICIES = (
+    ("七天无理由退货", "签收后七天内商品未使用可申请无理由退货，运费由买家承担。", "我想退货怎么办"),
+    ("运费说明", "单笔订单满九十九元包邮，偏远地区除外。", "多少钱包邮"),
+    ("发票说明", "下单时填写发票抬头，发货后三个工作日内开具电子发票。", "怎么开发票"),
+    ("换货政策", "商品质量问题十五天内可换货，换货运费由商家承担。", "质量问题可以换货吗"),
+)
+
+
+class BagOfCharsEmbeddings:
+    """按字符哈希计数的嵌入模型，不区分字符顺序"""
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for char in text:
+            vector[zlib.crc32(char.encode("utf-8")) % self.dim] += 1.0
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+
+Documents = List[Tuple[str, str, Dict[str, Any]]]
+Queries = List[Tuple[str, str, str]]
+
+
+def corpus(orders: int, rng: random.Random) -> Tuple[Documents, Queries]:
+    """返回 (文档ID, 内容, 元数据) 与 (查询, 店铺ID, 期望命中的文档ID)"""
+    documents: Documents = []
+    queries: Queries = []
+    for store in range(STORES):
+        store_id = f"store-{store:02d}"
+        for i in range(orders):
+            order_no = f"DD2024{store:02d}{i:04d}"
+            doc_id = f"order-{store}-{i}"
+            documents.append((doc_id, f"订单 {order_no} 已于{rng.randint(1, 28)}日发货，快递单号 "
+                                      f"SF{rng.randrange(10 ** 9, 10 ** 10)}，收货城市{rng.choice(CITIES)}",
+                              {"store_id": store_id, "type": "knowledge"}))
+            queries.append((f"帮我查一下订单 {order_no} 到哪了", store_id, doc_id))
+        for j in range(PRODUCTS_PER_STORE):
+            sku = f"SKU-{store:02d}{j:03d}"
+            doc_id = f"sku-{store}-{j}"
+            documents.append((doc_id, f"商品 {sku} {rng.choice(PRODUCTS)}，颜色{rng.choice(COLORS)}，"
+                                      f"库存 {rng.randint(0, 500)} 件",
+                              {"store_id": store_id, "type": "knowledge"}))
+            queries.append((f"{sku} 还有货吗", store_id, doc_id))
+    for index, (title, body, question) in enumerate(POLICIES):
+        doc_id = f"policy-{index}"
+        documents.append((doc_id, f"{title}：{body}", {"type": "knowledge"}))
+        for store in range(STORES):
+            queries.append((question, f"store-{store:02d}", doc_id))
+    return documents, queries
+
+
+def evaluate(search: Callable[[str, str], List[str]], queries: Queries) -> Dict[str, Any]:
+    hits = 0
+    reciprocal = 0.0
+    samples: List[float] = []
+    start = time.perf_counter()
+    for query, store_id, expected in queries:
+        begin = time.perf_counter()
+        ids = search(query, store_id)
+        samples.append(time.perf_counter() - begin)
+        if expected in ids:
+            hits += 1
+            reciprocal += 1.0 / (ids.index(expected) + 1)
+    stats = latency_stats(samples, time.perf_counter() - start)
+    return {f"recall@{K}": round(hits / len(queries), 3), "mrr": round(reciprocal / len(queries), 3),
+            "p50_ms": stats["p50_ms"], "p99_ms": stats["p99_ms"]}
+
+
+def main() -> None:
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    rng = random.Random(0)
+    documents, all_queries = corpus(orders, rng)
+    queries = rng.sample(all_queries, min(QUERIES, len(all_queries)))
+    embeddings = BagOfCharsEmbeddings()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = KeywordIndex(os.path.join(tmp, "keyword_index.sqlite3"))
+        collection = FakeChromaDB(embeddings, name="knowledge")
+        ids = [doc_id for doc_id, _, _ in documents]
+        texts = [text for _, text, _ in documents]
+        metadatas = [metadata for _, _, metadata in documents]
+        collection.upsert(ids, embeddings.embed_documents(texts), texts, metadatas)
+
+        start = time.perf_counter()
+        # 与服务中一致，按批增量写入
+        for begin in range(0, len(ids), 500):
+            index.add("knowledge", ids[begin:begin + 500], texts[begin:begin + 500], metadatas[begin:begin + 500])
+        build_seconds = time.perf_counter() - start
+        index_mb = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp)) / 1024 / 1024
+
+        retriever = HybridRetriever(keyword_index=index, embedding_function=embeddings)
+
+        def dense(query: str, store_id: str) -> List[str]:
+            # 与混合检索一致，多取候选后按店铺过滤
+            result = collection.query([embeddings.embed_query(query)], n_results=K * retriever.candidates)
+            return [doc_id for doc_id, metadata in zip(result["ids"][0], result["metadatas"][0])
+                    if metadata.get("store_id") in (None, store_id)][:K]
+
+        def keyword(query: str, store_id: str) -> List[str]:
+            return [doc_id for doc_id, _ in index.search("knowledge", query, K, store_id=store_id)]
+
+        def hybrid(query: str, store_id: str) -> List[str]:
+            return [doc.id for doc in retriever.search(collection, query, K, store_id=store_id)]
+
+        results = {"dense": evaluate(dense, queries), "keyword": evaluate(keyword, queries),
+                   "hybrid": evaluate(hybrid, queries)}
+
+    print(json.dumps({"documents": len(documents), "queries": len(queries), "k": K,
+                      "index": {"build_seconds": round(build_seconds, 3), "size_mb": round(index_mb, 2)},
+                      "results": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
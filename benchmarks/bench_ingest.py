@@ -0,0 +1,59 @@
+"""知识库导入吞吐：在合成的 markdown 语料上测量首次导入、无变化重跑与少量修改后的每秒文档数
+
+运行: python -m benchmarks.bench_ingest [文件数] [进程数]
+"""
+import json
+import os
+import sys
+import tempfile
+
+from langchain_chroma import Chroma as LangChainChroma
+
+from service.embedding import EmbeddingService
+from service.ingest import KnowledgeIngestor, Manifest
+
+PARAGRAPHS = [
+    "本店支持七天无理由退货，商品需保持完好，退货运费由买家承担。",
+    "订单付款后48小时内发货，节假日顺延，偏远地区可能延迟。",
+    "商品 SKU-{n} 库存充足，支持门店自提与快递配送。",
+    "会员积分可在下单时抵扣现金，100积分抵扣1元，每单最多抵扣50%。",
+    "如需开具发票，请在订单备注中填写抬头与税号，发票随货寄出。",
+]
+
+
+def write_corpus(path: str, count: int) -> None:
+    for i in range(count):
+        folder = os.path.join(path, f"store-{i % 20}")
+        os.makedirs(folder, exist_ok=True)
+        body = "\n\n".join(p.format(n=i) for p in PARAGRAPHS)
+        with open(os.path.join(folder, f"faq-{i}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# 常见问题 {i}\n\n{body}\n")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data")
+        write_corpus(data, count)
+        collection = LangChainChroma(collection_name="knowledge", persist_directory=os.path.join(tmp, "chroma"),
+                                     embedding_function=EmbeddingService)
+        manifest = Manifest(os.path.join(tmp, "chroma", "ingest_manifest.sqlite3"))
+        ingestor = KnowledgeIngestor(data_path=data, collection=collection, manifest=manifest, workers=workers)
+
+        first = ingestor.run()
+        unchanged = ingestor.run()
+        # 修改 5% 的文件并删除 1% 的文件
+        for i in range(0, count, 20):
+            with open(os.path.join(data, f"store-{i % 20}", f"faq-{i}.md"), "a", encoding="utf-8") as f:
+                f.write("\n新增：支持以旧换新服务。\n")
+        for i in range(1, count, 100):
+            os.remove(os.path.join(data, f"store-{i % 20}", f"faq-{i}.md"))
+        incremental = ingestor.run()
+
+        print(json.dumps({"files": count, "workers": workers, "first_run": first, "unchanged_rerun": unchanged,
+                          "incremental_rerun": incremental}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
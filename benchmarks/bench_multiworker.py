@@ -0,0 +1,185 @@
+"""多 worker 负载测试：多个进程通过 Chroma 服务与共享版本号协同处理同一批用户
+
+1. 吞吐：1/2/4 个 worker 进程并行处理交错分配的请求，同一用户的相邻轮次落在不同 worker 上；
+2. 一致性：同一用户的轮次依次交给不同 worker，每轮检查该 worker 组装的历史中包含上一轮
+   （由其他 worker 写入）的问题，最后从新进程读取每个用户的完整历史条数。
+
+未设置 CHROMA_HOST 时在临时目录启动本地 chroma 服务（需要 chromadb 自带的 chroma 命令）。
+为了让每轮写入立即对其他 worker 可见，测试中关闭写入队列。
+
+运行: python -m benchmarks.bench_multiworker [worker数,worker数,...] [用户数] [每用户轮数]
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+LATENCY = 0.01
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path: str) -> Tuple[Any, str, int]:
+    """在临时目录启动 chroma 服务并等待就绪"""
+    import chromadb
+
+    port = free_port()
+    process = subprocess.Popen([shutil.which("chroma") or "chroma", "run", "--path", path, "--port", str(port)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            chromadb.HttpClient(host="127.0.0.1", port=port).heartbeat()
+            return process, "127.0.0.1", port
+        except Exception:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("chroma 服务启动超时")
+
+
+def build() -> Tuple[Any, Any, Any, Any]:
+    """在 worker 进程内构建使用假模型的 LLM 与历史记录服务"""
+    from benchmarks.fakes import CountingEmbeddings, FakeReActChatModel, stub_tools
+    from benchmarks.offline import install_stub_tools
+
+    # service.llm 依赖的 service.tools 不在仓库中，导入前先装上桩工具模块
+    install_stub_tools()
+    from service.chatHistoryStrore import ChatHistoryStore
+    from service.chroma import ChromaService
+    from service.llm import LLM
+    from service.prompt import ChatPrompt
+
+    embeddings = CountingEmbeddings(dim=32)
+    ChromaService.embedding_function = embeddings
+    store = ChatHistoryStore(embedding_function=embeddings)
+    llm = LLM()
+    llm.model = FakeReActChatModel(latency=LATENCY, token_latency=0.0)
+    return llm, store, ChatPrompt().agent(), stub_tools()
+
+
+def question(user_id: str, turn: int) -> str:
+    return f"{user_id} 的第 {turn} 个问题：订单 {turn} 什么时候发货？"
+
+
+def throughput_worker(jobs: List[Tuple[str, int]], results: Any) -> None:
+    llm, store, prompt, tools = build()
+    start = time.perf_counter()
+    for user_id, turn in jobs:
+        llm.generate_text_agent(question=question(user_id, turn), user_id=user_id, store_id="bench",
+                                prompt=prompt, tools=tools, chatHistoryStoreService=store)
+    results.put((len(jobs), time.perf_counter() - start))
+
+
+def relay_worker(inbox: Any, outbox: Any) -> None:
+    llm, store, prompt, tools = build()
+    while True:
+        job = inbox.get()
+        if job is None:
+            return
+        user_id, turn = job
+        # 检查其他 worker 写入的上一轮是否已出现在本 worker 组装的历史中
+        history = llm._load_memory(question(user_id, turn), user_id, None, store)
+        visible = turn == 0 or question(user_id, turn - 1) in str(history)
+        llm.generate_text_agent(question=question(user_id, turn), user_id=user_id, store_id="bench",
+                                prompt=prompt, tools=tools, chatHistoryStoreService=store)
+        outbox.put(visible)
+
+
+def count_worker(user_ids: List[str], results: Any) -> None:
+    _, store, _, _ = build()
+    results.put({user_id: store.history_index.count(user_id) for user_id in user_ids})
+
+
+def run_throughput(ctx: Any, workers: int, users: int, turns: int, prefix: str) -> Dict[str, Any]:
+    jobs = [(f"{prefix}-{u}", t) for t in range(turns) for u in range(users)]
+    # 交错分配，同一用户的相邻轮次由不同 worker 处理
+    shares = [jobs[i::workers] for i in range(workers)]
+    results = ctx.Queue()
+    start = time.perf_counter()
+    processes = [ctx.Process(target=throughput_worker, args=(share, results)) for share in shares]
+    for process in processes:
+        process.start()
+    done = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    handled = sum(count for count, _ in done)
+    busy = max(seconds for _, seconds in done)
+    return {"workers": workers, "requests": handled, "wall_s": round(elapsed, 3),
+            "requests_per_second": round(handled / busy, 1) if busy else 0.0}
+
+
+def run_consistency(ctx: Any, workers: int, users: int, turns: int) -> Dict[str, Any]:
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    outbox = ctx.Queue()
+    processes = [ctx.Process(target=relay_worker, args=(inbox, outbox)) for inbox in inboxes]
+    for process in processes:
+        process.start()
+    visible = 0
+    checked = 0
+    for u in range(users):
+        for t in range(turns):
+            inboxes[(u + t) % workers].put((f"relay-{u}", t))
+            visible += outbox.get()
+            checked += 1
+    for inbox in inboxes:
+        inbox.put(None)
+    for process in processes:
+        process.join()
+
+    results = ctx.Queue()
+    counter = ctx.Process(target=count_worker, args=([f"relay-{u}" for u in range(users)], results))
+    counter.start()
+    counts = results.get()
+    counter.join()
+    return {"workers": workers, "turns_checked": checked, "previous_turn_visible": visible,
+            "users_with_complete_history": sum(1 for count in counts.values() if count == turns)}
+
+
+def main() -> None:
+    worker_counts = [int(n) for n in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1, 2, 4]
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    turns = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        if not os.getenv("CHROMA_HOST"):
+            server, host, port = start_server(os.path.join(tmp, "chroma"))
+            os.environ["CHROMA_HOST"] = host
+            os.environ["CHROMA_PORT"] = str(port)
+        # 子进程以 spawn 方式启动，重新导入模块时读取这些配置
+        os.environ.update({
+            "SHARED_STATE_BACKEND": "sqlite",
+            "SHARED_STATE_PATH": os.path.join(tmp, "shared_state.sqlite3"),
+            "HISTORY_INDEX_PATH": os.path.join(tmp, "history_index.sqlite3"),
+            "WRITE_BEHIND_ENABLED": "false",
+            "ANSWER_CACHE_ENABLED": "false",
+        })
+        ctx = multiprocessing.get_context("spawn")
+        try:
+            throughput = [run_throughput(ctx, n, users, turns, f"load{n}") for n in worker_counts]
+            base = throughput[0]["requests_per_second"] or 1.0
+            for row in throughput:
+                row["speedup"] = round(row["requests_per_second"] / base, 2)
+            consistency = run_consistency(ctx, max(worker_counts), min(users, 10), turns)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        print(json.dumps({"users": users, "turns_per_user": turns, "llm_latency_s": LATENCY,
+                          "throughput": throughput, "consistency": consistency}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
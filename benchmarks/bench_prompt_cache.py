@@ -0,0 +1,118 @@
+"""提示前缀缓存：旧布局（时间精确到秒、位于工具说明之前）vs 固定前缀 + 易变内容在后的新布局
+
+按旧、新两种布局渲染一串不同用户、不同时间、不同问题的 ReAct 提示，输出：
+- 可缓存比例：每个提示与之前任一提示的最长公共前缀（按 CACHE_BLOCK 字符取整，模拟服务端按块缓存前缀）
+  占提示总长度的比例，字符数近似 token 数
+- 每次渲染提示的耗时（微秒），新布局的工具说明按工具集只渲染一次
+
+运行: python -m benchmarks.bench_prompt_cache [请求数]
+"""
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import render_text_description
+
+from benchmarks.fakes import stub_tools
+from service.prompt import ChatPrompt
+
+CACHE_BLOCK = 64
+USERS = 20
+
+# 修改前的提示模板
+LEGACY_TEMPLATE = """
+            你是一个智能助手。
+
+            当前北京时间：{current_time}
+
+            对话历史（如没有就不使用）：
+            {chat_history}
+
+            工具列表: {tools}
+
+            用户id: {user_id}
+            店铺id: {store_id}
+
+            请严格按以下格式回答：
+            Question: 需要回答的问题
+            Thought: 你的思考过程（保持用户原始关键词格式）
+            Action: 需要使用的工具名称（必须是[{tool_names}]中的一个）
+            Action Input: 工具需要的输入（保持用户原始关键词格式）
+            Observation: 工具返回的结果
+
+            Thought: 我现在知道最终答案
+            Final Answer: 最终回答内容
+
+            用户问题：{input}
+            {agent_scratchpad}
+            """
+
+
+def requests(count: int) -> List[Dict[str, Any]]:
+    base = datetime(2024, 1, 1, 9, 0, 0)
+    return [{"user_id": f"user-{i % USERS}", "store_id": f"store-{i % 5}",
+             "time": base + timedelta(seconds=7 * i),
+             "chat_history": f"用户: 订单 {i % USERS} 发货了吗\n回复: 已发货" if i % 3 else "",
+             "input": f"订单 {i} 什么时候到？", "agent_scratchpad": ""} for i in range(count)]
+
+
+def text(messages: List[Any]) -> str:
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+def run(render: Callable[[Dict[str, Any]], str], items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    prompts: List[str] = []
+    start = time.perf_counter()
+    for item in items:
+        prompts.append(render(item))
+    elapsed = time.perf_counter() - start
+
+    total = cached = 0
+    seen: List[str] = []
+    for prompt in prompts:
+        best = 0
+        for previous in seen[-USERS * 2:]:
+            length = 0
+            for a, b in zip(prompt, previous):
+                if a != b:
+                    break
+                length += 1
+            best = max(best, length)
+        cached += best // CACHE_BLOCK * CACHE_BLOCK
+        total += len(prompt)
+        seen.append(prompt)
+    return {"avg_prompt_chars": round(total / len(prompts), 1),
+            "cacheable_ratio": round(cached / total, 3),
+            "uncached_chars_per_request": round((total - cached) / len(prompts), 1),
+            "render_us": round(elapsed * 1e6 / len(prompts), 1)}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    tools = stub_tools()
+    items = requests(count)
+
+    # 旧实现中工具说明由 create_react_agent 以部分变量传入，每次请求格式化整段模板
+    legacy_prompt = ChatPromptTemplate.from_template(LEGACY_TEMPLATE).partial(
+        tools=render_text_description(tools), tool_names=", ".join(tool.name for tool in tools))
+
+    def legacy(item: Dict[str, Any]) -> str:
+        values = {key: item[key] for key in ("user_id", "store_id", "chat_history", "input", "agent_scratchpad")}
+        return text(legacy_prompt.format_messages(current_time=item["time"].strftime("%Y-%m-%d %H:%M:%S"),
+                                                  **values))
+
+    def layered(item: Dict[str, Any]) -> str:
+        prompt = ChatPrompt().agent(tools)
+        values = {key: item[key] for key in ("user_id", "store_id", "chat_history", "input", "agent_scratchpad")}
+        return text(prompt.format_messages(current_time=item["time"].strftime("%Y-%m-%d %H:%M"), **values))
+
+    print(json.dumps({"requests": count, "cache_block_chars": CACHE_BLOCK,
+                      "legacy": run(legacy, items), "layered": run(layered, items)},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
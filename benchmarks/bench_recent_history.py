@@ -0,0 +1,85 @@
+"""长历史用户读取最近 N 轮对话的耗时与正确性
+
+运行: python -m benchmarks.bench_recent_history [轮数]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from langchain.schema import Document
+from langchain_chroma import Chroma as LangChainChroma
+
+from benchmarks.fakes import CountingEmbeddings
+from service.chatHistoryStrore import ChatHistoryStore
+from service.historyIndex import HistoryIndex
+
+LIMIT = 6
+BATCH = 1000
+WHERE = {"$and": [{"user_id": {"$eq": "bench"}}, {"type": {"$eq": "conversation"}}]}
+
+
+def populate(db: LangChainChroma, turns: int) -> None:
+    """按乱序时间写入对话，模拟长期积累的数据"""
+    base = datetime(2024, 1, 1)
+    order = list(range(turns))
+    # 固定步长打乱写入顺序，使物理顺序与时间顺序不一致
+    order = [order[(i * 7919) % turns] for i in range(turns)]
+    for start in range(0, turns, BATCH):
+        docs, ids = [], []
+        for i in order[start:start + BATCH]:
+            timestamp = (base + timedelta(minutes=i)).isoformat()
+            docs.append(Document(
+                page_content=json.dumps({"user": f"问题 {i}", "bot": f"回答 {i}", "timestamp": timestamp},
+                                        ensure_ascii=False),
+                metadata={"timestamp": timestamp, "type": "conversation", "user_id": "bench"}
+            ))
+            ids.append(f"turn-{i}")
+        db.add_documents(docs, ids=ids)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    expected = [f"问题 {i}" for i in range(turns - 1, turns - 1 - LIMIT, -1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = CountingEmbeddings(dim=32)
+        db = LangChainChroma(persist_directory=tmp, embedding_function=embeddings)
+        populate(db, turns)
+
+        # 旧实现：不排序直接 limit，返回的是任意 N 条
+        legacy, legacy_ms = timed(lambda: db.get(where=WHERE, limit=LIMIT, include=["documents"]))
+        legacy_rows = sorted((json.loads(d) for d in legacy["documents"]), key=lambda d: d["timestamp"],
+                             reverse=True)
+
+        # 旧实现想要正确就必须取出全部记录再排序
+        full, full_ms = timed(lambda: db.get(where=WHERE, include=["documents"]))
+        full_rows = sorted((json.loads(d) for d in full["documents"]), key=lambda d: d["timestamp"],
+                           reverse=True)[:LIMIT]
+
+        store = ChatHistoryStore(embedding_function=embeddings, db=db,
+                                 history_index=HistoryIndex(os.path.join(tmp, "history_index.sqlite3")))
+        _, backfill_ms = timed(lambda: store._ensure_indexed("bench"))
+        indexed, indexed_ms = timed(lambda: store.load_recent_history("bench", limit=LIMIT))
+
+        print(json.dumps({
+            "turns": turns,
+            "limit": LIMIT,
+            "legacy_limit": {"ms": round(legacy_ms, 2),
+                             "correct": [d["user"] for d in legacy_rows] == expected},
+            "legacy_full_scan": {"ms": round(full_ms, 2),
+                                 "correct": [d["user"] for d in full_rows] == expected},
+            "indexed": {"ms": round(indexed_ms, 2), "one_time_backfill_ms": round(backfill_ms, 2),
+                        "correct": [h.user for h in indexed] == expected},
+        }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
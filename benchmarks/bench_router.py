@@ -0,0 +1,119 @@
+"""问题路由：全部问题走 ReAct agent vs 路由后简单问题直接回答、其余问题预选工具
+
+使用假聊天模型（每次调用固定耗时，订单问题先调用一次工具）与假嵌入模型，回放问候与订单查询混合的问题，
+输出各路由的平均耗时、每个问题的大模型调用次数、提示中的平均工具数，以及误路由比例：
+业务问题被直接回答（business_to_direct）、问候被交给 agent（chitchat_to_agent）。
+假嵌入模型只有完全相同的文本才相似，因此问候取自直接回答示例，订单问题取自工具的示例问题；
+另有一组简短的业务问题被加入直接回答示例，模拟嵌入模型把它们误判为寒暄，检验关键词与数字规则能否拦下。
+
+运行: python -m benchmarks.bench_router [问题数]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.offline import patch_services, prepare
+
+LATENCY = 0.05
+GREETINGS = ("你好", "在吗", "谢谢", "好的", "再见")
+ORDER_QUESTIONS = ("我的订单什么时候发货？", "帮我查一下订单物流", "订单还没到怎么办")
+# 像寒暄一样简短的业务问题
+SHORT_BUSINESS = ("好的，退款呢", "在吗 20240101", "快递到了吗")
+
+
+def questions(count: int) -> List[Tuple[str, str]]:
+    """(问题, 期望路由)：约四成为问候，两成为简短业务问题，其余为订单问题"""
+    items: List[Tuple[str, str]] = []
+    for i in range(count):
+        if i % 5 < 2:
+            items.append((GREETINGS[i % len(GREETINGS)], "direct"))
+        elif i % 5 == 2:
+            items.append((SHORT_BUSINESS[i % len(SHORT_BUSINESS)], "agent"))
+        else:
+            items.append((ORDER_QUESTIONS[i % len(ORDER_QUESTIONS)], "agent"))
+    return items
+
+
+def run(logic: Any, items: List[Tuple[str, str]], tool_counts: List[int], routes: List[str]) -> Dict[str, Any]:
+    from service.llm import LlmService
+
+    calls = LlmService.model.calls
+    tool_counts.clear()
+    wrong = {"direct": 0, "agent": 0}
+    expected_counts = {"direct": 0, "agent": 0}
+    start = time.perf_counter()
+    for i, (question, expected) in enumerate(items):
+        before = len(routes)
+        logic.generate_text_agent(question=question, user_id=f"user-{i % 20}", store_id="store-1",
+                                  use_history=False, persist=False)
+        # 关闭路由时不经过 _route，全部交给 agent
+        actual = routes[-1] if len(routes) > before else "agent"
+        expected_counts[expected] += 1
+        if actual != expected:
+            wrong[expected] += 1
+    elapsed = time.perf_counter() - start
+    rate = lambda expected: round(wrong[expected] / expected_counts[expected], 3) if expected_counts[expected] else 0.0
+    return {"seconds": round(elapsed, 3),
+            "avg_ms": round(elapsed * 1000 / len(items), 2),
+            "llm_calls_per_question": round((LlmService.model.calls - calls) / len(items), 2),
+            "avg_tools_in_prompt": round(sum(tool_counts) / len(tool_counts), 2) if tool_counts else 0.0,
+            "agent_runs": len(tool_counts),
+            "misroute": {"business_to_direct": rate("agent"), "chitchat_to_agent": rate("direct")}}
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare(tmp, ROUTER_TOP_TOOLS="1")
+        patch_services(latency=LATENCY, tool_steps=1)
+        import service.llm as llm_module
+        from service.llm import LlmService
+        from service.logic import Logic
+
+        tools = LlmService._default_tools()
+        for tool in tools:
+            if tool.name == "query_order":
+                tool.metadata = {"examples": list(ORDER_QUESTIONS)}
+
+        # 记录每次 agent 运行时提示中的工具数
+        tool_counts: List[int] = []
+        get = LlmService.agent_pool.get
+
+        def counting_get(model: Any, prompt: Any, agent_tools: List[Any]) -> Any:
+            tool_counts.append(len(agent_tools))
+            return get(model, prompt, agent_tools)
+
+        LlmService.agent_pool.get = counting_get
+
+        # 记录每个问题实际走的路由
+        routes: List[str] = []
+        route = LlmService._route
+
+        def recording_route(*args: Any, **kwargs: Any) -> Any:
+            decision = route(*args, **kwargs)
+            routes.append(decision.route)
+            return decision
+
+        LlmService._route = recording_route
+        LlmService.router.direct_examples.extend(SHORT_BUSINESS)
+
+        logic = Logic()
+        items = questions(count)
+        results: Dict[str, Any] = {}
+        # 先跑路由，各路由的统计不混入之后全部走 agent 的一轮
+        llm_module.ROUTER_ENABLED = True
+        results["routed"] = {**run(logic, items, tool_counts, routes), "routes": LlmService.router.stats()["routes"]}
+        llm_module.ROUTER_ENABLED = False
+        results["agent_only"] = run(logic, items, tool_counts, routes)
+        logic.stop_background_jobs()
+
+    print(json.dumps({"questions": count, "llm_latency_s": LATENCY, "tools": len(tools),
+                      "top_tools": int(os.environ["ROUTER_TOP_TOOLS"]), "results": results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""请求调度：优先级、同一用户串行与过载拒绝
+
+- priority: 后台总结线程持续占用大模型名额时，在线对话的排队耗时（有/无优先级）
+- per_user: 同一用户并发提问时是否按到达顺序逐个执行
+- backpressure: 突发请求超过排队上限时的拒绝数与 Retry-After
+
+大模型调用以固定耗时的 sleep 模拟。
+
+运行: python -m benchmarks.bench_scheduler
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.offline import latency_stats
+from service.requestScheduler import BACKGROUND, INTERACTIVE, LlmLimiter, Overloaded, UserQueue
+
+PERMITS = 4
+LLM_SECONDS = 0.1
+BACKGROUND_THREADS = 8
+CHAT_REQUESTS = 40
+CHAT_INTERVAL = 0.02
+
+
+async def priority_run(background_priority: int) -> Dict[str, Any]:
+    limiter = LlmLimiter(permits=PERMITS, rate=0, max_waiting=1000)
+    stop = threading.Event()
+
+    def summarize() -> None:
+        while not stop.is_set():
+            with limiter.hold(background_priority):
+                time.sleep(LLM_SECONDS)
+
+    threads = [threading.Thread(target=summarize, daemon=True) for _ in range(BACKGROUND_THREADS)]
+    for thread in threads:
+        thread.start()
+    await asyncio.sleep(LLM_SECONDS)
+
+    async def chat() -> float:
+        begin = time.perf_counter()
+        async with limiter.ahold(INTERACTIVE):
+            waited = time.perf_counter() - begin
+            await asyncio.sleep(LLM_SECONDS)
+        return waited
+
+    start = time.perf_counter()
+    tasks = []
+    for _ in range(CHAT_REQUESTS):
+        tasks.append(asyncio.create_task(chat()))
+        await asyncio.sleep(CHAT_INTERVAL)
+    waits = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    stats = latency_stats(waits, elapsed)
+    return {"chat_wait_p50_ms": stats["p50_ms"], "chat_wait_p99_ms": stats["p99_ms"]}
+
+
+async def per_user() -> Dict[str, Any]:
+    queue = UserQueue(max_pending=100)
+    order: List[int] = []
+    running = 0
+    max_running = 0
+
+    async def ask(i: int) -> None:
+        nonlocal running, max_running
+        async with queue.ahold("same-user"):
+            running += 1
+            max_running = max(max_running, running)
+            order.append(i)
+            await asyncio.sleep(0.005)
+            running -= 1
+
+    await asyncio.gather(*[ask(i) for i in range(20)])
+    return {"requests": 20, "in_arrival_order": order == sorted(order), "max_concurrent": max_running}
+
+
+async def backpressure() -> Dict[str, Any]:
+    limiter = LlmLimiter(permits=2, rate=0, max_waiting=10)
+    rejected: List[float] = []
+
+    async def chat() -> None:
+        try:
+            async with limiter.ahold(INTERACTIVE):
+                await asyncio.sleep(LLM_SECONDS)
+        except Overloaded as e:
+            rejected.append(e.retry_after)
+
+    await asyncio.gather(*[chat() for _ in range(50)])
+    return {"burst": 50, "permits": 2, "max_waiting": 10, "rejected": len(rejected),
+            "retry_after_s": max(rejected) if rejected else 0.0}
+
+
+async def main() -> None:
+    print(json.dumps({
+        "permits": PERMITS,
+        "background_threads": BACKGROUND_THREADS,
+        "priority": {
+            "without_priority": await priority_run(INTERACTIVE),
+            "with_priority": await priority_run(BACKGROUND),
+        },
+        "per_user": await per_user(),
+        "backpressure": await backpressure(),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
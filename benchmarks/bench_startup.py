@@ -0,0 +1,48 @@
+"""启动耗时与内存：导入 api 模块的耗时、预热到就绪的耗时，以及各阶段的常驻内存峰值
+
+每个阶段在独立子进程中测量，避免模块缓存影响结果。service.tools 不在仓库中时以桩模块代替。
+
+运行: python -m benchmarks.bench_startup
+"""
+import json
+import subprocess
+import sys
+
+PROBE = r"""
+import json, os, resource, sys, time, types
+if not os.path.exists(os.path.join("service", "tools.py")):
+    # 与 benchmarks.offline.install_stub_tools 相同，但桩工具在预热时才导入，LangChain 不提前加载，不影响导入耗时
+    stub = types.ModuleType("service.tools")
+
+    class Tools:
+        def get(self):
+            from benchmarks.fakes import stub_tools
+            return stub_tools()
+
+    stub.Tools = Tools
+    sys.modules["service.tools"] = stub
+start = time.perf_counter()
+import api
+imported = time.perf_counter() - start
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+result = {"import_s": imported, "import_peak_rss_mb": rss_import / 1024}
+if sys.argv[1] == "warmup":
+    start = time.perf_counter()
+    api.logic.warmup()
+    result["warmup_s"] = time.perf_counter() - start
+    result["ready_peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(result))
+"""
+
+
+def probe(mode: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE, mode], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    print(json.dumps({"import_only": probe("import"), "import_and_warmup": probe("warmup")}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
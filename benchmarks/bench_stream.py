@@ -0,0 +1,120 @@
+"""流式接口首字节耗时：/chat 需要等待完整回答，/chat/stream 在 Final Answer 的首个 token 到达时即可推送
+
+同时检查：工具步骤先于回答 token、done 最后推送且携带完整回答；收到 done 即断开时本轮对话已保存；
+命中回答缓存时不再调用模型，完整回答作为一个 token 事件推送。
+
+运行: python -m benchmarks.bench_stream
+"""
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fakes import CountingEmbeddings, FakeChromaDB, FakeReActChatModel, stub_tools
+from benchmarks.offline import install_stub_tools
+
+# service.llm 依赖的 service.tools 不在仓库中，导入前先装上桩工具模块
+install_stub_tools()
+
+from service.answerCache import ANSWER_CACHE_ENABLED  # noqa: E402
+from service.chatHistoryStrore import ChatHistoryStore  # noqa: E402
+from service.embedding import EmbeddingService  # noqa: E402
+from service.historyIndex import HistoryIndex  # noqa: E402
+from service.llm import LlmService  # noqa: E402
+from service.logic import Logic  # noqa: E402
+from service.tracing import start_trace  # noqa: E402
+
+ROUNDS = 10
+ANSWER = "您的订单已发货，预计两到三天送达，请注意查收。"
+
+
+def history_store() -> ChatHistoryStore:
+    embeddings = CountingEmbeddings(dim=32)
+    return ChatHistoryStore(embedding_function=embeddings, db=FakeChromaDB(embeddings),
+                            history_index=HistoryIndex(":memory:"))
+
+
+async def check_order_and_persistence() -> None:
+    """工具步骤先于回答 token，done 只推送一次且在最后；客户端收到 done 后立即断开，本轮对话仍已保存"""
+    store = history_store()
+    LlmService.model = FakeReActChatModel(latency=0, token_latency=0, answer=ANSWER, tool_steps=1)
+    question = "订单什么时候到呢"
+    events: List[Dict[str, Any]] = []
+    stream = LlmService.astream_text_agent(question=question, user_id="stream-user", include_steps=True,
+                                           chatHistoryStoreService=store)
+    async for event in stream:
+        events.append(event)
+        if event["event"] == "done":
+            break
+    await stream.aclose()
+
+    kinds = [event["event"] for event in events]
+    assert kinds[-1] == "done" and kinds.count("done") == 1, kinds
+    assert "step" in kinds and "token" in kinds, kinds
+    last_step = max(i for i, kind in enumerate(kinds) if kind == "step")
+    assert last_step < kinds.index("token"), kinds
+    tokens = "".join(event["data"] for event in events if event["event"] == "token")
+    assert tokens == events[-1]["data"]["output"] == ANSWER, tokens
+
+    store.writer.shutdown()
+    saved = store.load_recent_history("stream-user", limit=5)
+    assert [record.user for record in saved] == [question], saved
+
+
+async def check_cache_hit() -> None:
+    """同一问题第二次请求命中回答缓存：不调用模型，完整回答作为一个 token 事件推送"""
+    model = FakeReActChatModel(latency=0, token_latency=0, answer="7天无理由退货，48小时内发货。")
+    LlmService.model = model
+    store = history_store()
+    question = "退货需要满足什么条件？"
+
+    async def run() -> List[Dict[str, Any]]:
+        with start_trace("bench"):
+            return [event async for event in LlmService.astream_text_agent(
+                question=question, store_id="stream-store", use_history=False, chatHistoryStoreService=store)]
+
+    first = await run()
+    calls = model.calls
+    second = await run()
+    assert model.calls == calls, (model.calls, calls)
+    assert [event["event"] for event in second] == ["token", "done"], second
+    assert second[0]["data"] == second[1]["data"]["output"] == first[-1]["data"]["output"], second
+
+
+async def main() -> None:
+    EmbeddingService._model = CountingEmbeddings()
+    LlmService.model = FakeReActChatModel(latency=0.3, token_latency=0.03, answer=ANSWER)
+    LlmService.tools = stub_tools()
+    logic = Logic()
+
+    blocking, first_token, streamed_total = [], [], []
+    for i in range(ROUNDS):
+        start = time.perf_counter()
+        await logic.agenerate_text_agent(question=f"订单什么时候到 {i}", use_history=False)
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        tokens = []
+        async for event in logic.astream_text_agent(question=f"订单什么时候到 {i}", use_history=False):
+            if event["event"] == "token":
+                if not tokens:
+                    first_token.append(time.perf_counter() - start)
+                tokens.append(event["data"])
+        streamed_total.append(time.perf_counter() - start)
+
+    await check_order_and_persistence()
+    if ANSWER_CACHE_ENABLED:
+        await check_cache_hit()
+
+    avg = lambda values: round(sum(values) / len(values) * 1000, 1)
+    print(json.dumps({
+        "rounds": ROUNDS,
+        "chat_time_to_response_ms": avg(blocking),
+        "stream_time_to_first_token_ms": avg(first_token),
+        "stream_total_ms": avg(streamed_total),
+        "checks": "ok",
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""后台批量总结吞吐：不同并发度下每秒处理的用户数
+
+同时检查：只总结达到阈值的用户；摘要写入后只删除参与总结的记录（总结期间新增的对话保留）；
+同时进行的总结请求不超过并发度。
+
+运行: python -m benchmarks.bench_summarize_all
+"""
+import json
+import re
+from typing import Optional, Set
+
+from benchmarks.fakes import CountingEmbeddings, FakeChromaDB, FakeSummaryLLM
+from service.chatHistoryStrore import ChatHistoryStore
+from service.historyIndex import HistoryIndex
+from service.summaryScheduler import SummaryScheduler
+
+USERS = 40
+# 对话条数低于阈值、不应被总结的用户数
+LIGHT_USERS = 10
+TURNS = 25
+LATENCY = 0.1
+
+
+class WritingSummaryLLM(FakeSummaryLLM):
+    """总结期间为被总结的用户写入一条新对话，检查删除时不会误删"""
+
+    def __init__(self, store: ChatHistoryStore, latency: float) -> None:
+        super().__init__(latency=latency)
+        self.store = store
+        self._written: Set[str] = set()
+
+    def generate_text(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        match = re.search(r"用户(\d+)的第", prompt)
+        user_id = f"user-{match.group(1)}" if match else None
+        with self._lock:
+            first = user_id is not None and user_id not in self._written
+            if first:
+                self._written.add(user_id)
+        if first:
+            self.store.save_conversation(user_id, f"{user_id}总结期间的新问题", "新回答")
+        return super().generate_text(prompt, system_prompt)
+
+
+def build_store() -> ChatHistoryStore:
+    embeddings = CountingEmbeddings(dim=32)
+    store = ChatHistoryStore(embedding_function=embeddings, db=FakeChromaDB(embeddings),
+                             history_index=HistoryIndex(":memory:"))
+    for u in range(USERS + LIGHT_USERS):
+        turns = TURNS if u < USERS else TURNS - 1
+        for t in range(turns):
+            store.save_conversation(f"user-{u}", f"用户{u}的第{t}个问题", f"回答{t}")
+    return store
+
+
+def check(store: ChatHistoryStore, llm: WritingSummaryLLM, stats: dict, concurrency: int) -> None:
+    assert stats["job"]["total"] == USERS, stats["job"]
+    assert stats["job"]["succeeded"] == USERS, stats["job"]
+    for u in range(USERS):
+        user_id = f"user-{u}"
+        # 摘要已写入，原有对话全部删除，只剩总结期间新增的一条
+        assert store.load_summary(user_id) is not None, user_id
+        assert store.history_index.count(user_id) == 1, user_id
+        remaining = store.load_recent_history(user_id, limit=TURNS)
+        assert [record.user for record in remaining] == [f"{user_id}总结期间的新问题"], user_id
+    for u in range(USERS, USERS + LIGHT_USERS):
+        user_id = f"user-{u}"
+        assert store.load_summary(user_id) is None, user_id
+        assert store.history_index.count(user_id) == TURNS - 1, user_id
+    assert llm.max_in_flight <= concurrency, (llm.max_in_flight, concurrency)
+    if concurrency > 1:
+        assert llm.max_in_flight > 1, "总结没有并发执行"
+
+
+def main() -> None:
+    results = {}
+    for concurrency in (1, 2, 4, 8):
+        store = build_store()
+        llm = WritingSummaryLLM(store, latency=LATENCY)
+        scheduler = SummaryScheduler(store, llm, threshold=TURNS, concurrency=concurrency)
+        stats = scheduler.run_once()
+        check(store, llm, stats, concurrency)
+        remaining = store.find_users_to_summarize(2)
+        results[concurrency] = {
+            "users": stats["job"]["total"],
+            "succeeded": stats["job"]["succeeded"],
+            "elapsed_s": round(stats["job"]["elapsed"], 3),
+            "users_per_second": round(stats["job"]["users_per_second"], 2),
+            "llm_calls": llm.calls,
+            "max_in_flight": llm.max_in_flight,
+            "users_left_over_threshold": len(remaining),
+        }
+    print(json.dumps({"users": USERS, "light_users": LIGHT_USERS, "turns": TURNS, "llm_latency_s": LATENCY,
+                      "by_concurrency": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
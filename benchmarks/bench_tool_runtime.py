@@ -0,0 +1,167 @@
+"""业务接口工具：每次调用新建连接直接请求 vs 工具运行时（连接池、缓存、合并、熔断）
+
+在本地启动一个模拟业务接口（每次请求固定延迟），多个线程模拟并发的 agent 工具调用，
+查询集中在少量店铺的热门订单上。输出上游请求次数与工具调用延迟，并检查：
+每个（店铺, 订单）只请求上游一次且结果按店铺区分；接口持续故障时达到阈值即熔断，冷却后试探成功即恢复。
+
+运行: python -m benchmarks.bench_tool_runtime
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from benchmarks.offline import latency_stats
+from service.toolRuntime import ToolRuntime, request_scope
+
+CALLS = 400
+THREADS = 16
+STORES = 10
+ORDERS = 5
+UPSTREAM_LATENCY = 0.03
+RETRIES = 2
+BREAKER_FAILURES = 3
+FAILING_CALLS = 20
+
+
+class MockBusinessApi:
+    """模拟业务接口：统计请求次数，可切换为全部返回 503"""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.requests = 0
+        self.failing = False
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                with api._lock:
+                    api.requests += 1
+                time.sleep(api.latency)
+                query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                status = 503 if api.failing else 200
+                body = json.dumps({"order": query.get("keyword"), "store_id": query.get("store_id"),
+                                   "status": "已发货"}, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self) -> None:
+        self.requests = 0
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+def workload() -> List[Tuple[str, str]]:
+    return [(f"store-{i % STORES}", f"订单{(i // STORES) % ORDERS}") for i in range(CALLS)]
+
+
+def run(call: Callable[[str, str], str]) -> Dict[str, Any]:
+    samples: List[float] = []
+
+    def one(item: Tuple[str, str]) -> None:
+        begin = time.perf_counter()
+        call(*item)
+        samples.append(time.perf_counter() - begin)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(one, workload()))
+    return latency_stats(samples, time.perf_counter() - start)
+
+
+def main() -> None:
+    api = MockBusinessApi(UPSTREAM_LATENCY)
+
+    # 基线：每次工具调用新建连接、不缓存
+    def naive(store_id: str, keyword: str) -> str:
+        response = httpx.get(f"{api.url}/api/order", params={"keyword": keyword, "store_id": store_id}, timeout=5)
+        return response.text
+
+    naive_stats = run(naive)
+    naive_upstream = api.requests
+
+    api.reset()
+    runtime = ToolRuntime(base_url=api.url, cache_ttl=30, retries=RETRIES, breaker_failures=BREAKER_FAILURES,
+                          breaker_reset=0.5, backoff=0.01)
+    tool = runtime.tool("query_order", "按订单号查询订单状态", "/api/order")
+
+    def pooled(store_id: str, keyword: str) -> str:
+        with request_scope(None, store_id):
+            return tool.invoke(keyword)
+
+    pooled_stats = run(pooled)
+    pooled_upstream = api.requests
+    runtime_stats = runtime.stats()
+    assert naive_upstream == CALLS, naive_upstream
+    # 缓存与合并后每个（店铺, 订单）最多请求一次上游
+    assert pooled_upstream <= STORES * ORDERS, pooled_upstream
+    assert runtime_stats["cache_hits"] + runtime_stats["coalesced"] >= CALLS - STORES * ORDERS, runtime_stats
+    # 缓存按店铺隔离，不会把其他店铺的结果返回给当前店铺
+    assert json.loads(pooled("store-3", "订单1"))["store_id"] == "store-3"
+
+    # 熔断：接口持续返回 503，达到阈值后工具直接返回降级提示，不再请求上游
+    runtime.invalidate()
+    api.failing = True
+    api.reset()
+    uncached = runtime.tool("query_order_live", "实时查询订单状态", "/api/order", ttl=0)
+    outputs = [uncached.invoke(json.dumps({"keyword": f"订单{i}", "store_id": "store-0"}, ensure_ascii=False))
+               for i in range(FAILING_CALLS)]
+    stats = runtime.stats()
+    # 前 BREAKER_FAILURES 次调用各自重试后失败，之后的调用直接拒绝，不再请求上游
+    assert api.requests == BREAKER_FAILURES * (RETRIES + 1), api.requests
+    assert stats["rejected"] == FAILING_CALLS - BREAKER_FAILURES, stats
+    assert set(stats["breakers"].values()) == {"open"}, stats["breakers"]
+    breaker = {
+        "calls": len(outputs),
+        "upstream_requests": api.requests,
+        "rejected": runtime.stats()["rejected"],
+        "state": runtime.stats()["breakers"],
+    }
+
+    # 冷却后接口恢复，半开试探成功即闭合
+    api.failing = False
+    time.sleep(0.6)
+    uncached.invoke(json.dumps({"keyword": "订单0", "store_id": "store-0"}, ensure_ascii=False))
+    breaker["state_after_recovery"] = runtime.stats()["breakers"]
+    assert set(breaker["state_after_recovery"].values()) == {"closed"}, breaker
+    runtime.close()
+    api.close()
+
+    print(json.dumps({
+        "calls": CALLS,
+        "threads": THREADS,
+        "distinct_lookups": STORES * ORDERS,
+        "upstream_latency_ms": UPSTREAM_LATENCY * 1000,
+        "naive": {"upstream_requests": naive_upstream, **naive_stats},
+        "runtime": {"upstream_requests": pooled_upstream, **pooled_stats,
+                    "cache_hits": runtime_stats["cache_hits"], "coalesced": runtime_stats["coalesced"]},
+        "breaker": breaker,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
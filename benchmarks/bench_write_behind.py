@@ -0,0 +1,63 @@
+"""对话写入吞吐：逐条同步写入 vs 写入队列批量写入
+
+嵌入模型按“每次调用固定开销 + 每条文本边际开销”模拟 CPU 上的 MiniLM 前向计算。
+
+运行: python -m benchmarks.bench_write_behind
+"""
+import json
+import time
+
+from benchmarks.fakes import CountingEmbeddings, FakeChromaDB
+from service.chatHistoryStrore import ChatHistoryStore
+from service.historyIndex import HistoryIndex
+from service.writeBehind import ConversationWriter
+
+TURNS = 500
+USERS = 50
+CALL_LATENCY = 0.01
+TEXT_LATENCY = 0.001
+
+
+def build_store() -> ChatHistoryStore:
+    embeddings = CountingEmbeddings(dim=64, call_latency=CALL_LATENCY, text_latency=TEXT_LATENCY)
+    return ChatHistoryStore(embedding_function=embeddings, db=FakeChromaDB(embeddings),
+                            history_index=HistoryIndex(":memory:"))
+
+
+def turns():
+    return [(f"user-{i % USERS}", f"第{i}个问题", f"第{i}个回答") for i in range(TURNS)]
+
+
+def main() -> None:
+    store = build_store()
+    start = time.perf_counter()
+    for user_id, question, answer in turns():
+        store.save_conversation(user_id, question, answer)
+    per_turn = time.perf_counter() - start
+    per_turn_calls = store.embedding_function.calls
+
+    store = build_store()
+    writer = ConversationWriter(store._flush_conversations)
+    start = time.perf_counter()
+    enqueue_latencies = []
+    for item in turns():
+        t0 = time.perf_counter()
+        writer.submit(item)
+        enqueue_latencies.append(time.perf_counter() - t0)
+    writer.shutdown()
+    batched = time.perf_counter() - start
+
+    print(json.dumps({
+        "turns": TURNS,
+        "per_turn": {"writes_per_second": round(TURNS / per_turn, 1), "embed_calls": per_turn_calls},
+        "write_behind": {
+            "writes_per_second": round(TURNS / batched, 1),
+            "embed_calls": store.embedding_function.calls,
+            "max_enqueue_ms": round(max(enqueue_latencies) * 1000, 3),
+            "writer": writer.stats(),
+        },
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
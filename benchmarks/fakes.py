@@ -0,0 +1,292 @@
+"""基准测试用的离线替身：确定性嵌入模型与内存版 Chroma"""
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import StructuredTool
+
+
+class CountingEmbeddings:
+    """基于文本哈希生成确定性向量的嵌入模型，并统计调用次数"""
+
+    def __init__(self, dim: int = 384, call_latency: float = 0.0, text_latency: float = 0.0) -> None:
+        self.dim = dim
+        # 模拟一次前向计算的固定开销与每条文本的边际开销
+        self.call_latency = call_latency
+        self.text_latency = text_latency
+        self.calls = 0
+        self.texts = 0
+
+    def _simulate(self, count: int) -> None:
+        delay = self.call_latency + self.text_latency * count
+        if delay:
+            time.sleep(delay)
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        self._simulate(1)
+        self.calls += 1
+        self.texts += 1
+        return self._vector(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._simulate(len(texts))
+        self.calls += 1
+        self.texts += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.texts = 0
+
+
+def _match(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """实现基准测试用到的 Chroma where 子集：$and/$or/$eq/$ne/$gt/$gte/$lt/$lte/$in"""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match(metadata, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(_match(metadata, c) for c in cond):
+                return False
+        else:
+            value = metadata.get(key)
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+            for op, target in cond.items():
+                if op == "$eq" and value != target:
+                    return False
+                if op == "$ne" and value == target:
+                    return False
+                if op == "$in" and value not in target:
+                    return False
+                if value is None and op in ("$gt", "$gte", "$lt", "$lte"):
+                    return False
+                if op == "$gt" and not value > target:
+                    return False
+                if op == "$gte" and not value >= target:
+                    return False
+                if op == "$lt" and not value < target:
+                    return False
+                if op == "$lte" and not value <= target:
+                    return False
+    return True
+
+
+class FakeChromaDB:
+    """内存版 LangChain Chroma，只实现项目中用到的接口"""
+
+    def __init__(self, embedding_function: CountingEmbeddings, name: str = "fake") -> None:
+        self.embedding_function = embedding_function
+        self.name = name
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count()
+        # 与 LangChain Chroma 一致，通过 _collection 直接写入已计算好的向量
+        self._collection = self
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]) -> None:
+        for doc_id, vector, document, metadata in zip(ids, embeddings, documents, metadatas):
+            self.rows[doc_id] = {"document": document, "metadata": dict(metadata), "embedding": vector}
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        vectors = self.embedding_function.embed_documents([d.page_content for d in documents])
+        ids = ids or [f"doc-{next(self._ids)}" for _ in documents]
+        self.upsert(ids, vectors, [d.page_content for d in documents], [d.metadata for d in documents])
+        return ids
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            limit: Optional[int] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        selected = [
+            (doc_id, row) for doc_id, row in self.rows.items()
+            if (ids is None or doc_id in ids) and _match(row["metadata"], where)
+        ]
+        if limit is not None:
+            selected = selected[:limit]
+        return {
+            "ids": [doc_id for doc_id, _ in selected],
+            "documents": [row["document"] for _, row in selected],
+            "metadatas": [row["metadata"] for _, row in selected],
+            "embeddings": [row["embedding"] for _, row in selected],
+        }
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None) -> None:
+        for doc_id in list(self.rows):
+            if (ids is None or doc_id in ids) and _match(self.rows[doc_id]["metadata"], where):
+                del self.rows[doc_id]
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """chromadb 集合的 query，距离为余弦距离"""
+        selected = [(doc_id, row) for doc_id, row in self.rows.items() if _match(row["metadata"], where)]
+        result: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            top: List[Any] = []
+            if selected:
+                matrix = np.asarray([row["embedding"] for _, row in selected], dtype=np.float32)
+                query = np.asarray(embedding, dtype=np.float32)
+                scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+                top = [(selected[i], 1.0 - float(scores[i])) for i in np.argsort(-scores)[:n_results]]
+            result["ids"].append([doc_id for (doc_id, _), _ in top])
+            result["documents"].append([row["document"] for (_, row), _ in top])
+            result["metadatas"].append([row["metadata"] for (_, row), _ in top])
+            result["distances"].append([distance for _, distance in top])
+        return result
+
+    def similarity_search(self, query: str, k: int = 4,
+                          filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict[str, Any]] = None) -> List[Document]:
+        query = np.asarray(embedding, dtype=np.float32)
+        scored = []
+        for row in self.rows.values():
+            if _match(row["metadata"], filter):
+                vector = np.asarray(row["embedding"], dtype=np.float32)
+                score = float(vector @ query / (np.linalg.norm(vector) * np.linalg.norm(query) or 1.0))
+                scored.append((score, row))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [Document(page_content=row["document"], metadata=row["metadata"]) for _, row in scored[:k]]
+
+
+# 桩工具返回结果中的标记，假模型据此判断已完成的工具调用次数
+STUB_MARKER = '"source": "stub"'
+
+
+class FakeReActChatModel(BaseChatModel):
+    """按 ReAct 格式直接给出最终答案的假聊天模型
+
+    latency 模拟通义千问返回首个 token 前的耗时，token_latency 模拟流式输出时每个 token 的间隔。
+    tool_steps 为给出最终答案前调用桩工具的次数，按提示中已有的工具返回结果数决定下一步。
+    """
+
+    latency: float = 0.2
+    token_latency: float = 0.02
+    answer: str = "您好，这是测试回答。"
+    tool_steps: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-react"
+
+    def _text(self, messages: Optional[List[BaseMessage]] = None) -> str:
+        text = "".join(str(m.content) for m in messages or [])
+        # 只有 ReAct 提示才会调用工具，总结等普通提示直接回答
+        if "Action Input" in text and text.count(STUB_MARKER) < self.tool_steps:
+            done = text.count(STUB_MARKER)
+            return f"Thought: 需要先查询订单状态\nAction: query_order\nAction Input: {done + 1}"
+        return f"Thought: 我现在知道最终答案\nFinal Answer: {self.answer}"
+
+    def _tokens(self, messages: Optional[List[BaseMessage]] = None) -> List[str]:
+        text = self._text(messages)
+        return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+    def _result(self, messages: Optional[List[BaseMessage]] = None) -> ChatResult:
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._text(messages)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        time.sleep(self.latency)
+        for token in self._tokens(messages):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency + self.token_latency * len(self._tokens(messages)))
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency + self.token_latency * len(self._tokens(messages)))
+        return self._result(messages)
+
+
+def _query_order(keyword: str) -> str:
+    """按订单号查询订单状态"""
+    return json.dumps({"order_no": keyword, "status": "已发货", "source": "stub"}, ensure_ascii=False)
+
+
+def _query_product(keyword: str) -> str:
+    """按商品名称或SKU查询商品信息"""
+    return json.dumps({"sku": keyword, "stock": 12, "price": "99.00", "source": "stub"}, ensure_ascii=False)
+
+
+def _query_policy(keyword: str) -> str:
+    """查询店铺的发货、退换货等售后政策"""
+    return json.dumps({"topic": keyword, "policy": "7天无理由退货，48小时内发货", "source": "stub"},
+                      ensure_ascii=False)
+
+
+def stub_tools() -> List[StructuredTool]:
+    """模拟业务后端接口的工具集"""
+    return [
+        StructuredTool.from_function(_query_order, name="query_order"),
+        StructuredTool.from_function(_query_product, name="query_product"),
+        # 店铺政策与用户无关，调用过它的回答仍可进入语义回答缓存
+        StructuredTool.from_function(_query_policy, name="query_policy", metadata={"answer_cacheable": True}),
+    ]
+
+
+class FakeSummaryLLM:
+    """只实现 generate_text 的假 LLM，用于总结相关的基准测试"""
+
+    def __init__(self, latency: float = 0.2) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.prompt_chars = 0
+        # 同时进行中的调用数及其峰值，用于检查并发上限
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_text(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.calls += 1
+                self.prompt_chars += len(prompt)
+        return f"用户共咨询了 {prompt.count('用户:')} 个问题（摘要 {self.calls}）"
+
+    async def agenerate_text(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        return f"用户共咨询了 {prompt.count('用户:')} 个问题（摘要 {self.calls}）"
@@ -0,0 +1,86 @@
+"""离线运行完整服务的环境准备：临时工作目录、假嵌入模型、假聊天模型与桩工具
+
+必须在导入 service 下的模块之前调用 prepare()，环境变量与相对路径（chroma/）在导入时读取。
+"""
+import os
+import resource
+import sys
+import types
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.fakes import CountingEmbeddings, FakeReActChatModel, stub_tools
+
+EMBED_DIM = 384
+
+# 基准测试默认关闭后台任务与语义缓存，避免干扰计时
+DEFAULT_ENV: Dict[str, str] = {
+    "SUMMARY_SCHEDULER_ENABLED": "false",
+    "WARMUP_ON_STARTUP": "false",
+    "ANSWER_CACHE_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def prepare(workdir: str, **env: str) -> None:
+    """切换到临时工作目录并设置环境变量，数据库与索引文件都写在该目录下"""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.update(DEFAULT_ENV)
+    os.environ.update(env)
+
+
+def install_stub_tools() -> None:
+    """service.tools 不在仓库中时，以桩工具模块代替"""
+    try:
+        import service.tools  # noqa: F401
+    except ModuleNotFoundError as e:
+        if e.name != "service.tools":
+            raise
+        module = types.ModuleType("service.tools")
+
+        class Tools:
+            def get(self) -> List[Any]:
+                return stub_tools()
+
+        module.Tools = Tools
+        sys.modules["service.tools"] = module
+
+
+def patch_services(latency: float = 0.05, token_latency: float = 0.0, tool_steps: int = 1) -> CountingEmbeddings:
+    """把共享的嵌入模型与聊天模型替换为离线替身
+
+    Returns:
+        CountingEmbeddings: 嵌入模型替身，可用于统计调用次数
+    """
+    install_stub_tools()
+    from service.embedding import EmbeddingService
+    from service.llm import LlmService
+
+    embeddings = CountingEmbeddings(dim=EMBED_DIM)
+    # 保留嵌入服务的缓存与合批逻辑，只替换底层模型
+    EmbeddingService._model = embeddings
+    LlmService.model = FakeReActChatModel(latency=latency, token_latency=token_latency, tool_steps=tool_steps)
+    return embeddings
+
+
+def peak_rss_mb() -> float:
+    """当前进程的常驻内存峰值（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return round(usage / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def latency_stats(samples: List[float], seconds: float) -> Dict[str, Any]:
+    """请求数、吞吐与 p50/p99（毫秒）"""
+    if not samples:
+        return {"requests": 0, "seconds": round(seconds, 3), "throughput_rps": 0.0, "p50_ms": 0.0, "p99_ms": 0.0}
+    values = np.asarray(samples) * 1000
+    return {
+        "requests": len(samples),
+        "seconds": round(seconds, 3),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+    }
@@ -0,0 +1,218 @@
+"""离线基准测试套件：不访问通义千问与业务接口，经 Logic 与 FastAPI 应用运行完整请求链路
+
+场景:
+    cold_start      导入 api、预热并完成第一个 /chat 请求（嵌入模型为替身，真实模型加载见 bench_startup）
+    long_history    单个用户已有大量历史对话时经 Logic.generate_text_agent 连续提问
+    fan_out         大量用户经 FastAPI /chat 并发提问
+    summarize_all   大量用户积压对话后执行一轮批量总结
+    dedup_heavy     大部分为重复问题的批量写入
+
+每个场景在独立子进程与临时目录中运行，输出吞吐、p50/p99 延迟与常驻内存峰值。
+
+运行: python -m benchmarks.suite [场景 ...] [--out result.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.offline import latency_stats, patch_services, peak_rss_mb, prepare
+
+
+def _seed_history(store: Any, user_id: str, turns: int, batch: int = 500) -> None:
+    for start in range(0, turns, batch):
+        store.save_conversations([(user_id, f"{user_id} 的历史问题 {i}：订单 {i} 的物流进度？",
+                                   f"订单 {i} 已发货，预计两天内送达。")
+                                  for i in range(start, min(start + batch, turns))])
+
+
+def cold_start(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    start = time.perf_counter()
+    patch_services(latency=args.latency)
+    import api
+    imported = time.perf_counter() - start
+
+    start = time.perf_counter()
+    api.logic.warmup()
+    warmed = time.perf_counter() - start
+
+    async def first_request() -> float:
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            begin = time.perf_counter()
+            response = await client.post("/chat", json={"question": "订单 1 发货了吗？", "user_id": "cold"})
+            response.raise_for_status()
+            return time.perf_counter() - begin
+
+    first = asyncio.run(first_request())
+    return {"import_s": round(imported, 3), "warmup_s": round(warmed, 3),
+            "first_request_ms": round(first * 1000, 2), **latency_stats([first], first)}
+
+
+def long_history(args: argparse.Namespace) -> Dict[str, Any]:
+    patch_services(latency=args.latency)
+    from service.chatHistoryStrore import ChatHistoryStoreService
+    from service.logic import Logic
+
+    logic = Logic()
+    seed_start = time.perf_counter()
+    _seed_history(ChatHistoryStoreService, "long", args.turns)
+    ChatHistoryStoreService.writer.flush()
+    seeded = time.perf_counter() - seed_start
+
+    samples: List[float] = []
+    start = time.perf_counter()
+    for i in range(args.requests):
+        begin = time.perf_counter()
+        logic.generate_text_agent(question=f"第 {i} 次追问：订单 {i} 到哪里了？", user_id="long",
+                                  store_id="bench")
+        samples.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    return {"history_turns": args.turns, "seed_s": round(seeded, 3), **latency_stats(samples, elapsed)}
+
+
+def fan_out(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    patch_services(latency=args.latency)
+    import api
+
+    async def run() -> List[float]:
+        limit = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            async def one(i: int) -> float:
+                async with limit:
+                    begin = time.perf_counter()
+                    response = await client.post("/chat", json={"question": f"订单 {i} 发货了吗？",
+                                                                 "user_id": f"user-{i % args.users}",
+                                                                 "store_id": f"store-{i % 10}"})
+                    response.raise_for_status()
+                    return time.perf_counter() - begin
+
+            return await asyncio.gather(*[one(i) for i in range(args.requests)])
+
+    start = time.perf_counter()
+    samples = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    api.logic.stop_background_jobs()
+    return {"users": args.users, "concurrency": args.concurrency, **latency_stats(samples, elapsed)}
+
+
+def summarize_all(args: argparse.Namespace) -> Dict[str, Any]:
+    patch_services(latency=args.latency)
+    from service.chatHistoryStrore import ChatHistoryStoreService
+    from service.logic import Logic, SummarySchedulerService
+
+    for u in range(args.users):
+        _seed_history(ChatHistoryStoreService, f"user-{u}", args.turns)
+    logic = Logic()
+    start = time.perf_counter()
+    stats = asyncio.run(logic.asummarize_all())
+    elapsed = time.perf_counter() - start
+    job = stats["job"]
+    return {"users": args.users, "turns_per_user": args.turns, "summarized": job["succeeded"],
+            "failed": job["failed"], "concurrency": SummarySchedulerService.concurrency,
+            "seconds": round(elapsed, 3),
+            "throughput_users_per_s": round(job["done"] / elapsed, 2) if elapsed else 0.0}
+
+
+def dedup_heavy(args: argparse.Namespace) -> Dict[str, Any]:
+    embeddings = patch_services(latency=args.latency)
+    from service.chatHistoryStrore import ChatHistoryStoreService
+
+    # 每个用户只有 10 个不同的问题，其余都是重复提问
+    items = [(f"user-{i % args.users}", f"订单 {(i // args.users) % 10} 什么时候发货？", "48小时内发货。")
+             for i in range(args.requests)]
+    samples: List[float] = []
+    saved = 0
+    start = time.perf_counter()
+    for offset in range(0, len(items), args.batch):
+        begin = time.perf_counter()
+        saved += sum(ChatHistoryStoreService.save_conversations(items[offset:offset + args.batch]))
+        samples.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    stats = latency_stats(samples, elapsed)
+    stats["throughput_rps"] = round(len(items) / elapsed, 2) if elapsed else 0.0
+    return {"writes": len(items), "saved": saved, "skipped": len(items) - saved, "batch": args.batch,
+            "embedded_texts": embeddings.texts, **stats}
+
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], Dict[str, Any]]] = {
+    "cold_start": cold_start,
+    "long_history": long_history,
+    "fan_out": fan_out,
+    "summarize_all": summarize_all,
+    "dedup_heavy": dedup_heavy,
+}
+
+# 各场景的默认规模
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "cold_start": {},
+    "long_history": {"turns": 5000, "requests": 50},
+    "fan_out": {"users": 200, "requests": 400, "concurrency": 32},
+    "summarize_all": {"users": 100, "turns": 25},
+    "dedup_heavy": {"users": 50, "requests": 5000, "batch": 32},
+}
+
+
+def run_child(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """在子进程中运行单个场景，保证冷启动与内存峰值互不影响"""
+    command = [sys.executable, "-m", "benchmarks.suite", name, "--child", "--latency", str(args.latency)]
+    for key, value in vars(args).items():
+        if key in ("turns", "requests", "users", "concurrency", "batch") and value is not None:
+            command += [f"--{key}", str(value)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(command, capture_output=True, text=True, cwd=root)
+    if output.returncode != 0:
+        return {"error": output.stderr.strip().splitlines()[-1:] or ["unknown"]}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="离线基准测试套件")
+    parser.add_argument("scenarios", nargs="*", help=f"要运行的场景，默认全部: {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.05, help="假模型每次调用的耗时（秒）")
+    parser.add_argument("--turns", type=int)
+    parser.add_argument("--requests", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--batch", type=int)
+    parser.add_argument("--out", help="结果写入的 JSON 文件")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    if args.child:
+        name = names[0]
+        for key, value in DEFAULTS[name].items():
+            if getattr(args, key) is None:
+                setattr(args, key, value)
+        with tempfile.TemporaryDirectory() as tmp:
+            prepare(tmp)
+            result = SCENARIOS[name](args)
+            result["peak_rss_mb"] = peak_rss_mb()
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    report = {"llm_latency_s": args.latency, "python": sys.version.split()[0],
+              "scenarios": {name: run_child(name, args) for name in names}}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from langchain.agents import AgentExecutor, create_react_agent
+from langchain_core.prompts import BasePromptTemplate
+
+AGENT_POOL_SIZE: int = int(os.getenv("AGENT_POOL_SIZE", "32"))
+# ReAct 最大迭代次数；verbose 会把每一步打印到标准输出，默认关闭
+AGENT_MAX_ITERATIONS: int = int(os.getenv("AGENT_MAX_ITERATIONS", "3"))
+AGENT_VERBOSE: bool = os.getenv("AGENT_VERBOSE", "false").lower() == "true"
+
+
+class AgentPool:
+    """预构建 AgentExecutor 的注册表
+
+    按 (模型, 提示模板, 工具集) 缓存执行器，请求间复用。AgentExecutor 本身不保存单次调用的状态，
+    因此同一个执行器可以被并发请求共享。
+    """
+
+    def __init__(self, max_size: int = AGENT_POOL_SIZE) -> None:
+        self.max_size = max_size
+        # key -> (模型, 提示模板, 工具列表, 执行器)；持有对象引用，保证 id 在缓存期间不会被复用
+        self._executors: "OrderedDict[Tuple[int, ...], Tuple[Any, Any, List[Any], AgentExecutor]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    @staticmethod
+    def _key(model: Any, prompt: BasePromptTemplate, tools: List[Any]) -> Tuple[int, ...]:
+        return (id(model), id(prompt), *(id(tool) for tool in tools))
+
+    def get(self, model: Any, prompt: BasePromptTemplate, tools: List[Any]) -> AgentExecutor:
+        """获取（必要时构建）执行器
+
+        Args:
+            model: 聊天模型
+            prompt: agent提示模板
+            tools: agent可用工具
+
+        Returns:
+            AgentExecutor: 可复用的agent执行器
+        """
+        key = self._key(model, prompt, tools)
+        with self._lock:
+            entry = self._executors.get(key)
+            if entry is not None:
+                self._executors.move_to_end(key)
+                return entry[3]
+
+            agent = create_react_agent(
+                llm=model,
+                tools=tools,
+                prompt=prompt
+            )
+            agent_executor = AgentExecutor(
+                agent=agent,
+                tools=tools,
+                max_iterations=AGENT_MAX_ITERATIONS,
+                verbose=AGENT_VERBOSE,
+                handle_parsing_errors=True
+            )
+            self._executors[key] = (model, prompt, list(tools), agent_executor)
+            self.builds += 1
+            while len(self._executors) > self.max_size:
+                self._executors.popitem(last=False)
+            return agent_executor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._executors.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._executors), "builds": self.builds}
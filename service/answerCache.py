@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .metrics import Metrics
+
+ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# 问题向量余弦相似度达到该值才视为同一问题
+ANSWER_CACHE_THRESHOLD: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+# 每个店铺最多缓存的回答条数
+ANSWER_CACHE_STORE_SIZE: int = int(os.getenv("ANSWER_CACHE_STORE_SIZE", "500"))
+# 最多缓存的店铺数
+ANSWER_CACHE_MAX_STORES: int = int(os.getenv("ANSWER_CACHE_MAX_STORES", "1000"))
+
+AnswerCacheCounter = Metrics.counter("answer_cache_total", "语义回答缓存命中/未命中次数")
+AnswerCacheSavedCounter = Metrics.counter("answer_cache_saved_seconds_total", "语义回答缓存节省的生成耗时")
+
+# 订单号、手机号、SKU 编码、金额等带数字的内容，回答因人因单而异
+_ID_TOKEN = re.compile(r"[0-9０-９]")
+# 指向用户自己的订单、账户，或指代上文的说法，回答因人或因对话上下文而异
+PERSONAL_MARKERS: Tuple[str, ...] = (
+    "我的", "我买", "我下的", "我这", "我家", "帮我查", "给我查", "我账号",
+    "这个", "那个", "这件", "那件", "这单", "那单", "刚才", "上面", "之前",
+)
+
+
+def cacheable_question(question: str) -> bool:
+    """问题不含数字（订单号、SKU 等标识）、不涉及用户自己的订单或账户、也不指代上文时才读写回答缓存
+
+    向量相似度对只差几位的订单号几乎不敏感，带标识的问题命中缓存会把别人订单的回答返回给当前用户；
+    满足条件的问题（发货时效、退换货规则等常见问题）回答与对话历史无关，使用历史记录时同样可以命中。
+    """
+    text = question or ""
+    return not _ID_TOKEN.search(text) and not any(marker in text for marker in PERSONAL_MARKERS)
+
+
+class _StoreEntries:
+    """单个店铺的缓存：问题向量矩阵与对应回答，按最近使用排序"""
+
+    __slots__ = ("questions", "answers", "vectors", "created_at", "costs")
+
+    def __init__(self) -> None:
+        self.questions: List[str] = []
+        self.answers: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.created_at: List[float] = []
+        self.costs: List[float] = []
+
+    def remove(self, indexes: List[int]) -> None:
+        if not indexes:
+            return
+        removed = set(indexes)
+        keep = [i for i in range(len(self.answers)) if i not in removed]
+        self.questions = [self.questions[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.created_at = [self.created_at[i] for i in keep]
+        self.costs = [self.costs[i] for i in keep]
+        self.vectors = self.vectors[keep] if keep else None
+
+    def touch(self, index: int) -> None:
+        """把命中的条目移到末尾，淘汰时从头部开始"""
+        order = [i for i in range(len(self.answers)) if i != index] + [index]
+        self.questions = [self.questions[i] for i in order]
+        self.answers = [self.answers[i] for i in order]
+        self.created_at = [self.created_at[i] for i in order]
+        self.costs = [self.costs[i] for i in order]
+        self.vectors = self.vectors[order]
+
+
+class AnswerCache:
+    """按店铺的语义回答缓存
+
+    以 store_id 分区，在分区内对问题向量做一次矩阵乘法找出最相近的已回答问题，
+    相似度超过阈值且未过期时直接返回缓存的回答。分区内的回答对店铺所有用户可见，
+    只应写入与用户、订单无关的回答（问题不含标识、未调用用户或订单相关工具）。
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL,
+                 store_size: int = ANSWER_CACHE_STORE_SIZE, max_stores: int = ANSWER_CACHE_MAX_STORES) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.store_size = store_size
+        self.max_stores = max_stores
+        self._stores: "OrderedDict[str, _StoreEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector: Any) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _key(store_id: Optional[str]) -> str:
+        return store_id or ""
+
+    def lookup(self, store_id: Optional[str], vector: Any) -> Optional[str]:
+        """查找语义相近的已缓存回答
+
+        Args:
+            store_id: 店铺ID
+            vector: 问题向量
+
+        Returns:
+            Optional[str]: 命中时返回缓存的回答
+        """
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            entries = self._stores.get(self._key(store_id))
+            answer = None
+            if entries is not None and entries.vectors is not None:
+                expired = [i for i, created in enumerate(entries.created_at) if now - created > self.ttl]
+                entries.remove(expired)
+                if entries.vectors is not None and entries.vectors.shape[1] == query.shape[0]:
+                    scores = entries.vectors @ query
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        answer = entries.answers[best]
+                        self.saved_seconds += entries.costs[best]
+                        AnswerCacheSavedCounter.inc(entries.costs[best])
+                        entries.touch(best)
+                        self._stores.move_to_end(self._key(store_id))
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        AnswerCacheCounter.inc(labels={"result": "hit" if answer is not None else "miss"})
+        return answer
+
+    def put(self, store_id: Optional[str], question: str, vector: Any, answer: str, cost: float = 0.0) -> None:
+        """缓存一条回答
+
+        Args:
+            store_id: 店铺ID
+            question: 用户问题
+            vector: 问题向量
+            answer: 回答
+            cost: 生成该回答的耗时（秒），用于统计节省的时间
+        """
+        row = self._normalize(vector).reshape(1, -1)
+        key = self._key(store_id)
+        with self._lock:
+            entries = self._stores.get(key)
+            if entries is None:
+                entries = self._stores[key] = _StoreEntries()
+            self._stores.move_to_end(key)
+            entries.questions.append(question)
+            entries.answers.append(answer)
+            entries.created_at.append(time.time())
+            entries.costs.append(cost)
+            entries.vectors = row if entries.vectors is None else np.vstack([entries.vectors, row])
+            if len(entries.answers) > self.store_size:
+                entries.remove(list(range(len(entries.answers) - self.store_size)))
+            while len(self._stores) > self.max_stores:
+                self._stores.popitem(last=False)
+
+    def invalidate(self, store_id: Optional[str] = None) -> None:
+        """清除指定店铺的缓存，不传时清除全部"""
+        with self._lock:
+            if store_id is None:
+                self._stores.clear()
+            else:
+                self._stores.pop(self._key(store_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "stores": len(self._stores),
+                "entries": sum(len(entries.answers) for entries in self._stores.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
@@ -0,0 +1,199 @@
+"""批量对话：逐行读取 JSONL 问题，以有限并发经 Logic.agenerate_text_agent 回答，结果按完成顺序以 NDJSON 逐条返回
+
+每行输入: {"id": "可选", "question": "...", "user_id": "可选", "store_id": "可选", "use_history": true}
+每行输出: {"index": 0, "id": ..., "success": true, "answer": "...", "seconds": 0.12}
+         失败时为 {"index": 0, "id": ..., "success": false, "error": "..."}，index 为输入的行序号
+
+同一窗口内的问题先一次批量嵌入并写入嵌入缓存，之后回答缓存查找、历史召回与去重都直接命中缓存。
+persist 为 False 时不写入对话历史，也不读写回答缓存，适合修改提示词后回放历史问题评估回答质量。
+
+运行: python -m service.batchChat questions.jsonl [--out answers.jsonl] [--concurrency 8] [--no-persist]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from .embedding import EmbeddingService
+from .executor import run_blocking
+from .log import get_logger
+from .requestScheduler import Overloaded
+
+logger = get_logger(__name__)
+
+# 批量对话默认并发数与允许的最大并发数
+BATCH_CHAT_CONCURRENCY: int = int(os.getenv("BATCH_CHAT_CONCURRENCY", "8"))
+BATCH_CHAT_MAX_CONCURRENCY: int = int(os.getenv("BATCH_CHAT_MAX_CONCURRENCY", "64"))
+
+
+async def split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """把请求体的字节流切分为文本行"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+async def iterate(lines: Iterable[str]) -> AsyncIterator[str]:
+    """同步的行迭代器转为异步迭代器"""
+    for line in lines:
+        yield line
+
+
+class BatchChat:
+    """有限并发的批量问答"""
+
+    def __init__(self, logic: Any, concurrency: int = BATCH_CHAT_CONCURRENCY, persist: bool = True,
+                 retries: int = 3) -> None:
+        self.logic = logic
+        self.concurrency = max(1, min(concurrency, BATCH_CHAT_MAX_CONCURRENCY))
+        self.persist = persist
+        # 遇到排队已满时按 Retry-After 等待后重试的次数
+        self.retries = retries
+        self._limit = asyncio.Semaphore(self.concurrency)
+
+    @staticmethod
+    def parse_line(line: str) -> Optional[Dict[str, Any]]:
+        """解析一行输入，空行返回 None，格式错误时抛出 ValueError"""
+        line = line.strip()
+        if not line:
+            return None
+        item = json.loads(line)
+        if not isinstance(item, dict) or not isinstance(item.get("question"), str) or not item["question"]:
+            raise ValueError("每行需要包含非空的 question 字段")
+        return item
+
+    async def _prefetch(self, questions: List[str]) -> None:
+        """同一窗口的问题一次批量嵌入，结果进入嵌入缓存"""
+        try:
+            await run_blocking(EmbeddingService.embed_documents, questions)
+        except Exception:
+            logger.exception("批量预嵌入失败")
+
+    async def _answer(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"index": index, "id": item.get("id")}
+        async with self._limit:
+            start = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                try:
+                    answer = await self.logic.agenerate_text_agent(
+                        question=item["question"],
+                        user_id=item.get("user_id"),
+                        store_id=item.get("store_id"),
+                        use_history=bool(item.get("use_history", True)),
+                        persist=self.persist
+                    )
+                    result.update(success=True, answer=answer)
+                    break
+                except Overloaded as e:
+                    if attempt >= self.retries:
+                        result.update(success=False, error=e.reason)
+                        break
+                    await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    logger.exception("批量对话单条失败", extra={"index": index})
+                    result.update(success=False, error=str(e))
+                    break
+            result["seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def arun(self, lines: AsyncIterable[str]) -> AsyncIterator[Dict[str, Any]]:
+        """逐行读取问题并按完成顺序返回结果
+
+        Args:
+            lines: JSONL 文本行
+
+        Returns:
+            AsyncIterator[Dict[str, Any]]: 每个问题的结果
+        """
+        pending: Set[asyncio.Task] = set()
+        window: List[Tuple[int, Dict[str, Any]]] = []
+
+        async def launch() -> None:
+            await self._prefetch([item["question"] for _, item in window])
+            for index, item in window:
+                pending.add(asyncio.create_task(self._answer(index, item)))
+            window.clear()
+
+        async def drain(limit: int) -> AsyncIterator[Dict[str, Any]]:
+            while len(pending) > limit:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for task in sorted(done, key=lambda t: t.result()["index"]):
+                    yield task.result()
+
+        index = 0
+        try:
+            async for line in lines:
+                try:
+                    item = self.parse_line(line)
+                except ValueError as e:
+                    yield {"index": index, "id": None, "success": False, "error": f"输入格式错误: {e}"}
+                    index += 1
+                    continue
+                if item is None:
+                    continue
+                window.append((index, item))
+                index += 1
+                if len(window) >= self.concurrency:
+                    await launch()
+                    # 限制在途任务数，输入很长时不会一次性全部读入内存
+                    async for result in drain(2 * self.concurrency):
+                        yield result
+            if window:
+                await launch()
+            async for result in drain(0):
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+async def _run_cli(args: argparse.Namespace) -> Dict[str, Any]:
+    from .logic import Logic
+
+    logic = Logic()
+    runner = BatchChat(logic, concurrency=args.concurrency, persist=not args.no_persist)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.out is None else open(args.out, "w", encoding="utf-8")
+    stats = {"questions": 0, "succeeded": 0, "failed": 0}
+    start = time.perf_counter()
+    try:
+        async for result in runner.arun(iterate(source)):
+            stats["questions"] += 1
+            stats["succeeded" if result["success"] else "failed"] += 1
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        # 写完队列中尚未落库的对话
+        logic.stop_background_jobs()
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["questions_per_minute"] = round(stats["questions"] * 60 / elapsed, 1) if elapsed else 0.0
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量回答 JSONL 中的问题，结果输出为 NDJSON")
+    parser.add_argument("input", help="JSONL 文件，- 表示标准输入")
+    parser.add_argument("--out", help="结果文件，默认输出到标准输出")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CHAT_CONCURRENCY, help="同时回答的问题数")
+    parser.add_argument("--no-persist", action="store_true", help="不写入对话历史，也不读写回答缓存")
+    args = parser.parse_args()
+    stats = asyncio.run(_run_cli(args))
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
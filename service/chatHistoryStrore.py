@@ -1,177 +1,524 @@
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.schema import Document
 import os
-import json
+import threading
+import uuid
 from datetime import datetime
 
+import numpy as np
+
 import constant.chatRequest
-from .chroma import ChromaService
-from sklearn.metrics.pairwise import cosine_similarity
+from .chroma import ChromaService, upsert_vectors
+from .embedding import EmbeddingService
 from typing import List, Optional, Dict, Any, Union, Tuple
 from .prompt import ChatPrompt
-from constant.chatRequest import ChatHistoryConstant
+from .historyIndex import HistoryIndex
+from .hybridSearch import HYBRID_SEARCH_ENABLED, HybridSearchService
+from .historyRecord import HistoryRecord, is_structured, parse_rows, record_metadata
+from .log import get_logger
+from .memoryCache import MEMORY_CACHE_TTL, MemoryCache
+from .tracing import traced
+from .sharedState import LocalVersionStore, SqliteVersionStore, create_version_store
+from .writeBehind import ConversationItem, ConversationWriter, WRITE_BEHIND_ENABLED
+
+logger = get_logger(__name__)
+
+USER_LOCK_STRIPES = 64
+# 单次总结请求包含的最大对话字符数，超过时分段总结再合并
+SUMMARY_CHUNK_CHARS: int = int(os.getenv("SUMMARY_CHUNK_CHARS", "6000"))
+# 合并摘要时每次最多合并的分段数
+SUMMARY_MERGE_FANIN: int = 8
+# 去重时与最近多少条历史问题比较，向量索引每个用户只保留这些行
+DEDUP_HISTORY_TURNS: int = int(os.getenv("DEDUP_HISTORY_TURNS", "200"))
+# 问题向量索引最多缓存的用户数与总字节数，超出时淘汰最久未使用的用户
+USER_VECTOR_CACHE_SIZE: int = int(os.getenv("USER_VECTOR_CACHE_SIZE", "5000"))
+USER_VECTOR_CACHE_MAX_BYTES: int = int(os.getenv("USER_VECTOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
 
 
 class ChatHistoryStore:
-    def __init__(self) -> None:
-        self.embedding_function: HuggingFaceEmbeddings = HuggingFaceEmbeddings(
-            model_name=os.getenv("HUGGINGFACE_EMBEDDINGS_MODEL_NAME"))
-        self.db: Any = ChromaService.db
-
-    def check_similarity(self, user_id: str, text: str, threshold: float = 0.8, k: int = 3) -> bool:
-        """检查文本相似度"""
-        text_vector = self.embedding_function.embed_query(text)
-
-        results: List[Document] = self.db.similarity_search_by_vector(
-            text_vector,
-            k=k,
-            filter={"$and": [
-                {"user_id": {"$eq": user_id}},
-                {"type": {"$eq": "conversation"}}
-            ]}
-        )
+    # 是否写入对话，只读视图为 False
+    persist: bool = True
+
+    def __init__(self, embedding_function: Any = None, db: Any = None,
+                 history_index: Optional[HistoryIndex] = None,
+                 versions: Union[LocalVersionStore, SqliteVersionStore, None] = None) -> None:
+        # 与 Chroma 共用同一个嵌入模型
+        self.embedding_function: Any = embedding_function or EmbeddingService
+        # 数据库与对话索引都在第一次使用时才连接；
+        # 显式传入 db 时对话与摘要共用该集合（旧版布局），否则按类型写入各自的集合
+        self._db: Any = db
+        self._history_index: Optional[HistoryIndex] = history_index
+        # 用户最近问题的向量索引（归一化后的向量矩阵），去重时直接复用，不再重复嵌入历史问题；
+        # 按用户数与字节数淘汰，记录对应的历史版本号，多进程部署时其他 worker 写入后版本号变化，需要重新加载
+        self.user_vectors: MemoryCache = MemoryCache(USER_VECTOR_CACHE_SIZE, USER_VECTOR_CACHE_MAX_BYTES,
+                                                     MEMORY_CACHE_TTL, size_of=lambda vectors: int(vectors.nbytes))
+        self._vectors_lock = threading.Lock()
+        # 用户历史版本号，每次写入或删除后递增，用于判断缓存的记忆是否仍然有效
+        self._versions: Union[LocalVersionStore, SqliteVersionStore, None] = versions
+        # 按用户哈希分段的写锁，保证同一用户的写入与总结替换互不穿插
+        self._user_locks: List[threading.RLock] = [threading.RLock() for _ in range(USER_LOCK_STRIPES)]
+        # 进程内是否已为全部旧用户回填过对话索引
+        self._all_users_indexed = False
+        # 对话写入队列
+        self.writer: ConversationWriter = ConversationWriter(self._flush_conversations)
+
+    @property
+    def db(self) -> Any:
+        """共用集合：显式传入的集合，未传入时为旧版本的默认集合"""
+        if self._db is None:
+            return ChromaService.db
+        return self._db
+
+    def _conversations(self, user_id: str) -> Any:
+        """用户对话所在的集合"""
+        if self._db is not None:
+            return self._db
+        return ChromaService.conversations(user_id)
+
+    def _conversation_collections(self) -> List[Any]:
+        """全部对话集合"""
+        if self._db is not None:
+            return [self._db]
+        return ChromaService.conversation_collections()
+
+    def _summaries(self) -> Any:
+        """用户摘要所在的集合"""
+        if self._db is not None:
+            return self._db
+        return ChromaService.summaries()
+
+    def _where(self, user_id: str, kind: str) -> Dict[str, Any]:
+        """按用户筛选；独立集合内文档类型唯一，只有共用集合时才需要再按类型过滤"""
+        if self._db is None:
+            return {"user_id": user_id}
+        return {"$and": [
+            {"user_id": {"$eq": user_id}},
+            {"type": {"$eq": kind}}
+        ]}
+
+    @property
+    def history_index(self) -> HistoryIndex:
+        """按用户的追加式对话索引，用于读取最近的对话"""
+        if self._history_index is None:
+            with self._vectors_lock:
+                if self._history_index is None:
+                    self._history_index = HistoryIndex()
+        return self._history_index
+
+    @property
+    def versions(self) -> Union[LocalVersionStore, SqliteVersionStore]:
+        """用户历史版本号存储，多 worker 部署时为进程间共享"""
+        if self._versions is None:
+            with self._vectors_lock:
+                if self._versions is None:
+                    self._versions = create_version_store()
+        return self._versions
 
-        for result in results:  # 这里不再是(result, score)的元组
-            try:
-                # 解析JSON内容
-                data = json.loads(result.page_content)
-                user_text = data.get("user", "")
+    def user_lock(self, user_id: str) -> threading.RLock:
+        """获取用户对应的写锁"""
+        return self._user_locks[hash(user_id) % USER_LOCK_STRIPES]
 
-                # 获取数据库中结果的嵌入向量
-                result_vector = self.embedding_function.embed_query(user_text)
+    def history_version(self, user_id: str) -> int:
+        """获取用户历史记录的当前版本号"""
+        return self.versions.get(user_id)
 
-                # 计算余弦相似度
-                cosine_sim = cosine_similarity([text_vector], [result_vector])[0][0]
+    def bump_version(self, user_id: str) -> int:
+        """推进用户历史版本号，返回新的版本号"""
+        version = self.versions.bump(user_id)
+        # 期间没有其他进程写入时，本进程的向量索引仍然有效
+        self.user_vectors.sync(user_id, version - 1, version)
+        return version
 
-                if cosine_sim > threshold:
-                    print(result)
-                    print(f"发现相似文本(相似度: {cosine_sim})，超过阈值 {threshold}")
-                    return True
-            except Exception as e:
-                print(f"解析结果时出错: {e}")
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        """将向量按行归一化，之后点积即为余弦相似度"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _get_user_vectors(self, user_id: str) -> np.ndarray:
+        """获取用户最近 DEDUP_HISTORY_TURNS 条历史问题的向量矩阵，未缓存时从数据库加载
+
+        新格式记录的文档向量就是问题向量，直接复用；只有旧格式记录需要重新嵌入问题。
+        """
+        version = self.history_version(user_id)
+        vectors = self.user_vectors.get(user_id, version)
+        if vectors is not None:
+            return vectors
+
+        self._ensure_indexed(user_id)
+        ids = self.history_index.recent(user_id, DEDUP_HISTORY_TURNS)
+        results = (self._conversations(user_id).get(ids=ids, include=['documents', 'metadatas', 'embeddings'])
+                   if ids else None) or {}
+        stored: List[Any] = []
+        texts: List[str] = []
+        documents = results.get('documents') or []
+        metadatas = results.get('metadatas') or [None] * len(documents)
+        embeddings = results.get('embeddings')
+        for i, (doc, metadata) in enumerate(zip(documents, metadatas)):
+            if is_structured(metadata):
+                if doc and embeddings is not None:
+                    stored.append(embeddings[i])
+                continue
+            record = HistoryRecord.from_row(doc, metadata)
+            if record is None:
+                logger.warning("解析结果时出错", extra={"user_id": user_id})
                 continue
+            if record.user:
+                texts.append(record.user)
+
+        if texts:
+            stored.extend(self.embedding_function.embed_documents(texts))
+        if stored:
+            vectors = self._normalize(stored)
+        else:
+            vectors = np.empty((0, 0), dtype=np.float32)
+
+        # 加载期间可能已有其他请求写入，以先写入的为准
+        return self.user_vectors.setdefault(user_id, vectors, version)
+
+    def _forget_vectors(self, user_id: str) -> None:
+        """用户历史被删除或替换后，丢弃向量索引并推进版本号"""
+        self.user_vectors.invalidate(user_id)
+        self.bump_version(user_id)
+
+    def _append_user_vector(self, user_id: str, vector: np.ndarray) -> None:
+        """保存新对话后把问题向量追加到索引"""
+        with self._vectors_lock:
+            vectors = self.user_vectors.peek(user_id)
+            if vectors is None:
+                # 尚未加载或已被淘汰的用户，下次访问时会从数据库加载
+                return
+            if vectors.size == 0:
+                vectors = vector.reshape(1, -1)
+            else:
+                # 只保留最近的 DEDUP_HISTORY_TURNS 条
+                vectors = np.vstack([vectors, vector])[-DEDUP_HISTORY_TURNS:]
+            self.user_vectors.replace(user_id, vectors)
+
+    @traced("check_similarity")
+    def check_similarity(self, user_id: str, text: str, threshold: float = 0.8, k: int = 3,
+                         text_vector: Optional[List[float]] = None) -> bool:
+        """检查文本相似度
+
+        Args:
+            user_id: 用户ID
+            text: 待检查文本
+            threshold: 余弦相似度阈值
+            k: 兼容旧参数，向量化后会对该用户全部历史问题一次性打分
+            text_vector: 已计算好的文本向量，传入时不再重复嵌入
+
+        Returns:
+            bool: 是否存在相似文本
+        """
+        candidates = self._get_user_vectors(user_id)
+        if candidates.size == 0:
+            return False
+
+        if text_vector is None:
+            text_vector = self.embedding_function.embed_query(text)
+        query = self._normalize(text_vector)[0]
+        if query.shape[0] != candidates.shape[1]:
+            return False
+
+        # 一次矩阵乘法得到与所有候选的余弦相似度
+        scores = candidates @ query
+        best = int(np.argmax(scores))
+        if scores[best] > threshold:
+            logger.debug("发现相似文本", extra={"user_id": user_id, "score": round(float(scores[best]), 4),
+                                               "threshold": threshold})
+            return True
         return False
 
     def save_conversation(self, user_id: str, user_message: Optional[str] = None,
                           bot_response: Optional[str] = None) -> bool:
         """保存一轮对话到共享数据库"""
-        # 检查问题和回答的相似度
-        if user_message is not None and self.check_similarity(user_id, user_message):
-            print("发现相似的问题，跳过保存。")
-            return False
+        return self.save_conversations([(user_id, user_message, bot_response)])[0]
 
-        if bot_response is not None and self.check_similarity(user_id, bot_response):
-            print("发现相似的回答，跳过保存。")
-            return False
-        # 保存新对话
-        timestamp = datetime.now().isoformat()
-        metadata = {
-            "timestamp": timestamp,
-            "type": "conversation",
-            "user_id": user_id
-        }
-        content = json.dumps({
-            "user": user_message,
-            "bot": bot_response,
-            "timestamp": timestamp
-        }, ensure_ascii=False)
-
-        document = Document(page_content=content, metadata=metadata)
-        self.db.add_documents([document])
-        return True
-
-    def load_recent_history(self, user_id: str, limit: int = 100) -> List[ChatHistoryConstant]:
-        """从共享数据库加载指定用户的最近聊天记录"""
+    def save_conversation_later(self, user_id: str, user_message: Optional[str] = None,
+                                bot_response: Optional[str] = None) -> None:
+        """把对话放入写入队列后立即返回，由后台线程批量写入数据库"""
+        if not WRITE_BEHIND_ENABLED:
+            self.save_conversation(user_id, user_message, bot_response)
+            return
+        # 版本号在落库后才推进：入队后、落库前缓存的记忆被淘汰时，从数据库重建的历史缺少排队中的对话，
+        # 只能以旧版本号缓存，落库后即失效重新加载
+        self.writer.submit((user_id, user_message, bot_response, datetime.now().isoformat()))
+
+    def _flush_conversations(self, items: List[ConversationItem]) -> List[bool]:
+        """写入队列的批量写入，落库后推进相关用户的版本号"""
+        return self.save_conversations(items)
+
+    @traced("save_conversation")
+    def save_conversations(self, items: List[ConversationItem]) -> List[bool]:
+        """批量保存对话：问题与回答合并为一次批量嵌入，去重后一次写入数据库
+
+        文档内容只保存问题，问题向量同时作为文档向量；回答与时间戳存入元数据。
+
+        Args:
+            items: (用户ID, 用户问题, 机器人回答, 对话时间) 列表，可省略对话时间，省略时使用写入时间
+
+        Returns:
+            List[bool]: 每条对话是否被保存（相似对话会被跳过）
+        """
+        now = datetime.now().isoformat()
+        texts: List[str] = []
+        for item in items:
+            texts.extend([item[1] or "", item[2] or ""])
+        vectors = self.embedding_function.embed_documents(texts) if texts else []
+
+        saved: List[bool] = []
+        ids: List[str] = []
+        documents: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        embeddings: List[List[float]] = []
+        written: List[Tuple[str, str]] = []
+        collections: List[Any] = []
+        for i, item in enumerate(items):
+            user_id, user_message, bot_response = item[:3]
+            timestamp = item[3] if len(item) > 3 and item[3] else now
+            question_vector, answer_vector = vectors[2 * i:2 * i + 2]
+
+            # 检查问题和回答的相似度
+            if user_message is not None and self.check_similarity(user_id, user_message,
+                                                                  text_vector=question_vector):
+                logger.info("发现相似的问题，跳过保存", extra={"user_id": user_id})
+                saved.append(False)
+                continue
+
+            if bot_response is not None and self.check_similarity(user_id, bot_response,
+                                                                  text_vector=answer_vector):
+                logger.info("发现相似的回答，跳过保存", extra={"user_id": user_id})
+                saved.append(False)
+                continue
+
+            # 分配序号并登记索引，同一批次内同一用户的后续对话也能参与去重
+            with self.user_lock(user_id):
+                self._ensure_indexed(user_id)
+                doc_id = str(uuid.uuid4())
+                seq = self.history_index.append(user_id, doc_id, timestamp)
+                if user_message:
+                    self._append_user_vector(user_id, self._normalize(question_vector)[0])
+            ids.append(doc_id)
+            documents.append(user_message or "")
+            metadatas.append(record_metadata(user_id, bot_response, timestamp, seq))
+            embeddings.append(question_vector)
+            written.append((user_id, doc_id))
+            collections.append(self._conversations(user_id))
+            saved.append(True)
+
+        if ids:
+            # 按分片集合分组，每个集合一次写入
+            groups: Dict[int, List[int]] = {}
+            for i, collection in enumerate(collections):
+                groups.setdefault(id(collection), []).append(i)
+            pending = list(groups.values())
+            while pending:
+                rows = pending[0]
+                try:
+                    # 向量已在上面批量计算，直接写入集合，避免再次嵌入
+                    upsert_vectors(collections[rows[0]], [ids[i] for i in rows], [embeddings[i] for i in rows],
+                                   [documents[i] for i in rows], [metadatas[i] for i in rows])
+                except Exception:
+                    # 回滚本组及尚未写入的分组
+                    for rows in pending:
+                        for i in rows:
+                            user_id, doc_id = written[i]
+                            self.history_index.remove(user_id, [doc_id])
+                            self._forget_vectors(user_id)
+                    raise
+                pending.pop(0)
+            for user_id in {user_id for user_id, _ in written}:
+                self.bump_version(user_id)
+        return saved
+
+    def _ensure_indexed(self, user_id: str) -> None:
+        """旧数据首次访问时回填对话索引，之后只需增量追加"""
+        if self.history_index.is_indexed(user_id):
+            return
+        results = self._conversations(user_id).get(
+            where=self._where(user_id, "conversation"),
+            include=['metadatas']
+        )
+        rows = [
+            (doc_id, (metadata or {}).get("timestamp", ""))
+            for doc_id, metadata in zip((results or {}).get('ids') or [], (results or {}).get('metadatas') or [])
+        ]
+        rows.sort(key=lambda row: row[1])
+        self.history_index.backfill(user_id, rows)
+
+    @traced("load_recent_history")
+    def load_recent_history(self, user_id: str, limit: int = 100) -> List[HistoryRecord]:
+        """从共享数据库加载指定用户的最近聊天记录，按时间从新到旧排列"""
         try:
-            results = self.db.get(
-                where={"$and": [
-                    {"user_id": {"$eq": user_id}},
-                    {"type": {"$eq": "conversation"}}
-                ]},
-                limit=limit,
-                include=['documents', 'metadatas']
-            )
+            self._ensure_indexed(user_id)
+            ids = self.history_index.recent(user_id, limit)
+            if not ids:
+                return []
+
+            results = self._conversations(user_id).get(ids=ids, include=['documents', 'metadatas'])
 
-            history: List[ChatHistoryConstant] = []
+            history: List[HistoryRecord] = []
             if results and results.get('documents'):
-                for doc in results['documents']:
-                    try:
-                        data = json.loads(doc)
-                        history.append(
-                            ChatHistoryConstant(
-                                user=data["user"],
-                                bot=data["bot"],
-                                timestamp=data.get("timestamp")
-                            ))
-                    except:
-                        continue
+                history = parse_rows(results['documents'],
+                                     results.get('metadatas') or [None] * len(results['documents']))
 
             history.sort(key=lambda x: x.timestamp, reverse=True)
             return history
 
-        except Exception as e:
-            print(f"加载用户历史记录失败: {str(e)}")
+        except Exception:
+            logger.exception("加载用户历史记录失败", extra={"user_id": user_id})
+            return []
+
+    @traced("load_summary")
+    def load_summary(self, user_id: str) -> Optional[str]:
+        """加载用户的历史摘要"""
+        try:
+            results = self._summaries().get(
+                where=self._where(user_id, "summary"),
+                include=['documents', 'metadatas']
+            )
+            if not results or not results.get('documents'):
+                return None
+            # 多条摘要时取最新的一条
+            latest = max(zip(results['documents'], results['metadatas']),
+                         key=lambda item: (item[1] or {}).get("timestamp", ""))
+            return latest[0]
+        except Exception:
+            logger.exception("加载用户摘要失败", extra={"user_id": user_id})
+            return None
+
+    @traced("search_history")
+    def search_history(self, user_id: str, question: str, k: int = 3) -> List[HistoryRecord]:
+        """召回与当前问题语义最相近的历史对话"""
+        if k <= 0:
+            return []
+        try:
+            collection = self._conversations(user_id)
+            if HYBRID_SEARCH_ENABLED and getattr(collection, "keyword_index", None) is not None:
+                # 关键词 + 向量混合召回，订单号等原始关键词也能命中
+                results: List[Document] = HybridSearchService.search(collection, question, k=k, user_id=user_id)
+            else:
+                results = collection.similarity_search(
+                    question,
+                    k=k,
+                    filter=self._where(user_id, "conversation")
+                )
+            return parse_rows([result.page_content for result in results],
+                              [result.metadata for result in results])
+        except Exception:
+            logger.exception("召回相关历史记录失败", extra={"user_id": user_id})
             return []
 
     def delete_user_history(self, user_id: str) -> bool:
         """删除指定用户的所有对话记录"""
         try:
-            self.db.delete(
-                where={"$and": [
-                    {"user_id": {"$eq": user_id}},
-                    {"type": {"$eq": "conversation"}}
-                ]}
-            )
-            print(f"已删除用户 {user_id} 的所有记录")
+            with self.user_lock(user_id):
+                self._conversations(user_id).delete(
+                    where=self._where(user_id, "conversation")
+                )
+                self.history_index.remove(user_id)
+                self._forget_vectors(user_id)
+            logger.info("已删除用户的所有记录", extra={"user_id": user_id})
             return True
-        except Exception as e:
-            print(f"删除用户记录失败: {str(e)}")
+        except Exception:
+            logger.exception("删除用户记录失败", extra={"user_id": user_id})
             return False
 
+    @staticmethod
+    def summary_id(user_id: str) -> str:
+        """每个用户只保留一条摘要，使用固定的文档ID覆盖写入"""
+        return f"summary-{user_id}"
+
+    def _chunk_conversations(self, conversations: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """按字符数把对话切分为多个分段"""
+        chunks: List[List[Dict[str, str]]] = [[]]
+        size = 0
+        for conv in conversations:
+            length = len(conv["user"]) + len(conv["bot"])
+            if chunks[-1] and size + length > SUMMARY_CHUNK_CHARS:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(conv)
+            size += length
+        return chunks
+
+    def _fold_summary(self, summary: Optional[str], conversations: List[Dict[str, str]], llmService: any) -> str:
+        """把新增对话合并进已有摘要，积压过多时先分段总结再合并"""
+        prompt = ChatPrompt()
+        chunks = self._chunk_conversations(conversations)
+        if len(chunks) == 1:
+            if summary:
+                return llmService.generate_text(prompt.summarize_incremental(summary, conversations))
+            return llmService.generate_text(prompt.summarize(conversations))
+
+        # map: 每个分段单独总结；reduce: 与已有摘要逐层合并
+        partials: List[str] = [llmService.generate_text(prompt.summarize(chunk)) for chunk in chunks]
+        if summary:
+            partials.insert(0, summary)
+        while len(partials) > 1:
+            groups = [partials[i:i + SUMMARY_MERGE_FANIN] for i in range(0, len(partials), SUMMARY_MERGE_FANIN)]
+            partials = [group[0] if len(group) == 1 else llmService.generate_text(prompt.merge_summaries(group))
+                        for group in groups]
+        return partials[0]
+
+    @traced("summarize_user_history")
     def summarize_user_history(self, user_id: str, llmService: any) -> bool:
-        """提取用户的所有聊天记录，使用LLM模型总结，并更新到数据库"""
+        """把上次总结之后新增的聊天记录合并进用户摘要，并从数据库中移除已合并的记录"""
         try:
-            results = self.db.get(
-                where={"$and": [
-                    {"user_id": {"$eq": user_id}},
-                    {"type": {"$eq": "conversation"}}
-                ]},
+            results = self._conversations(user_id).get(
+                where=self._where(user_id, "conversation"),
                 include=['documents', 'metadatas']
             )
 
             if not results or not results.get('documents'):
-                print(f"用户 {user_id} 没有聊天记录，跳过总结")
+                logger.info("用户没有聊天记录，跳过总结", extra={"user_id": user_id})
                 return False
 
+            summarized_ids: List[str] = results.get('ids') or []
             conversations: List[Dict[str, str]] = []
-            for doc in results['documents']:
-                try:
-                    data = json.loads(doc)
-                    conversations.append({
-                        "user": data.get("user", ""),
-                         "bot": "",#这里不要机器人回答的 data.get("bot", ""),
-                        "timestamp": data.get("timestamp", "")
-                    })
-                except Exception as e:
-                    print(f"解析对话记录时出错: {e}")
+            metadatas = results.get('metadatas') or [None] * len(results['documents'])
+            for doc, metadata in zip(results['documents'], metadatas):
+                record = HistoryRecord.from_row(doc, metadata)
+                if record is None:
+                    logger.warning("解析对话记录时出错", extra={"user_id": user_id})
                     continue
+                conversations.append({
+                    "user": record.user,
+                    "bot": "",  # 这里不要机器人回答的 record.bot
+                    "timestamp": record.timestamp
+                })
 
             conversations.sort(key=lambda x: x.get("timestamp", ""))
-            if len(conversations) <= 1 :
-                #print(f"用户 {user_id} 只有一条记录不需要合并")
+            summary: Optional[str] = self.load_summary(user_id)
+            if summary is None and len(conversations) <= 1:
+                logger.debug("用户只有一条记录不需要合并", extra={"user_id": user_id})
                 return True
 
-            summary_text: str = ChatPrompt().summarize(conversations)
-            summary: str = llmService.generate_text(summary_text)
+            summary = self._fold_summary(summary, conversations, llmService)
 
-            self.delete_user_history(user_id)
-            self.save_conversation(user_id, summary)
+            # 摘要单独存为 summary 类型，不经过相似度去重；
+            # 只移除参与总结的记录，总结期间新增的对话保留；写入与删除在用户写锁内完成
+            timestamp = datetime.now().isoformat()
+            document = Document(page_content=summary, metadata={
+                "timestamp": timestamp,
+                "type": "summary",
+                "user_id": user_id,
+                "turns": len(conversations),
+            })
+            with self.user_lock(user_id):
+                self._summaries().add_documents([document], ids=[self.summary_id(user_id)])
+                self._conversations(user_id).delete(ids=summarized_ids)
+                self.history_index.remove(user_id, summarized_ids)
+                self._forget_vectors(user_id)
 
-            #print(f"已成功为用户 {user_id} 生成聊天记录总结")
+            logger.debug("已成功生成聊天记录总结", extra={"user_id": user_id, "turns": len(conversations)})
             return True
 
-        except Exception as e:
-            print(f"总结用户历史记录失败: {str(e)}")
+        except Exception:
+            logger.exception("总结用户历史记录失败", extra={"user_id": user_id})
             return False
 
     def get_all_user_ids(self) -> List[str]:
@@ -181,25 +528,67 @@ class ChatHistoryStore:
             List[str]: 用户ID列表
         """
         try:
-            # 使用空字符串作为查询文本，仅通过metadata筛选
-            results = self.db.get(
-                where={"type": {"$eq": "conversation"}},
-                include=['metadatas']
-            )
-
-            # 从元数据中提取所有不重复的用户ID
+            # 逐个对话集合读取元数据，共用集合时仍需按类型筛选
+            where = None if self._db is None else {"type": {"$eq": "conversation"}}
             user_ids = set()
-            if results and results.get('metadatas'):
-                for metadata in results['metadatas']:
-                    if metadata and 'user_id' in metadata:
-                        user_ids.add(metadata['user_id'])
+            for collection in self._conversation_collections():
+                results = collection.get(where=where, include=['metadatas'])
+
+                # 从元数据中提取所有不重复的用户ID
+                if results and results.get('metadatas'):
+                    for metadata in results['metadatas']:
+                        if metadata and 'user_id' in metadata:
+                            user_ids.add(metadata['user_id'])
 
             return list(user_ids)
-        except Exception as e:
-            print(f"获取用户ID列表失败: {str(e)}")
+        except Exception:
+            logger.exception("获取用户ID列表失败")
             return []
 
 
-# 初始化历史查询
+    def find_users_to_summarize(self, min_turns: int) -> List[Tuple[str, int]]:
+        """查找未总结对话条数达到阈值的用户
+
+        首次调用时为全部旧用户回填对话索引，之后直接按索引统计。
+
+        Args:
+            min_turns: 触发总结的最少对话条数
+
+        Returns:
+            List[Tuple[str, int]]: (用户ID, 对话条数)，按条数从多到少排列
+        """
+        if not self._all_users_indexed:
+            for user_id in self.get_all_user_ids():
+                try:
+                    self._ensure_indexed(user_id)
+                except Exception:
+                    logger.exception("回填用户对话索引失败", extra={"user_id": user_id})
+            self._all_users_indexed = True
+        return self.history_index.users_with_at_least(min_turns)
+
+
+class ReadOnlyHistoryStore:
+    """历史记录服务的只读视图：读取照常，写入全部跳过，用于批量回放评估"""
+
+    persist: bool = False
+
+    def __init__(self, store: ChatHistoryStore) -> None:
+        self._store = store
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._store, name)
+
+    def save_conversation(self, user_id: str, user_message: Optional[str] = None,
+                          bot_response: Optional[str] = None) -> bool:
+        return False
+
+    def save_conversation_later(self, user_id: str, user_message: Optional[str] = None,
+                                bot_response: Optional[str] = None) -> None:
+        return None
+
+    def save_conversations(self, items: List[ConversationItem]) -> List[bool]:
+        return [False] * len(items)
+
+
+# 初始化历史查询（数据库与模型延迟加载）
 ChatHistoryStoreService: ChatHistoryStore = ChatHistoryStore()
-print("初始化历史查询类成功")
@@ -2,15 +2,126 @@
 from langchain_community.document_loaders import DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma as LangChainChroma
 
 import os
-import shutil
+import threading
 import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from .embedding import EmbeddingService
+from .log import get_logger
+
+logger = get_logger(__name__)
 
 CHROMA_PATH = "chroma"
 DATA_PATH = "data"
+# 知识库文档单独存放的集合，与对话记录互不影响
+KNOWLEDGE_COLLECTION = "knowledge"
+# 对话记录与摘要各自独立的集合，查询时无需再按文档类型过滤
+CONVERSATION_COLLECTION = "conversations"
+SUMMARY_COLLECTION = "summaries"
+# 旧版本所有文档共用的默认集合，仅迁移时读取
+LEGACY_COLLECTION = "langchain"
+# 旧默认集合中已搬走的文档在元数据中记录目标集合
+MIGRATED_KEY = "migrated_to"
+# 对话集合按用户哈希分片的数量，1 表示不分片；修改后需运行 python -m service.migrate 重新分布
+CONVERSATION_SHARDS: int = max(1, int(os.getenv("CONVERSATION_SHARDS", "1")))
+# 设置后连接独立运行的 Chroma 服务（chroma run --path chroma --port 8000），多 worker 部署时必须使用，
+# 否则每个 worker 都会直接写同一个本地数据库目录
+CHROMA_HOST: str = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT: int = int(os.getenv("CHROMA_PORT", "8000"))
+# 写入 Chroma 时同步维护关键词索引，供 BM25 + 向量混合检索使用
+KEYWORD_INDEX_ENABLED: bool = os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() == "true"
+
+
+def create_client(path: str = CHROMA_PATH):
+    """创建 chromadb 客户端：配置了 CHROMA_HOST 时连接服务端，否则使用本地目录"""
+    import chromadb
+
+    if CHROMA_HOST:
+        return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+    return chromadb.PersistentClient(path=path)
+
+
+def shard_of(key: str, shards: int = CONVERSATION_SHARDS) -> int:
+    """稳定的哈希分片序号，不受进程哈希随机化影响"""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+def conversation_collection_name(user_id: str, shards: int = CONVERSATION_SHARDS) -> str:
+    """用户对话所在的集合名称"""
+    if shards <= 1:
+        return CONVERSATION_COLLECTION
+    return f"{CONVERSATION_COLLECTION}_{shard_of(user_id, shards):03d}"
+
+
+def conversation_collection_names(shards: int = CONVERSATION_SHARDS) -> List[str]:
+    """当前分片配置下的全部对话集合名称"""
+    if shards <= 1:
+        return [CONVERSATION_COLLECTION]
+    return [f"{CONVERSATION_COLLECTION}_{i:03d}" for i in range(shards)]
+
+
+def _index_add(keyword_index: Any, name: str, ids: List[str], documents: List[str],
+               metadatas: Optional[List[Dict[str, Any]]]) -> None:
+    """写入关键词索引；失败只记录日志，Chroma 中已写入的文档不回滚，之后可重建索引补齐"""
+    try:
+        keyword_index.add(name, ids, documents, metadatas)
+    except Exception:
+        logger.exception("关键词索引写入失败", extra={"collection": name, "documents": len(ids)})
+
+
+def _index_delete(keyword_index: Any, name: str, ids: List[str]) -> None:
+    """从关键词索引删除文档；失败只记录日志，残留的索引项在检索时取不到文档内容，不会返回"""
+    try:
+        keyword_index.delete(name, ids)
+    except Exception:
+        logger.exception("关键词索引删除失败", extra={"collection": name, "documents": len(ids)})
+
+
+class IndexedChroma(LangChainChroma):
+    """写入与删除时同步更新关键词索引的 LangChain Chroma 集合"""
+
+    keyword_index: Any = None
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict[str, Any]]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = super().add_texts(texts, metadatas=metadatas, ids=ids, **kwargs)
+        if self.keyword_index is not None:
+            _index_add(self.keyword_index, self._collection.name, ids, texts, metadatas)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        if self.keyword_index is not None and ids is None and kwargs.get("where"):
+            # 按条件删除时先取出命中的文档ID，索引按ID删除
+            ids = self._collection.get(where=kwargs.pop("where"), include=[])["ids"]
+            if not ids:
+                return
+        super().delete(ids=ids, **kwargs)
+        if self.keyword_index is not None and ids:
+            _index_delete(self.keyword_index, self._collection.name, ids)
+
+
+def upsert_vectors(collection: Any, ids: List[str], embeddings: List[Any], documents: List[str],
+                   metadatas: List[Dict[str, Any]]) -> None:
+    """写入已计算好向量的文档，绕过 LangChain 的再次嵌入，同时更新关键词索引"""
+    collection._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    keyword_index = getattr(collection, "keyword_index", None)
+    if keyword_index is not None:
+        _index_add(keyword_index, collection._collection.name, ids, documents, metadatas)
+
+
+def delete_ids(collection: Any, ids: List[str]) -> None:
+    """按ID删除文档，同时更新关键词索引"""
+    collection._collection.delete(ids=ids)
+    keyword_index = getattr(collection, "keyword_index", None)
+    if keyword_index is not None:
+        _index_delete(keyword_index, collection._collection.name, ids)
 
 
 class Chroma:
@@ -27,50 +138,115 @@ class Chroma:
         return cls._instance
 
     def __init__(self):
-        # 只初始化一次
+        # 只初始化一次；嵌入模型与数据库都在第一次使用时才加载
         if not Chroma._initialized:
-            print("开始初始化 Chroma...")
-            start_time = time.time()
-            
-            print("正在加载嵌入模型...")
-            embedding_start = time.time()
-            self.db = None
-            self.embedding_function = HuggingFaceEmbeddings(model_name=os.getenv("HUGGINGFACE_EMBEDDINGS_MODEL_NAME"))
-            embedding_end = time.time()
-            print(f"嵌入模型加载完成，耗时: {embedding_end - embedding_start:.2f} 秒")
-            
+            self._db = None
+            self._client = None
+            self._loaded = False
+            self._collections = {}
+            self._lock = threading.Lock()
+            self._init_lock = threading.Lock()
+            self.embedding_function = EmbeddingService
             Chroma._initialized = True
-            end_time = time.time()
-            print(f"Chroma 初始化完成，总耗时: {end_time - start_time:.2f} 秒")
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def db(self):
+        """旧版本共用的默认集合，新数据按类型写入各自的集合"""
+        if self._db is None:
+            self._db = self.collection(LEGACY_COLLECTION)
+        return self._db
+
+    @db.setter
+    def db(self, value):
+        self._db = value
 
     def init(self):
         """初始化并连接到现有的Chroma向量数据库"""
-        # 如果已经初始化过，直接返回现有实例
-        if self.db is not None:
-            return self
-
-        # 检查数据库是否存在
-        if not os.path.exists(CHROMA_PATH):
-            print(f"警告: 向量数据库路径 {CHROMA_PATH} 不存在，正在自动创建...")
-            # 自动创建目录
-            os.makedirs(CHROMA_PATH, exist_ok=True)
-            # 初始化一个空数据库
-            self.generate_data_store()
-            print(f"已自动创建并初始化空数据库: {CHROMA_PATH}")
-            time.sleep(3)
-        # 连接到现有的数据库
-        print("正在连接到 Chroma 数据库...")
-        start_time = time.time()
-        self.db = LangChainChroma(persist_directory=CHROMA_PATH, embedding_function=self.embedding_function)
-        end_time = time.time()
-        print(f"成功连接到Chroma向量数据库，位于 {CHROMA_PATH}，耗时: {end_time - start_time:.2f} 秒")
-        
+        with self._init_lock:
+            # 如果已经初始化过，直接返回现有实例
+            if self._loaded:
+                return self
+
+            # 检查数据库是否存在
+            if not CHROMA_HOST and not os.path.exists(CHROMA_PATH):
+                logger.warning("向量数据库路径不存在，正在自动创建", extra={"path": CHROMA_PATH})
+                # 自动创建目录，空数据库由 Chroma 在连接时创建
+                os.makedirs(CHROMA_PATH, exist_ok=True)
+            # 连接到现有的数据库
+            logger.info("正在连接到 Chroma 数据库")
+            start_time = time.time()
+            # 预先打开对话、摘要与知识库集合
+            self.conversation_collections()
+            self.summaries()
+            self.knowledge()
+            self._check_legacy()
+            self._loaded = True
+            end_time = time.time()
+            location = f"{CHROMA_HOST}:{CHROMA_PORT}" if CHROMA_HOST else CHROMA_PATH
+            logger.info("成功连接到Chroma向量数据库", extra={"location": location,
+                                                        "seconds": round(end_time - start_time, 2)})
+
         return self
 
+    def _check_legacy(self) -> None:
+        """旧默认集合中仍有未迁移的对话而对话集合为空时记录错误：历史记录查不到，需要运行迁移"""
+        try:
+            names = [getattr(item, "name", item) for item in self._client.list_collections()]
+            if LEGACY_COLLECTION not in names:
+                return
+            if any(collection._collection.count() for collection in self.conversation_collections()):
+                return
+            legacy = self._client.get_collection(name=LEGACY_COLLECTION, embedding_function=None)
+            rows = legacy.get(where={"type": "conversation"}, include=["metadatas"])["metadatas"]
+            pending = sum(1 for metadata in rows if not (metadata or {}).get(MIGRATED_KEY))
+            if pending:
+                logger.error("旧的默认集合中仍有对话记录而对话集合为空，请运行 python -m service.migrate",
+                             extra={"collection": LEGACY_COLLECTION, "conversations": pending})
+        except Exception:
+            logger.exception("检查旧的默认集合失败")
+
+    def collection(self, name: str):
+        """获取同一数据库目录下的其他集合"""
+        with self._lock:
+            if name not in self._collections:
+                if self._client is None:
+                    self._client = create_client()
+                    # 未预热时由第一次访问集合完成连接，同样视为已就绪
+                    self._loaded = True
+                collection = IndexedChroma(collection_name=name, client=self._client,
+                                           embedding_function=self.embedding_function)
+                if KEYWORD_INDEX_ENABLED and name != LEGACY_COLLECTION:
+                    from .keywordIndex import KeywordIndexService
+
+                    collection.keyword_index = KeywordIndexService
+                self._collections[name] = collection
+            return self._collections[name]
+
+    def conversations(self, user_id: str):
+        """获取用户对话所在的集合（按用户哈希分片）"""
+        return self.collection(conversation_collection_name(user_id))
+
+    def conversation_collections(self) -> list:
+        """获取全部对话分片集合"""
+        return [self.collection(name) for name in conversation_collection_names()]
+
+    def summaries(self):
+        """获取用户摘要集合"""
+        return self.collection(SUMMARY_COLLECTION)
+
+    def knowledge(self):
+        """获取知识库集合"""
+        return self.collection(KNOWLEDGE_COLLECTION)
+
     def generate_data_store(self):
-        # documents = self.load_documents()
-        # chunks = self.split_text(documents)
-        self.save_to_chroma([])
+        """增量导入 data 目录下的知识库文档"""
+        from .ingest import KnowledgeIngestor
+
+        return KnowledgeIngestor().run()
 
     def load_documents(self):
         loader = DirectoryLoader(DATA_PATH, glob="*.md")
@@ -85,7 +261,7 @@ class Chroma:
             add_start_index=True,
         )
         chunks = text_splitter.split_documents(documents)
-        print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
+        logger.info("Split documents into chunks", extra={"documents": len(documents), "chunks": len(chunks)})
 
         if chunks:
             document = chunks[10] if len(chunks) > 10 else chunks[0]
@@ -95,17 +271,10 @@ class Chroma:
         return chunks
 
     def save_to_chroma(self, chunks: list[Document]):
-        # Clear out the database first.
-        if os.path.exists(CHROMA_PATH):
-            shutil.rmtree(CHROMA_PATH)
-
-        # Create a new DB from the documents.
-        self.db = LangChainChroma.from_documents(
-            chunks, self.embedding_function, persist_directory=CHROMA_PATH
-        )
-        self.db.persist()
-        print(f"Saved {len(chunks)} chunks to {CHROMA_PATH}.")
+        # 写入独立的知识库集合，不再清空整个目录（会连同对话记录一起删除）
+        if chunks:
+            self.knowledge().add_documents(chunks)
+        logger.info("Saved chunks", extra={"chunks": len(chunks), "collection": KNOWLEDGE_COLLECTION})
 
-# 自动执行数据存储生成
-ChromaService: Chroma | None = Chroma().init()
-print("初始化Chroma成功")
+# 数据库在第一次访问集合时才连接
+ChromaService: Chroma = Chroma()
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from .log import get_logger
+from .metrics import Metrics
+from .tracing import traced
+
+logger = get_logger(__name__)
+
+# 推理后端：torch（默认）、onnx、onnx-int8（ONNX Runtime 动态量化模型）
+EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+# onnx-int8 使用的模型文件，需与 CPU 指令集匹配（avx2/avx512/avx512_vnni/arm64）
+EMBEDDING_ONNX_FILE: str = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512.onnx")
+# 相同文本的向量缓存条数，0 表示不缓存
+EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# 并发单条请求的合批等待窗口（毫秒），0 表示不合批
+EMBEDDING_BATCH_WINDOW_MS: float = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+EMBEDDING_MAX_BATCH: int = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+
+EmbeddingCacheCounter = Metrics.counter("embedding_cache_total", "嵌入缓存命中/未命中次数")
+EmbeddingBatchHistogram = Metrics.histogram("embedding_batch_size", "每次模型前向计算的文本条数",
+                                            (1, 2, 4, 8, 16, 32, 64, 128, 256))
+EmbeddingForwardHistogram = Metrics.histogram("embedding_forward_seconds", "模型前向计算耗时")
+
+
+class Embedding(Embeddings):
+    """进程内共享的嵌入服务
+
+    Chroma 与历史记录服务共用同一个模型实例，模型在第一次使用时才加载。
+    并发的单条请求会在很短的窗口内合并为一次批量计算，完全相同的文本直接命中 LRU 缓存。
+    实现 LangChain Embeddings 接口，可直接作为 embedding_function 传入。
+    """
+
+    def __init__(self, model_name: Optional[str] = None, backend: str = EMBEDDING_BACKEND,
+                 cache_size: int = EMBEDDING_CACHE_SIZE, batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+                 max_batch: int = EMBEDDING_MAX_BATCH) -> None:
+        self.model_name = model_name or os.getenv("HUGGINGFACE_EMBEDDINGS_MODEL_NAME")
+        self.backend = backend
+        self.cache_size = cache_size
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self._model: Any = None
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._pending: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._batcher: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _model_kwargs(self) -> Dict[str, Any]:
+        if self.backend == "onnx":
+            return {"backend": "onnx"}
+        if self.backend == "onnx-int8":
+            return {"backend": "onnx", "model_kwargs": {"file_name": EMBEDDING_ONNX_FILE}}
+        return {}
+
+    @property
+    def model(self) -> Any:
+        """获取底层模型，首次访问时加载"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from langchain_huggingface import HuggingFaceEmbeddings
+
+                    logger.info("正在加载嵌入模型", extra={"backend": self.backend, "model": self.model_name})
+                    start_time = time.time()
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name,
+                                                        model_kwargs=self._model_kwargs())
+                    logger.info("嵌入模型加载完成", extra={"backend": self.backend,
+                                                       "seconds": round(time.time() - start_time, 2)})
+        return self._model
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        if not self.cache_size:
+            return None
+        key = self._key(text)
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+        EmbeddingCacheCounter.inc(labels={"result": "hit" if vector is not None else "miss"})
+        return vector
+
+    def _cache_put(self, text: str, vector: List[float]) -> None:
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[self._key(text)] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forward(self, texts: List[str]) -> List[List[float]]:
+        """对去重后的文本做一次批量前向计算并写入缓存"""
+        unique = list(dict.fromkeys(texts))
+        start = time.perf_counter()
+        vectors = self.model.embed_documents(unique)
+        EmbeddingForwardHistogram.observe(time.perf_counter() - start)
+        EmbeddingBatchHistogram.observe(len(unique))
+        computed = dict(zip(unique, vectors))
+        for text, vector in computed.items():
+            self._cache_put(text, vector)
+        return [computed[text] for text in texts]
+
+    def _ensure_batcher(self) -> None:
+        if self._batcher is not None:
+            return
+        with self._lock:
+            if self._batcher is None:
+                self._batcher = threading.Thread(target=self._run_batcher, name="embedding-batcher", daemon=True)
+                self._batcher.start()
+
+    def _run_batcher(self) -> None:
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                vectors = self._forward([text for text, _ in batch])
+                for (_, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    @traced("embed_query")
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cache_get(text)
+        if vector is not None:
+            return list(vector)
+        if self.batch_window <= 0:
+            return list(self._forward([text])[0])
+
+        self._ensure_batcher()
+        future: Future = Future()
+        self._pending.put((text, future))
+        return list(future.result())
+
+    @traced("embed_documents")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        results: List[Optional[List[float]]] = [self._cache_get(text) for text in texts]
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing:
+            for i, vector in zip(missing, self._forward([texts[i] for i in missing])):
+                results[i] = vector
+        return [list(vector) for vector in results]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "loaded": self.loaded,
+            "cache_entries": len(self._cache),
+            "cache_hits": EmbeddingCacheCounter.value({"result": "hit"}),
+            "cache_misses": EmbeddingCacheCounter.value({"result": "miss"}),
+            "pending": self._pending.qsize(),
+        }
+
+
+# 全局共享的嵌入服务（延迟加载）
+EmbeddingService: Embedding = Embedding()
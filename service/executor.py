@@ -0,0 +1,32 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+# 嵌入计算、Chroma 读写等阻塞操作统一放到有界线程池，避免阻塞事件循环
+BLOCKING_WORKERS: int = int(os.getenv("BLOCKING_WORKERS", "4"))
+BlockingExecutor: ThreadPoolExecutor = ThreadPoolExecutor(
+    max_workers=BLOCKING_WORKERS,
+    thread_name_prefix="blocking"
+)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在有界线程池中执行阻塞函数
+
+    Args:
+        func: 阻塞函数
+        *args: 位置参数
+        **kwargs: 关键字参数
+
+    Returns:
+        函数返回值
+    """
+    loop = asyncio.get_running_loop()
+    # 带上当前上下文，线程池中记录的 span 归属到发起请求的追踪
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(BlockingExecutor, functools.partial(context.run, func, *args, **kwargs))
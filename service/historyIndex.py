@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from .chroma import CHROMA_PATH
+
+HISTORY_INDEX_PATH: str = os.getenv("HISTORY_INDEX_PATH", os.path.join(CHROMA_PATH, "history_index.sqlite3"))
+
+
+class HistoryIndex:
+    """Chroma 旁的按用户追加式对话索引
+
+    每条对话按用户分配单调递增的序号 seq，记录 (user_id, seq) -> Chroma 文档ID。
+    读取最近 N 轮时只需按主键倒序取 N 个文档ID，再按ID从 Chroma 取回，不必扫描用户全部记录。
+    """
+
+    def __init__(self, path: str = HISTORY_INDEX_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    user_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    timestamp TEXT,
+                    PRIMARY KEY (user_id, seq)
+                ) WITHOUT ROWID
+            """)
+            # 已建立索引的用户，用于区分“没有历史”和“旧数据尚未回填”
+            self._conn.execute("CREATE TABLE IF NOT EXISTS indexed_users (user_id TEXT PRIMARY KEY)")
+
+    def is_indexed(self, user_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM indexed_users WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None
+
+    def backfill(self, user_id: str, rows: Iterable[Tuple[str, str]]) -> None:
+        """为旧数据回填索引
+
+        Args:
+            user_id: 用户ID
+            rows: 按时间顺序排列的 (文档ID, 时间戳)
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM indexed_users WHERE user_id = ?", (user_id,)).fetchone():
+                    self._conn.execute("COMMIT")
+                    return
+                start = self._next_seq(user_id)
+                self._conn.executemany(
+                    "INSERT INTO turns (user_id, seq, doc_id, timestamp) VALUES (?, ?, ?, ?)",
+                    [(user_id, start + i, doc_id, timestamp) for i, (doc_id, timestamp) in enumerate(rows)]
+                )
+                self._conn.execute("INSERT INTO indexed_users (user_id) VALUES (?)", (user_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _next_seq(self, user_id: str) -> int:
+        row = self._conn.execute("SELECT MAX(seq) FROM turns WHERE user_id = ?", (user_id,)).fetchone()
+        return (row[0] or 0) + 1
+
+    def next_seq(self, user_id: str) -> int:
+        with self._lock:
+            return self._next_seq(user_id)
+
+    def append(self, user_id: str, doc_id: str, timestamp: str, seq: Optional[int] = None) -> int:
+        """追加一条对话，返回其序号"""
+        with self._lock:
+            # 多个进程共用索引文件时，分配序号与写入需在同一个写事务内完成
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if seq is None:
+                    seq = self._next_seq(user_id)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO turns (user_id, seq, doc_id, timestamp) VALUES (?, ?, ?, ?)",
+                    (user_id, seq, doc_id, timestamp)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return seq
+
+    def recent(self, user_id: str, limit: int) -> List[str]:
+        """按从新到旧返回最近 limit 条对话的文档ID"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id FROM turns WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM turns WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0]
+
+    def remove(self, user_id: str, doc_ids: Optional[List[str]] = None) -> None:
+        """删除用户的索引记录，不传 doc_ids 时删除该用户全部记录"""
+        with self._lock:
+            if doc_ids is None:
+                self._conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+            else:
+                self._conn.executemany(
+                    "DELETE FROM turns WHERE user_id = ? AND doc_id = ?",
+                    [(user_id, doc_id) for doc_id in doc_ids]
+                )
+
+    def users_with_at_least(self, min_turns: int) -> List[Tuple[str, int]]:
+        """返回对话条数不少于 min_turns 的用户及其条数，按条数从多到少排列"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, COUNT(*) AS turns FROM turns GROUP BY user_id HAVING turns >= ? "
+                "ORDER BY turns DESC",
+                (min_turns,)
+            ).fetchall()
+        return [(row[0], row[1]) for row in rows]
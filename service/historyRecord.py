@@ -0,0 +1,72 @@
+"""对话记录的存储格式
+
+新格式（format=2）：page_content 只保存用户问题，文档向量就是问题向量；回答、时间戳等存为元数据字段，
+读取时不必解析 JSON，去重时可以直接复用库中的向量。
+旧格式：page_content 为 {"user", "bot", "timestamp"} 的 JSON 字符串，整体嵌入。
+读取时两种格式都兼容，旧数据可通过 python -m service.migrate --convert-records 转换。
+"""
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+RECORD_FORMAT = 2
+
+
+class HistoryRecord:
+    """热路径上使用的轻量对话记录，字段与 ChatHistoryConstant 一致"""
+
+    __slots__ = ("user", "bot", "timestamp")
+
+    def __init__(self, user: str, bot: str, timestamp: str) -> None:
+        self.user = user
+        self.bot = bot
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        return f"HistoryRecord(user={self.user!r}, bot={self.bot!r}, timestamp={self.timestamp!r})"
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, HistoryRecord) and \
+            (self.user, self.bot, self.timestamp) == (other.user, other.bot, other.timestamp)
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"user": self.user, "bot": self.bot, "timestamp": self.timestamp}
+
+    @classmethod
+    def from_row(cls, document: Optional[str], metadata: Optional[Dict[str, Any]]) -> Optional["HistoryRecord"]:
+        """从数据库中的一行构建记录，无法解析的旧数据返回 None"""
+        metadata = metadata or {}
+        if is_structured(metadata):
+            return cls(document or "", metadata.get("bot") or "", metadata.get("timestamp") or "")
+        try:
+            data = json.loads(document or "")
+            return cls(data.get("user") or "", data.get("bot") or "", data.get("timestamp") or "")
+        except (ValueError, AttributeError):
+            return None
+
+
+def is_structured(metadata: Optional[Dict[str, Any]]) -> bool:
+    """是否为新格式的对话记录"""
+    return (metadata or {}).get("format") == RECORD_FORMAT
+
+
+def record_metadata(user_id: str, bot: Optional[str], timestamp: str, seq: int) -> Dict[str, Any]:
+    """新格式对话记录的元数据（Chroma 元数据不支持 None）"""
+    return {
+        "timestamp": timestamp,
+        "type": "conversation",
+        "user_id": user_id,
+        "seq": seq,
+        "bot": bot or "",
+        "format": RECORD_FORMAT,
+    }
+
+
+def parse_rows(documents: Sequence[Optional[str]],
+               metadatas: Sequence[Optional[Dict[str, Any]]]) -> List[HistoryRecord]:
+    """批量解析数据库返回的行，跳过无法解析的旧数据"""
+    records: List[HistoryRecord] = []
+    for document, metadata in zip(documents, metadatas):
+        record = HistoryRecord.from_row(document, metadata)
+        if record is not None:
+            records.append(record)
+    return records
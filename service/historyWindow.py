@@ -0,0 +1,93 @@
+import os
+from typing import List, Optional, Tuple
+
+from langchain.memory import ConversationBufferMemory
+
+from constant.chatRequest import ChatHistoryConstant
+from .metrics import Metrics, SIZE_BUCKETS
+
+# 提示中对话历史的字符预算（中文场景下约等于 token 数）
+HISTORY_CHAR_BUDGET: int = int(os.getenv("HISTORY_CHAR_BUDGET", "3000"))
+# 始终保留的最近对话轮数
+HISTORY_RECENT_TURNS: int = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+# 额外召回的与当前问题最相关的较早对话轮数
+HISTORY_RELATED_TURNS: int = int(os.getenv("HISTORY_RELATED_TURNS", "3"))
+# 摘要最多占用预算的比例
+SUMMARY_BUDGET_RATIO: float = 0.25
+
+HistoryCharsHistogram = Metrics.histogram("chat_history_chars", "提示中对话历史的字符数", SIZE_BUCKETS)
+HistoryTurnsHistogram = Metrics.histogram("chat_history_turns", "提示中包含的对话轮数", (0, 1, 2, 4, 8, 16, 32))
+
+
+class HistoryWindow:
+    """按字符预算组装提示中的对话历史：历史摘要 + 最近 N 轮 + 与当前问题最相关的较早轮次"""
+
+    def __init__(self, char_budget: int = HISTORY_CHAR_BUDGET, recent_turns: int = HISTORY_RECENT_TURNS,
+                 related_turns: int = HISTORY_RELATED_TURNS) -> None:
+        self.char_budget = char_budget
+        self.recent_turns = recent_turns
+        self.related_turns = related_turns
+
+    @staticmethod
+    def memory_turns(memory: ConversationBufferMemory) -> List[Tuple[str, str]]:
+        """把记忆中的消息按 (用户, 回复) 两两配对"""
+        messages = memory.chat_memory.messages
+        return [(str(messages[i].content), str(messages[i + 1].content))
+                for i in range(0, len(messages) - 1, 2)]
+
+    @staticmethod
+    def _format_turn(user: str, bot: Optional[str]) -> str:
+        return f"用户: {user}\n回复: {bot or ''}\n"
+
+    def assemble(self, recent: List[Tuple[str, str]], related: Optional[List[ChatHistoryConstant]] = None,
+                 summary: Optional[str] = None) -> str:
+        """组装对话历史文本
+
+        Args:
+            recent: 按时间顺序排列的最近对话 (用户, 回复)
+            related: 与当前问题语义相近的较早对话
+            summary: 用户历史摘要
+
+        Returns:
+            str: 不超过字符预算的对话历史
+        """
+        remaining = self.char_budget
+        sections: List[str] = []
+
+        if summary:
+            summary = summary[:int(self.char_budget * SUMMARY_BUDGET_RATIO)]
+            sections.append(f"历史摘要：\n{summary}\n")
+            remaining -= len(sections[-1])
+
+        # 最近对话从新到旧放入，超出预算即停止
+        recent_lines: List[str] = []
+        seen = set()
+        for user, bot in reversed(recent[-self.recent_turns:] if self.recent_turns else []):
+            line = self._format_turn(user, bot)
+            if len(line) > remaining:
+                break
+            recent_lines.insert(0, line)
+            seen.add(user)
+            remaining -= len(line)
+
+        related_lines: List[str] = []
+        for item in related or []:
+            if item.user in seen:
+                continue
+            line = self._format_turn(item.user, item.bot)
+            if len(line) > remaining:
+                break
+            related_lines.append(line)
+            seen.add(item.user)
+            remaining -= len(line)
+
+        if related_lines:
+            sections.append("相关的较早对话：\n" + "".join(related_lines))
+        if recent_lines:
+            sections.append("最近对话：\n" + "".join(recent_lines))
+        turns = len(recent_lines) + len(related_lines)
+
+        text = "\n".join(sections)
+        HistoryCharsHistogram.observe(len(text))
+        HistoryTurnsHistogram.observe(turns)
+        return text
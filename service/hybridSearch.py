@@ -0,0 +1,163 @@
+"""BM25 + 向量混合检索
+
+向量检索（all-MiniLM-L6-v2）擅长语义相近的问法，但对中文与订单号、SKU 编码等精确关键词不敏感；
+关键词索引按 BM25 命中原始关键词。两路各取候选后，得分分别归一化到 [0, 1] 再按权重相加。
+两路都支持按 store_id、user_id 过滤：user_id 必须一致，store_id 一致或文档未指定店铺（各店铺共用）。
+
+已有数据（或经 migrate 转换过的记录）需重建一次关键词索引：
+运行: python -m service.hybridSearch --rebuild [集合名称 ...]
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from .chroma import ChromaService, KNOWLEDGE_COLLECTION
+from .embedding import EmbeddingService
+from .keywordIndex import KeywordIndex, KeywordIndexService
+from .log import get_logger
+from .tracing import traced
+
+logger = get_logger(__name__)
+
+# 关键词得分的权重，向量得分权重为 1 - HYBRID_KEYWORD_WEIGHT
+HYBRID_KEYWORD_WEIGHT: float = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "0.5"))
+# 历史对话召回是否使用混合检索
+HYBRID_SEARCH_ENABLED: bool = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+# 每一路取回的候选数为 k 的倍数
+HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "4"))
+
+
+def _normalize(scores: Dict[str, float]) -> Dict[str, float]:
+    """按最大值与最小值把得分缩放到 [0, 1]，只有一个候选时记为 1"""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high - low <= 1e-12:
+        return {doc_id: 1.0 for doc_id in scores}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in scores.items()}
+
+
+class HybridRetriever:
+    """在带关键词索引的 Chroma 集合上做混合检索"""
+
+    def __init__(self, keyword_index: KeywordIndex = None, embedding_function: Any = None,
+                 keyword_weight: float = HYBRID_KEYWORD_WEIGHT, candidates: int = HYBRID_CANDIDATES) -> None:
+        self.keyword_index: KeywordIndex = keyword_index or KeywordIndexService
+        self.embedding_function: Any = embedding_function or EmbeddingService
+        self.keyword_weight = keyword_weight
+        self.candidates = max(1, candidates)
+
+    @staticmethod
+    def _store_matches(metadata: Optional[Dict[str, Any]], store_id: Optional[str]) -> bool:
+        value = (metadata or {}).get("store_id")
+        return store_id is None or value is None or str(value) == store_id
+
+    def _vector_hits(self, collection: Any, query_vector: List[float], fetch: int, store_id: Optional[str],
+                     user_id: Optional[str]) -> Tuple[Dict[str, float], Dict[str, Tuple[str, Dict[str, Any]]]]:
+        result = collection._collection.query(query_embeddings=[query_vector], n_results=fetch,
+                                              # 店铺需要兼容未指定店铺的文档，取回后再过滤
+                                              where={"user_id": user_id} if user_id is not None else None,
+                                              include=["documents", "metadatas", "distances"])
+        scores: Dict[str, float] = {}
+        rows: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for doc_id, document, metadata, distance in zip(result["ids"][0], result["documents"][0],
+                                                        result["metadatas"][0], result["distances"][0]):
+            if not self._store_matches(metadata, store_id):
+                continue
+            # 距离越小越相关，取负数后与关键词得分同向
+            scores[doc_id] = -float(distance)
+            rows[doc_id] = (document, metadata or {})
+        return scores, rows
+
+    @traced("hybrid_search")
+    def search(self, collection: Any, query: str, k: int = 4, store_id: Optional[str] = None,
+               user_id: Optional[str] = None, query_vector: Optional[List[float]] = None) -> List[Document]:
+        """混合检索
+
+        Args:
+            collection: 带关键词索引的 Chroma 集合（ChromaService.collection 返回的集合）
+            query: 查询文本
+            k: 返回条数
+            store_id: 店铺ID过滤
+            user_id: 用户ID过滤
+            query_vector: 已计算好的查询向量，传入时不再重复嵌入
+
+        Returns:
+            List[Document]: 按融合得分从高到低排列的文档（id 为文档ID），metadata 中附带 hybrid_score
+        """
+        if k <= 0:
+            return []
+        fetch = k * self.candidates
+        if query_vector is None:
+            query_vector = self.embedding_function.embed_query(query)
+        vector_scores, rows = self._vector_hits(collection, query_vector, fetch, store_id, user_id)
+
+        keyword_scores: Dict[str, float] = {}
+        try:
+            keyword_scores = dict(self.keyword_index.search(collection._collection.name, query, fetch,
+                                                            store_id=store_id, user_id=user_id))
+        except Exception:
+            # 关键词索引不可用时退回纯向量检索
+            logger.exception("关键词检索失败")
+
+        vector_norm = _normalize(vector_scores)
+        keyword_norm = _normalize(keyword_scores)
+        fused = {doc_id: self.keyword_weight * keyword_norm.get(doc_id, 0.0)
+                 + (1 - self.keyword_weight) * vector_norm.get(doc_id, 0.0)
+                 for doc_id in {*vector_norm, *keyword_norm}}
+        top = sorted(fused, key=fused.get, reverse=True)[:k]
+
+        missing = [doc_id for doc_id in top if doc_id not in rows]
+        if missing:
+            # 只由关键词命中的文档再按ID取回内容
+            result = collection._collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, document, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+                rows[doc_id] = (document, metadata or {})
+        return [Document(id=doc_id, page_content=rows[doc_id][0],
+                         metadata={**rows[doc_id][1], "hybrid_score": fused[doc_id]})
+                for doc_id in top if doc_id in rows]
+
+    def search_knowledge(self, query: str, k: int = 4, store_id: Optional[str] = None) -> List[Document]:
+        """检索店铺可用的知识库文档"""
+        return self.search(ChromaService.knowledge(), query, k=k, store_id=store_id)
+
+    def rebuild(self, collection: Any, batch_size: int = 1000) -> int:
+        """按集合中的现有文档重建关键词索引，返回写入的文档数"""
+        name = collection._collection.name
+        self.keyword_index.clear(name)
+        all_ids: List[str] = collection._collection.get(include=[])["ids"]
+        for start in range(0, len(all_ids), batch_size):
+            batch = collection._collection.get(ids=all_ids[start:start + batch_size],
+                                               include=["documents", "metadatas"])
+            self.keyword_index.add(name, batch["ids"], batch["documents"], batch["metadatas"])
+        return len(all_ids)
+
+
+# 使用共享关键词索引与嵌入模型的混合检索
+HybridSearchService: HybridRetriever = HybridRetriever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="重建 Chroma 集合的关键词索引")
+    parser.add_argument("--rebuild", action="store_true", help="按集合中的现有文档重建关键词索引")
+    parser.add_argument("collections", nargs="*", help="集合名称，默认为知识库与全部对话集合")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+    names = args.collections or [KNOWLEDGE_COLLECTION, *(c._collection.name
+                                                         for c in ChromaService.conversation_collections())]
+    stats: Dict[str, Any] = {}
+    start = time.perf_counter()
+    for name in names:
+        stats[name] = HybridSearchService.rebuild(ChromaService.collection(name))
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""知识库增量导入
+
+按文件与分段内容哈希判断是否需要更新：未变化的文件直接跳过，变化的文件只写入新增分段、删除消失的分段，
+被删除的文件对应分段全部移除。分段使用稳定ID写入独立的 knowledge 集合，不影响对话记录。
+
+运行: python -m service.ingest [--data data] [--workers 4] [--batch-size 256]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from .chroma import CHROMA_PATH, DATA_PATH, KNOWLEDGE_COLLECTION, ChromaService, delete_ids, upsert_vectors
+from .embedding import EmbeddingService
+
+INGEST_MANIFEST_PATH: str = os.path.join(CHROMA_PATH, "ingest_manifest.sqlite3")
+
+# 子进程内加载的模型
+_worker_model: Any = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    """子进程初始化：每个进程只加载一次模型，并限制线程数避免进程间争抢 CPU"""
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_model.encode(texts, show_progress_bar=False).tolist()
+
+
+class _Done:
+    """与 Future 接口一致的已完成结果"""
+
+    def __init__(self, value: Any) -> None:
+        self._value = value
+
+    def result(self) -> Any:
+        return self._value
+
+
+class Manifest:
+    """记录已导入文件的哈希与分段ID"""
+
+    def __init__(self, path: str = INGEST_MANIFEST_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL
+            )
+        """)
+
+    def all(self) -> Dict[str, Tuple[str, List[str]]]:
+        rows = self._conn.execute("SELECT path, sha256, chunk_ids FROM files").fetchall()
+        return {path: (sha256, json.loads(chunk_ids)) for path, sha256, chunk_ids in rows}
+
+    def put(self, path: str, sha256: str, chunk_ids: List[str]) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO files (path, sha256, chunk_ids) VALUES (?, ?, ?)",
+                           (path, sha256, json.dumps(chunk_ids)))
+
+    def remove(self, path: str) -> None:
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def commit(self) -> None:
+        self._conn.commit()
+
+
+class KnowledgeIngestor:
+    """知识库增量导入流水线"""
+
+    def __init__(self, data_path: str = DATA_PATH, collection: Any = None, manifest: Optional[Manifest] = None,
+                 workers: int = 0, batch_size: int = 256, glob_suffix: str = ".md") -> None:
+        self.data_path = data_path
+        self.collection = collection
+        self.manifest = manifest or Manifest()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.glob_suffix = glob_suffix
+        # 与 Chroma.split_text 保持相同的分段参数
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=300,
+            chunk_overlap=100,
+            length_function=len,
+            add_start_index=True,
+        )
+
+    def _files(self) -> Iterator[str]:
+        for root, _, names in os.walk(self.data_path):
+            for name in sorted(names):
+                if name.endswith(self.glob_suffix):
+                    yield os.path.relpath(os.path.join(root, name), self.data_path)
+
+    @staticmethod
+    def chunk_id(path: str, text: str) -> str:
+        """分段的稳定ID：同一文件内内容相同的分段ID不变"""
+        return hashlib.sha1(f"{path}\0{text}".encode("utf-8")).hexdigest()
+
+    def _split(self, path: str, text: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+        chunks: Dict[str, Tuple[str, str, Dict[str, Any]]] = {}
+        for document in self.splitter.create_documents([text], metadatas=[{"source": path}]):
+            chunk_id = self.chunk_id(path, document.page_content)
+            metadata = dict(document.metadata, type="knowledge")
+            chunks.setdefault(chunk_id, (chunk_id, document.page_content, metadata))
+        return list(chunks.values())
+
+    def _embedder(self) -> Tuple[Any, Any]:
+        """返回 (提交批次的函数, 进程池)；workers 为 0 时在当前进程用共享嵌入服务计算"""
+        if self.workers <= 0:
+            return (lambda texts: _Done(EmbeddingService.embed_documents(texts))), None
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(EmbeddingService.model_name, threads))
+        return (lambda texts: pool.submit(_embed_batch, texts)), pool
+
+    def run(self) -> Dict[str, Any]:
+        """执行一次增量导入，返回统计信息"""
+        collection = self.collection if self.collection is not None else ChromaService.collection(KNOWLEDGE_COLLECTION)
+        start = time.perf_counter()
+        stats = {"files": 0, "skipped": 0, "changed": 0, "removed_files": 0,
+                 "chunks_added": 0, "chunks_deleted": 0}
+        known = self.manifest.all()
+        seen = set()
+        submit, pool = self._embedder()
+        # 已提交嵌入、尚未写入的批次：(future, ids, texts, metadatas)
+        in_flight: List[Tuple[Any, List[str], List[str], List[Dict[str, Any]]]] = []
+        batch: Tuple[List[str], List[str], List[Dict[str, Any]]] = ([], [], [])
+
+        def flush_batch() -> None:
+            if batch[0]:
+                in_flight.append((submit(list(batch[1])), list(batch[0]), list(batch[1]), list(batch[2])))
+                for part in batch:
+                    part.clear()
+            # 限制在途批次数，保持流式处理、控制内存
+            while len(in_flight) > max(1, self.workers) * 2:
+                write(in_flight.pop(0))
+
+        def write(item: Tuple[Any, List[str], List[str], List[Dict[str, Any]]]) -> None:
+            future, ids, texts, metadatas = item
+            upsert_vectors(collection, ids, future.result(), texts, metadatas)
+            stats["chunks_added"] += len(ids)
+
+        try:
+            for path in self._files():
+                stats["files"] += 1
+                seen.add(path)
+                with open(os.path.join(self.data_path, path), "rb") as f:
+                    raw = f.read()
+                sha256 = hashlib.sha256(raw).hexdigest()
+                previous = known.get(path)
+                if previous is not None and previous[0] == sha256:
+                    stats["skipped"] += 1
+                    continue
+
+                stats["changed"] += 1
+                chunks = self._split(path, raw.decode("utf-8", errors="ignore"))
+                old_ids = set(previous[1]) if previous else set()
+                new_ids = [chunk_id for chunk_id, _, _ in chunks]
+                stale = list(old_ids - set(new_ids))
+                if stale:
+                    delete_ids(collection, stale)
+                    stats["chunks_deleted"] += len(stale)
+                for chunk_id, text, metadata in chunks:
+                    if chunk_id in old_ids:
+                        continue
+                    batch[0].append(chunk_id)
+                    batch[1].append(text)
+                    batch[2].append(metadata)
+                    if len(batch[0]) >= self.batch_size:
+                        flush_batch()
+                self.manifest.put(path, sha256, new_ids)
+
+            for path, (_, chunk_ids) in known.items():
+                if path not in seen:
+                    if chunk_ids:
+                        delete_ids(collection, chunk_ids)
+                    stats["chunks_deleted"] += len(chunk_ids)
+                    stats["removed_files"] += 1
+                    self.manifest.remove(path)
+
+            flush_batch()
+            while in_flight:
+                write(in_flight.pop(0))
+            self.manifest.commit()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = round(elapsed, 3)
+        stats["docs_per_second"] = round(stats["files"] / elapsed, 1) if elapsed else 0.0
+        stats["chunks_per_second"] = round(stats["chunks_added"] / elapsed, 1) if elapsed else 0.0
+        return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="增量导入知识库文档")
+    parser.add_argument("--data", default=DATA_PATH, help="文档目录")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="嵌入计算进程数，0 表示当前进程")
+    parser.add_argument("--batch-size", type=int, default=256, help="每批嵌入的分段数")
+    args = parser.parse_args()
+    stats = KnowledgeIngestor(data_path=args.data, workers=args.workers, batch_size=args.batch_size).run()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
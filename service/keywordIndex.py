@@ -0,0 +1,252 @@
+"""Chroma 旁的关键词倒排索引（SQLite FTS5，BM25 排序）
+
+all-MiniLM-L6-v2 对中文与订单号、SKU 编码等精确关键词不敏感，关键词索引按 BM25 召回原始关键词，
+与向量检索结果在 hybridSearch 中融合。每个文档的分词结果写入 tokens 列，所属集合、店铺、用户
+写入 scope 列（取哈希后的前缀标记），查询时在 FTS 内按 scope 限定范围，不会先对其他集合或用户的
+文档打分再过滤。写入共用一个连接并加锁，查询按线程使用各自的只读连接，WAL 模式下读写互不阻塞。
+
+已有数据（或经 migrate 迁移、转换过的记录）需重建一次索引：python -m service.hybridSearch --rebuild
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .chroma import CHROMA_PATH
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+KEYWORD_INDEX_PATH: str = os.getenv("KEYWORD_INDEX_PATH", os.path.join(CHROMA_PATH, "keyword_index.sqlite3"))
+# 索引文件的内存映射大小（MB），查询直接读取映射的页面，不经过 read 系统调用
+KEYWORD_INDEX_MMAP_MB: int = int(os.getenv("KEYWORD_INDEX_MMAP_MB", "256"))
+
+# 连续的字母数字（可包含 - _ . 连接的订单号、SKU 编码）或连续的汉字
+_TOKEN = re.compile(r"[0-9A-Za-z]+(?:[-_.][0-9A-Za-z]+)*|[\u3400-\u4dbf\u4e00-\u9fff]+")
+_SEPARATOR = re.compile(r"[-_.]")
+# 未指定店铺（各店铺共用）的文档的店铺标记
+_ALL_STORES = "sall"
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按相邻两字切分，订单号、SKU 等字母数字整体保留（小写），带连接符的同时保留各段"""
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(text or ""):
+        word = match.group(0)
+        if word[0].isascii():
+            word = word.lower()
+            tokens.append(word)
+            if _SEPARATOR.search(word):
+                tokens.extend(part for part in _SEPARATOR.split(word) if part)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def _mark(prefix: str, value: Any) -> str:
+    """集合、店铺、用户的范围标记：前缀 + 哈希，只含字母数字，不会被分词器切开"""
+    return prefix + hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def scope_text(collection: str, metadata: Optional[Dict[str, Any]]) -> str:
+    """文档的 scope 列内容"""
+    metadata = metadata or {}
+    store_id, user_id = metadata.get("store_id"), metadata.get("user_id")
+    marks = [_mark("c", collection), _mark("s", store_id) if store_id is not None else _ALL_STORES]
+    if user_id is not None:
+        marks.append(_mark("u", user_id))
+    return " ".join(marks)
+
+
+class KeywordIndex:
+    """Chroma 旁的关键词倒排索引
+
+    文档写入 Chroma 时同步写入分词结果，按 (集合, 文档ID) 覆盖更新；store_id、user_id 取自文档元数据，
+    查询时在 FTS 内按范围限定。索引文件按 KEYWORD_INDEX_MMAP_MB 内存映射，多个进程可共用同一个文件。
+    """
+
+    def __init__(self, path: str = KEYWORD_INDEX_PATH, mmap_mb: int = KEYWORD_INDEX_MMAP_MB) -> None:
+        self.path = path
+        self.mmap_mb = mmap_mb
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._readers = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_mb * 1024 * 1024}")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """写入用的连接，第一次使用时才打开索引文件并建表"""
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = self._connect()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    doc_id TEXT NOT NULL,
+                    store_id TEXT,
+                    user_id TEXT,
+                    UNIQUE (collection, doc_id)
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(terms)")]
+            if columns and "scope" not in columns:
+                # 旧版索引没有 scope 列，清空后需重建
+                logger.warning("关键词索引格式已更新，已清空旧索引，请运行 python -m service.hybridSearch --rebuild",
+                               extra={"path": self.path})
+                conn.execute("DROP TABLE terms")
+                conn.execute("DELETE FROM documents")
+            # 分词结果以空格连接写入，tokenchars 保证订单号中的连接符不会被再次切开
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5("
+                         "tokens, scope, tokenize = \"unicode61 remove_diacritics 0 tokenchars '-_.'\")")
+            self._conn = conn
+        return self._conn
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """查询用的连接，每个线程一个，不与写入争用锁；内存数据库只能共用写入连接"""
+        if self._conn is None:
+            with self._lock:
+                self.conn
+        if self.path == ":memory:":
+            return self._conn
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+            self._readers.conn = conn
+        return conn
+
+    @staticmethod
+    def document_text(document: str, metadata: Optional[Dict[str, Any]]) -> str:
+        """参与索引的文本：对话记录的文档只有问题，回答在元数据中，一并索引"""
+        bot = (metadata or {}).get("bot")
+        return f"{document or ''}\n{bot}" if bot else document or ""
+
+    def add(self, collection: str, ids: List[str], documents: List[str],
+            metadatas: Optional[List[Optional[Dict[str, Any]]]] = None) -> None:
+        """写入或覆盖文档
+
+        Args:
+            collection: Chroma 集合名称
+            ids: 文档ID
+            documents: 文档内容
+            metadatas: 文档元数据
+        """
+        metadatas = metadatas or [None] * len(ids)
+        rows = [(doc_id, " ".join(tokenize(self.document_text(document, metadata))),
+                 scope_text(collection, metadata), metadata or {})
+                for doc_id, document, metadata in zip(ids, documents, metadatas)]
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for doc_id, tokens, scope, metadata in rows:
+                    row_id = conn.execute(
+                        "INSERT INTO documents (collection, doc_id, store_id, user_id) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (collection, doc_id) DO UPDATE SET store_id = excluded.store_id, "
+                        "user_id = excluded.user_id RETURNING id",
+                        (collection, doc_id, metadata.get("store_id"), metadata.get("user_id"))
+                    ).fetchone()[0]
+                    conn.execute("DELETE FROM terms WHERE rowid = ?", (row_id,))
+                    conn.execute("INSERT INTO terms (rowid, tokens, scope) VALUES (?, ?, ?)", (row_id, tokens, scope))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, collection: str, ids: Iterable[str]) -> None:
+        """删除文档"""
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for doc_id in ids:
+                    row = conn.execute("DELETE FROM documents WHERE collection = ? AND doc_id = ? RETURNING id",
+                                       (collection, doc_id)).fetchone()
+                    if row is not None:
+                        conn.execute("DELETE FROM terms WHERE rowid = ?", (row[0],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def clear(self, collection: str) -> None:
+        """删除集合的全部索引，重建前调用"""
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM terms WHERE rowid IN (SELECT id FROM documents WHERE collection = ?)",
+                             (collection,))
+                conn.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def search(self, collection: str, query: str, k: int = 10, store_id: Optional[str] = None,
+               user_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        """按 BM25 返回最相关的文档
+
+        Args:
+            collection: Chroma 集合名称
+            query: 查询文本
+            k: 返回条数
+            store_id: 只返回该店铺或未指定店铺（各店铺共用）的文档
+            user_id: 只返回该用户的文档
+
+        Returns:
+            List[Tuple[str, float]]: (文档ID, BM25 得分)，得分越高越相关
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or k <= 0:
+            return []
+        # 范围条件放进 MATCH，FTS 只对集合、店铺、用户范围内的文档打分；scope 列不参与 BM25 得分
+        scope = [_mark("c", collection)]
+        if store_id is not None:
+            scope.append(f"({_mark('s', store_id)} OR {_ALL_STORES})")
+        if user_id is not None:
+            scope.append(_mark("u", user_id))
+        terms = " OR ".join(f'"{token}"' for token in tokens)
+        match = f"scope : ({' AND '.join(scope)}) AND tokens : ({terms})"
+        # documents 表上的条件防止哈希碰撞
+        sql = ("SELECT d.doc_id, -bm25(terms, 1.0, 0.0) AS score FROM terms JOIN documents d ON d.id = terms.rowid "
+               "WHERE terms MATCH ? AND d.collection = ?")
+        params: List[Any] = [match, collection]
+        if store_id is not None:
+            sql += " AND (d.store_id = ? OR d.store_id IS NULL)"
+            params.append(store_id)
+        if user_id is not None:
+            sql += " AND d.user_id = ?"
+            params.append(user_id)
+        sql += " ORDER BY score DESC LIMIT ?"
+        params.append(k)
+        with self._lock if self.path == ":memory:" else nullcontext():
+            rows = self.reader.execute(sql, params).fetchall()
+        return [(row[0], row[1]) for row in rows]
+
+    def count(self, collection: Optional[str] = None) -> int:
+        with self._lock:
+            if collection is None:
+                row = self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+            else:
+                row = self.conn.execute("SELECT COUNT(*) FROM documents WHERE collection = ?",
+                                        (collection,)).fetchone()
+        return row[0]
+
+
+# 进程内共用的关键词索引，索引文件在第一次使用时才打开
+KeywordIndexService: KeywordIndex = KeywordIndex()
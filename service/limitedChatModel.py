@@ -0,0 +1,45 @@
+"""按单次模型调用占用大模型并发名额的聊天模型包装
+
+一次 agent 运行包含多次模型调用与工具调用。名额在每次模型调用期间全程占用（流式调用直到最后一个片段），
+两次调用之间工具查询业务接口时不占名额，同样的并发上限下可以同时推进更多对话。
+"""
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+
+class LimitedChatModel(BaseChatModel):
+    """每次生成前占用限流名额，生成结束（流式时为最后一个片段之后）归还
+
+    直接调用被包装模型的 _generate/_stream，回调（追踪、token 统计）只由外层触发一次。
+    """
+
+    chat_model: Any
+    limiter: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return self.chat_model._llm_type
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        with self.limiter.hold():
+            return self.chat_model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        async with self.limiter.ahold():
+            return await self.chat_model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        with self.limiter.hold():
+            yield from self.chat_model._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async with self.limiter.ahold():
+            async for chunk in self.chat_model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
@@ -1,39 +1,84 @@
 import json
 import os
+import threading
+import time
 from langchain_community.chat_models import ChatTongyi
-from langchain.agents import AgentExecutor, create_react_agent
+from langchain.agents import AgentExecutor
 from .tools import Tools
-from .prompt import ChatPrompt
-from typing import Optional, Dict, List, Any, Union
+from .prompt import ChatPrompt, DIRECT_SYSTEM_PROMPT
+from .executor import run_blocking
+from .agentPool import AgentPool
+from .memoryCache import MemoryCache
+from .historyWindow import HistoryWindow
+from .streaming import FinalAnswerStreamer
+from .answerCache import AnswerCache, ANSWER_CACHE_ENABLED, cacheable_question
+from .embedding import EmbeddingService
+from .log import get_logger
+from .limitedChatModel import LimitedChatModel
+from .requestScheduler import LlmLimiter
+from .router import QuestionRouter, ROUTER_ENABLED, RouteDecision
+from .tracing import current_trace, span, trace_config, traced
+from typing import Optional, Dict, List, Any, Union, AsyncIterator, Tuple
 from langchain.memory import ConversationBufferMemory
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import PromptTemplate
 from constant.chatRequest import ChatHistoryConstant
 
+logger = get_logger(__name__)
 
 class LLM:
     """LLM 模型管理类"""
 
     def __init__(self):
-        # 初始化相关属性
-        self.model: Optional[ChatTongyi] = None
-        self.agent: Any = None
-        self.agent_executor: Optional[AgentExecutor] = None
-        # 用户记忆字典
-        self.user_memories: Dict[str, ConversationBufferMemory] = {}
+        # 初始化相关属性，模型在第一次使用时才创建
+        self._model: Optional[ChatTongyi] = None
+        # agent 使用的包装模型，每次模型调用单独占用限流名额
+        self._limited_model: Optional[LimitedChatModel] = None
+        self._lock = threading.Lock()
+        # 预构建的agent执行器，按提示模板与工具集复用
+        self.agent_pool: AgentPool = AgentPool()
+        self.tools: Optional[List[Any]] = None
+        # 用户记忆缓存（LRU/TTL，按条数和字节数限制）
+        self.user_memories: MemoryCache = MemoryCache()
+        # 提示中对话历史的组装策略
+        self.history_window: HistoryWindow = HistoryWindow()
+        # 按店铺的语义回答缓存
+        self.answer_cache: AnswerCache = AnswerCache()
+        # 大模型调用的全局并发与速率限制
+        self.limiter: LlmLimiter = LlmLimiter()
+        # 简单问题直接回答、其余问题预选工具
+        self.router: QuestionRouter = QuestionRouter()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self) -> ChatTongyi:
+        """获取聊天模型，首次访问时初始化"""
+        if self._model is None:
+            self.init()
+        return self._model
+
+    @model.setter
+    def model(self, value: Any) -> None:
+        self._model = value
 
     def init(self) -> "LLM":
         """初始化 LLM 模型"""
-        # 加载环境变量
-        try:
-            self.model = ChatTongyi(
-                api_key=os.getenv("TONGYI_API_KEY"),
-                model=os.getenv("TONGYI_MODEL", "qwen-max-2025-01-25"),
-            )
-            print("聊天模型初始化成功")
-        except Exception as e:
-            print("聊天模型初始化失败:", e)
-            raise
+        with self._lock:
+            if self._model is not None:
+                return self
+            # 加载环境变量
+            try:
+                self._model = ChatTongyi(
+                    api_key=os.getenv("TONGYI_API_KEY"),
+                    model=os.getenv("TONGYI_MODEL", "qwen-max-2025-01-25"),
+                )
+                logger.info("聊天模型初始化成功")
+            except Exception:
+                logger.exception("聊天模型初始化失败")
+                raise
 
         return self
 
@@ -51,6 +96,15 @@ class LLM:
         if not self.model:
             raise ValueError("模型尚未初始化，请先调用 init() 方法")
 
+        # 调用模型生成回复
+        with self.limiter.hold():
+            response = self.model.invoke(self._build_messages(prompt, system_prompt), config=trace_config())
+
+        return response.content
+
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: Optional[str] = None) -> List[Any]:
+        """构建普通模式的消息列表"""
         messages = []
 
         # 添加系统提示（如果有）
@@ -59,15 +113,21 @@ class LLM:
 
         # 添加用户提示
         messages.append(HumanMessage(content=prompt))
+        return messages
 
-        # 调用模型生成回复
-        response = self.model.invoke(messages)
+    async def agenerate_text(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """generate_text 的异步版本"""
+        if not self.model:
+            raise ValueError("模型尚未初始化，请先调用 init() 方法")
+
+        async with self.limiter.ahold():
+            response = await self.model.ainvoke(self._build_messages(prompt, system_prompt), config=trace_config())
 
         return response.content
 
-    # 创建agent和执行器的辅助方法
+    # 获取agent执行器的辅助方法
     def _create_agent_executor(self, prompt: PromptTemplate, tools: List[Any]) -> AgentExecutor:
-        """创建agent和执行器
+        """从执行器池获取agent执行器，相同提示模板与工具集只构建一次
 
         Args:
             prompt: agent提示模板
@@ -76,23 +136,157 @@ class LLM:
         Returns:
             AgentExecutor: 配置好的agent执行器
         """
-        # 创建agent
-        self.agent = create_react_agent(
-            llm=self.model,
-            tools=tools,
-            prompt=prompt
-        )
-
-        # 配置agent执行器
-        self.agent_executor = AgentExecutor(
-            agent=self.agent,
-            tools=tools,
-            max_iterations=3,
-            verbose=True,
-            handle_parsing_errors=True
-        )
-
-        return self.agent_executor
+        return self.agent_pool.get(self._agent_model(), prompt, tools)
+
+    def _agent_model(self) -> LimitedChatModel:
+        """agent 使用的聊天模型：每次模型调用全程占用名额（流式调用直到最后一个片段），两次调用之间的工具调用不占名额"""
+        model = self.model
+        limited = self._limited_model
+        if limited is None or limited.chat_model is not model:
+            with self._lock:
+                limited = self._limited_model
+                if limited is None or limited.chat_model is not model:
+                    limited = LimitedChatModel(chat_model=model, limiter=self.limiter)
+                    self._limited_model = limited
+        return limited
+
+    def _default_tools(self) -> List[Any]:
+        """默认工具集只创建一次"""
+        if self.tools is None:
+            self.tools = Tools().get()
+        return self.tools
+
+    @traced("load_memory")
+    def _load_memory(
+            self,
+            question: str,
+            user_id: Optional[str],
+            chat_history: Optional[List[ChatHistoryConstant]],
+            chatHistoryStoreService: any
+    ) -> str:
+        """准备用户记忆并按字符预算组装提示中使用的历史记录
+
+        Args:
+            question: 用户问题，用于召回相关的较早对话
+            user_id: 用户ID
+            chat_history: JSON格式的历史记录
+            chatHistoryStoreService: 历史记录服务
+
+        Returns:
+            str: 填入 chat_history 的内容
+        """
+        from_store = False
+        # 如果传入了历史记录（JSON格式），直接使用，且不视为与数据库同步
+        if chat_history is not None and len(chat_history) > 0:
+            memory = MemoryCache.new_memory()
+            try:
+                for msg in chat_history:
+                    memory.save_context({"input": msg.user}, {"output": msg.bot})
+            except Exception:
+                logger.exception("历史记录加载失败", extra={"user_id": user_id})
+            self.user_memories.put(user_id, memory)
+        # 如果没有传入历史记录，优先使用缓存，未命中或已过期时再从Chroma加载
+        elif user_id:
+            from_store = True
+            version = chatHistoryStoreService.history_version(user_id)
+            memory = self.user_memories.get(user_id, version)
+            if memory is None:
+                memory = MemoryCache.new_memory()
+                try:
+                    # 从向量数据库加载历史记录
+                    history: List[ChatHistoryConstant] = chatHistoryStoreService.load_recent_history(
+                        user_id, limit=self.history_window.recent_turns)
+                    # 返回结果为从新到旧，按时间顺序写入记忆
+                    for msg in reversed(history):
+                        memory.save_context({"input": msg.user}, {"output": msg.bot})
+                    self.user_memories.put(user_id, memory, version)
+                except Exception:
+                    logger.exception("从向量数据库加载历史记录失败", extra={"user_id": user_id})
+        else:
+            memory = self.user_memories.peek(user_id)
+            if memory is None:
+                memory = MemoryCache.new_memory()
+                self.user_memories.put(user_id, memory)
+
+        recent = HistoryWindow.memory_turns(memory)
+        related: List[ChatHistoryConstant] = []
+        summary: Optional[str] = None
+        if from_store:
+            summary = chatHistoryStoreService.load_summary(user_id)
+            # 最近窗口已装满时才可能存在更早的对话，此时再按语义召回
+            if len(recent) >= self.history_window.recent_turns:
+                related = chatHistoryStoreService.search_history(user_id, question, k=self.history_window.related_turns)
+
+        chat_history_value = self.history_window.assemble(recent, related, summary)
+        logger.debug("chat_history_value", extra={"user_id": user_id, "chat_history": chat_history_value})
+
+        return chat_history_value
+
+    @staticmethod
+    def _agent_inputs(question: str, user_id: Optional[str], store_id: Optional[str],
+                      chat_history_value: Any) -> Dict[str, Any]:
+        """agent执行时的运行时变量"""
+        return {
+            "input": question,
+            "current_time": ChatPrompt.current_time(),
+            "chat_history": chat_history_value,
+            "user_id": user_id,
+            "store_id": store_id
+        }
+
+    def _save_turn(self, user_id: Optional[str], question: str, output: str, chatHistoryStoreService: any) -> None:
+        """保存一轮对话到用户记忆和向量数据库"""
+        # 不持久化的回放请求也不修改缓存的用户记忆
+        if not getattr(chatHistoryStoreService, "persist", True):
+            return
+        memory = self.user_memories.peek(user_id)
+        if memory is not None:
+            memory.save_context({"input": question}, {"output": output})
+
+        if user_id:
+            expected = chatHistoryStoreService.history_version(user_id)
+            chatHistoryStoreService.save_conversation_later(user_id, question, output)
+            # 记忆已包含本轮对话，同步保存时推进到保存后的版本号，下次请求无需重新加载；
+            # 经写入队列保存时版本号在落库后才推进，届时从数据库重新加载
+            self.user_memories.sync(user_id, expected, chatHistoryStoreService.history_version(user_id))
+        else:
+            self.user_memories.sync(user_id, None, None)
+
+    # 不需要工具的简单问题，一次模型调用直接回答
+    def generate_text_direct(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            chat_history: Optional[List[ChatHistoryConstant]] = None,
+            use_history: bool = True,
+            chatHistoryStoreService: any = None
+    ) -> str:
+        """不经过 ReAct 循环直接回答
+
+        Args:
+            question: 用户问题
+            user_id: 用户ID
+            chat_history: JSON格式的历史记录
+            use_history: 是否使用历史记录
+
+        Returns:
+            str: 模型生成的回复
+        """
+        chat_history_value = ""
+        if use_history:
+            chat_history_value = self._load_memory(question, user_id, chat_history, chatHistoryStoreService)
+        with span("direct"):
+            output = self.generate_text(ChatPrompt().direct(question, chat_history_value), DIRECT_SYSTEM_PROMPT)
+        self._record_turn(user_id, question, output, use_history, chatHistoryStoreService)
+        return output
+
+    def _route(self, question: str, tools: List[Any], question_vector: Optional[List[float]]) -> RouteDecision:
+        """路由失败时退回使用全部工具的 agent"""
+        try:
+            return self.router.route(question, tools, question_vector)
+        except Exception:
+            logger.exception("问题路由失败")
+            return RouteDecision("agent", tools, 0.0)
 
     # 不需要历史记录的agent模式
     def generate_text_agent_without_history(
@@ -121,17 +315,14 @@ class LLM:
         agent_executor = self._create_agent_executor(prompt, tools)
 
         # 直接执行查询，不使用历史记录
-        response = agent_executor.invoke({
-            "input": question,
-            "chat_history": "",
-            "user_id": user_id,
-            "store_id": store_id
-        })
+        with span("agent"):
+            response = agent_executor.invoke(self._agent_inputs(question, user_id, store_id, ""),
+                                             config=trace_config())
         output = response["output"]
 
         # 如果提供了用户ID，保存对话
         if user_id:
-            chatHistoryStoreService.save_conversation(user_id, question, output)
+            chatHistoryStoreService.save_conversation_later(user_id, question, output)
 
         return output
 
@@ -163,56 +354,16 @@ class LLM:
         # 使用辅助方法创建agent执行器
         agent_executor = self._create_agent_executor(prompt, tools)
 
-        # 获取或创建用户记忆
-        if user_id not in self.user_memories:
-            self.user_memories[user_id] = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
-
-        memory = self.user_memories[user_id]
+        chat_history_value = self._load_memory(question, user_id, chat_history, chatHistoryStoreService)
 
-        # 如果传入了历史记录（JSON格式）
-        if chat_history is not None and len(chat_history) > 0:
-            try:
-                # 清空当前记忆并加载历史
-                memory.clear()
-                for msg in chat_history:
-                    memory.save_context({"input": msg.user}, {"output": msg.bot})
-            except Exception as e:
-                print(f"历史记录加载失败: {str(e)}")
-        # 如果没有传入历史记录，尝试从Chroma加载
-        elif user_id:
-            try:
-                # 从向量数据库加载历史记录
-                history: List[ChatHistoryConstant] = chatHistoryStoreService.load_recent_history(user_id)
-                if history:
-                    # 清空当前记忆并加载历史
-                    memory.clear()
-                    for msg in history:
-                        memory.save_context({"input": msg.user}, {"output": msg.bot})
-            except Exception as e:
-                print(f"从向量数据库加载历史记录失败: {str(e)}")
-
-        # 执行带历史记录的查询
-        chat_history_value = memory.load_memory_variables({}).get("chat_history", "")
-        print("chat_history_value", chat_history_value)
-
-        response = agent_executor.invoke({
-            "input": question,
-            "chat_history": chat_history_value,
-            "user_id": user_id,
-            "store_id":store_id
-        })
+        with span("agent"):
+            response = agent_executor.invoke(self._agent_inputs(question, user_id, store_id, chat_history_value),
+                                             config=trace_config())
 
         output = response["output"]
 
-        # 保存更新后的记忆
-        memory.save_context({"input": question}, {"output": output})
-
-        # 将对话保存到向量数据库
-        if user_id:
-            chatHistoryStoreService.save_conversation(user_id, question, output)
+        # 保存更新后的记忆，并将对话保存到向量数据库
+        self._save_turn(user_id, question, output, chatHistoryStoreService)
 
         return output
 
@@ -241,21 +392,304 @@ class LLM:
         Returns:
             str: 模型生成的回复
         """
-        if prompt is None:
-            prompt = ChatPrompt().agent()
+        question_vector = None
+        if self._answer_cacheable(question, prompt, tools, chat_history, chatHistoryStoreService):
+            question_vector = EmbeddingService.embed_query(question)
+            cached = self.answer_cache.lookup(store_id, question_vector)
+            if cached is not None:
+                self._record_turn(user_id, question, cached, use_history, chatHistoryStoreService)
+                return cached
+
+        # 只对默认提示与工具做路由，调用方显式指定时按原样执行
+        routed = ROUTER_ENABLED and prompt is None and tools is None
         if tools is None:
-            tools = Tools().get()
+            tools = self._default_tools()
+        route = "agent"
+        if routed:
+            decision = self._route(question, tools, question_vector)
+            route, tools = decision.route, decision.tools
+        if prompt is None:
+            # 工具说明已渲染进固定的系统消息，按工具集缓存
+            prompt = ChatPrompt().agent(tools)
+
+        trace = current_trace()
+        tool_calls = len(trace.labels("tool")) if trace is not None else 0
+        start = time.perf_counter()
+        with self.router.measure(route):
+            if route == "direct":
+                output = self.generate_text_direct(question=question, user_id=user_id, chat_history=chat_history,
+                                                   use_history=use_history,
+                                                   chatHistoryStoreService=chatHistoryStoreService)
+            elif use_history:
+                output = self.generate_text_agent_with_history(question=question, user_id=user_id,store_id=store_id, chat_history=chat_history,
+                                                               prompt=prompt, tools=tools,
+                                                               chatHistoryStoreService=chatHistoryStoreService)
+            else:
+                output = self.generate_text_agent_without_history(question=question, user_id=user_id,store_id=store_id,
+                                                                  prompt=prompt, tools=tools,
+                                                                  chatHistoryStoreService=chatHistoryStoreService)
+        if question_vector is not None and self._tools_cacheable(tools, trace, tool_calls):
+            self.answer_cache.put(store_id, question, question_vector, output, time.perf_counter() - start)
+        return output
+
+    @staticmethod
+    def _answer_cacheable(question: str, prompt: Optional[PromptTemplate], tools: Optional[List[Any]],
+                          chat_history: Optional[List[ChatHistoryConstant]], chatHistoryStoreService: any) -> bool:
+        """按问题决定是否读写回答缓存：默认提示与工具下、未显式传入历史记录，且问题与用户、订单及上文无关
+
+        use_history 不影响是否缓存，常见问题在使用历史记录时同样命中，命中后照常保存本轮对话；
+        不持久化的回放请求不读写缓存。
+        """
+        return ANSWER_CACHE_ENABLED and prompt is None and tools is None and not chat_history \
+            and cacheable_question(question) and getattr(chatHistoryStoreService, "persist", True)
 
+    @staticmethod
+    def _tools_cacheable(tools: List[Any], trace: Any, before: int) -> bool:
+        """本次生成调用过的工具都标记了 answer_cacheable（结果与用户、订单无关）时才写入回答缓存
+
+        Args:
+            tools: 本次可用的工具
+            trace: 当前请求的追踪，没有追踪时无法得知调用了哪些工具，不写入
+            before: 生成前已记录的工具 span 数
+        """
+        if trace is None:
+            return False
+        called = {labels.get("tool") for labels in trace.labels("tool")[before:]}
+        shared = {tool.name for tool in tools if (getattr(tool, "metadata", None) or {}).get("answer_cacheable")}
+        return called <= shared
+
+    def _record_turn(self, user_id: Optional[str], question: str, output: str, use_history: bool,
+                          chatHistoryStoreService: any) -> None:
+        """按是否使用历史记录保存本轮对话（命中回答缓存或直接回答时）"""
         if use_history:
-            return self.generate_text_agent_with_history(question=question, user_id=user_id,store_id=store_id, chat_history=chat_history,
-                                                         prompt=prompt, tools=tools,
-                                                         chatHistoryStoreService=chatHistoryStoreService)
-        else:
-            return self.generate_text_agent_without_history(question=question, user_id=user_id,store_id=store_id,
-                                                            prompt=prompt, tools=tools,
-                                                            chatHistoryStoreService=chatHistoryStoreService)
+            self._save_turn(user_id, question, output, chatHistoryStoreService)
+        elif user_id:
+            chatHistoryStoreService.save_conversation_later(user_id, question, output)
 
 
-# 初始化llm
-LlmService: LLM = LLM().init()
-print("初始化llm成功")
+    # 异步版本：模型与agent使用 ainvoke，嵌入与Chroma读写放入有界线程池
+    async def agenerate_text_direct(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            chat_history: Optional[List[ChatHistoryConstant]] = None,
+            use_history: bool = True,
+            chatHistoryStoreService: any = None
+    ) -> str:
+        """generate_text_direct 的异步版本"""
+        chat_history_value = ""
+        if use_history:
+            chat_history_value = await run_blocking(self._load_memory, question, user_id, chat_history,
+                                                    chatHistoryStoreService)
+        with span("direct"):
+            output = await self.agenerate_text(ChatPrompt().direct(question, chat_history_value),
+                                               DIRECT_SYSTEM_PROMPT)
+        await run_blocking(self._record_turn, user_id, question, output, use_history, chatHistoryStoreService)
+        return output
+
+    async def agenerate_text_agent_without_history(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            store_id: Optional[str] = None,
+            prompt: PromptTemplate = None,
+            tools: List[Any] = None,
+            chatHistoryStoreService: any = None
+    ) -> str:
+        """generate_text_agent_without_history 的异步版本"""
+        agent_executor = self._create_agent_executor(prompt, tools)
+
+        with span("agent"):
+            response = await agent_executor.ainvoke(self._agent_inputs(question, user_id, store_id, ""),
+                                                    config=trace_config())
+        output = response["output"]
+
+        if user_id:
+            await run_blocking(chatHistoryStoreService.save_conversation_later, user_id, question, output)
+
+        return output
+
+    async def agenerate_text_agent_with_history(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            store_id: Optional[str] = None,
+            chat_history: Optional[List[ChatHistoryConstant]] = None,
+            prompt: PromptTemplate = None,
+            tools: List[Any] = None,
+            chatHistoryStoreService: any = None
+    ) -> str:
+        """generate_text_agent_with_history 的异步版本"""
+        agent_executor = self._create_agent_executor(prompt, tools)
+
+        chat_history_value = await run_blocking(self._load_memory, question, user_id, chat_history,
+                                                chatHistoryStoreService)
+
+        with span("agent"):
+            response = await agent_executor.ainvoke(self._agent_inputs(question, user_id, store_id,
+                                                                       chat_history_value),
+                                                    config=trace_config())
+        output = response["output"]
+
+        await run_blocking(self._save_turn, user_id, question, output, chatHistoryStoreService)
+
+        return output
+
+    async def _aprepare(
+            self,
+            question: str,
+            user_id: Optional[str],
+            store_id: Optional[str],
+            chat_history: Optional[List[ChatHistoryConstant]],
+            prompt: Optional[PromptTemplate],
+            tools: Optional[List[Any]],
+            use_history: bool,
+            chatHistoryStoreService: any
+    ) -> Tuple[Optional[List[float]], Optional[str], str, List[Any], Optional[PromptTemplate]]:
+        """异步生成与流式生成共用的前置步骤：查回答缓存，未命中时路由并确定工具与提示
+
+        命中回答缓存时直接保存本轮对话。
+
+        Returns:
+            Tuple: (问题向量, 缓存的回答, 路由, 工具, 提示)，缓存的回答不为 None 时其余结果不再使用
+        """
+        question_vector = None
+        if self._answer_cacheable(question, prompt, tools, chat_history, chatHistoryStoreService):
+            question_vector = await run_blocking(EmbeddingService.embed_query, question)
+            cached = self.answer_cache.lookup(store_id, question_vector)
+            if cached is not None:
+                await run_blocking(self._record_turn, user_id, question, cached, use_history,
+                                   chatHistoryStoreService)
+                return question_vector, cached, "cache", [], prompt
+
+        routed = ROUTER_ENABLED and prompt is None and tools is None
+        if tools is None:
+            tools = self._default_tools()
+        route = "agent"
+        if routed:
+            decision = await run_blocking(self._route, question, tools, question_vector)
+            route, tools = decision.route, decision.tools
+        if prompt is None:
+            prompt = ChatPrompt().agent(tools)
+        return question_vector, None, route, tools, prompt
+
+    async def agenerate_text_agent(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            store_id: Optional[str] = None,
+            chat_history: Optional[List[ChatHistoryConstant]] = None,
+            prompt: PromptTemplate = None,
+            tools: List[Any] = None,
+            use_history: bool = True,
+            chatHistoryStoreService: any = None
+    ) -> str:
+        """generate_text_agent 的异步版本，参数含义相同"""
+        question_vector, cached, route, tools, prompt = await self._aprepare(
+            question, user_id, store_id, chat_history, prompt, tools, use_history, chatHistoryStoreService)
+        if cached is not None:
+            return cached
+
+        trace = current_trace()
+        tool_calls = len(trace.labels("tool")) if trace is not None else 0
+        start = time.perf_counter()
+        with self.router.measure(route):
+            if route == "direct":
+                output = await self.agenerate_text_direct(question=question, user_id=user_id,
+                                                          chat_history=chat_history, use_history=use_history,
+                                                          chatHistoryStoreService=chatHistoryStoreService)
+            elif use_history:
+                output = await self.agenerate_text_agent_with_history(question=question, user_id=user_id,
+                                                                      store_id=store_id, chat_history=chat_history,
+                                                                      prompt=prompt, tools=tools,
+                                                                      chatHistoryStoreService=chatHistoryStoreService)
+            else:
+                output = await self.agenerate_text_agent_without_history(question=question, user_id=user_id,
+                                                                         store_id=store_id, prompt=prompt,
+                                                                         tools=tools,
+                                                                         chatHistoryStoreService=chatHistoryStoreService)
+        if question_vector is not None and self._tools_cacheable(tools, trace, tool_calls):
+            self.answer_cache.put(store_id, question, question_vector, output, time.perf_counter() - start)
+        return output
+
+    async def astream_text_agent(
+            self,
+            question: str,
+            user_id: Optional[str] = None,
+            store_id: Optional[str] = None,
+            chat_history: Optional[List[ChatHistoryConstant]] = None,
+            prompt: PromptTemplate = None,
+            tools: List[Any] = None,
+            use_history: bool = True,
+            include_steps: bool = False,
+            chatHistoryStoreService: any = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式agent模式，逐个返回事件
+
+        Args:
+            include_steps: 是否返回工具调用等中间步骤
+            其余参数与 generate_text_agent 相同
+
+        Yields:
+            Dict[str, Any]: {"event": "token"|"step"|"done", "data": ...}
+                token 为 Final Answer 的增量文本，done 携带完整回答；
+                命中回答缓存或直接回答时，完整回答作为一个 token 事件推送
+        """
+        question_vector, cached, route, tools, prompt = await self._aprepare(
+            question, user_id, store_id, chat_history, prompt, tools, use_history, chatHistoryStoreService)
+        if cached is not None:
+            yield {"event": "token", "data": cached}
+            yield {"event": "done", "data": {"output": cached}}
+            return
+
+        trace = current_trace()
+        tool_calls = len(trace.labels("tool")) if trace is not None else 0
+        start = time.perf_counter()
+        streamer = FinalAnswerStreamer()
+        output: Optional[str] = None
+        with self.router.measure(route):
+            if route == "direct":
+                # 直接回答内部已保存本轮对话
+                output = await self.agenerate_text_direct(question=question, user_id=user_id,
+                                                          chat_history=chat_history, use_history=use_history,
+                                                          chatHistoryStoreService=chatHistoryStoreService)
+            else:
+                agent_executor = self._create_agent_executor(prompt, tools)
+
+                chat_history_value = ""
+                if use_history:
+                    chat_history_value = await run_blocking(self._load_memory, question, user_id, chat_history,
+                                                            chatHistoryStoreService)
+
+                async for event in agent_executor.astream_events(
+                        self._agent_inputs(question, user_id, store_id, chat_history_value), version="v2",
+                        config=trace_config()):
+                    kind = event["event"]
+                    if kind == "on_chat_model_stream":
+                        text = streamer.feed(event["run_id"], event["data"]["chunk"].content)
+                        if text:
+                            yield {"event": "token", "data": text}
+                    elif include_steps and kind == "on_tool_start":
+                        yield {"event": "step",
+                               "data": {"tool": event["name"], "input": event["data"].get("input")}}
+                    elif include_steps and kind == "on_tool_end":
+                        yield {"event": "step",
+                               "data": {"tool": event["name"], "output": event["data"].get("output")}}
+                    elif kind == "on_chain_end" and not event.get("parent_ids"):
+                        output = event["data"]["output"]["output"]
+
+                if output is None:
+                    output = ""
+                # agent 运行完成后、推送剩余事件前持久化，客户端此时断开也不会丢失本轮对话
+                await run_blocking(self._record_turn, user_id, question, output, use_history,
+                                   chatHistoryStoreService)
+        if question_vector is not None and self._tools_cacheable(tools, trace, tool_calls):
+            self.answer_cache.put(store_id, question, question_vector, output, time.perf_counter() - start)
+
+        # 直接回答、或模型未按流式返回（如解析失败后的兜底回答）时，一次性推送完整回答
+        if not streamer.emitted and output:
+            yield {"event": "token", "data": output}
+        yield {"event": "done", "data": {"output": output}}
+
+# 初始化llm（模型延迟创建）
+LlmService: LLM = LLM()
@@ -0,0 +1,96 @@
+"""结构化日志
+
+service 下的模块通过 get_logger(__name__) 获取日志记录器，默认每行输出一个 JSON 对象，
+extra 中的字段与当前请求的 trace_id 会一并写入，便于按请求检索与聚合。
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+# json: 每行一个 JSON 对象；text: 便于本地阅读的文本格式
+LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+
+# 当前请求的追踪ID，由 tracing.start_trace 设置
+TraceId: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+
+# LogRecord 自带的属性，其余属性视为 extra 字段
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为单行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = TraceId.get()
+        if trace_id:
+            payload["trace_id"] = trace_id
+        payload.update(_fields(record))
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，extra 字段以 key=value 追加在消息之后"""
+
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _fields(record)
+        trace_id = TraceId.get()
+        if trace_id:
+            fields["trace_id"] = trace_id
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+def _configure() -> None:
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        root = logging.getLogger("service")
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        # 不再传递给根记录器，避免与 uvicorn 的日志配置重复输出
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取 service 命名空间下的日志记录器
+
+    Args:
+        name: 模块名，通常传入 __name__
+
+    Returns:
+        logging.Logger: 日志记录器
+    """
+    _configure()
+    if name != "service" and not name.startswith("service."):
+        name = f"service.{name}"
+    return logging.getLogger(name)
@@ -1,29 +1,194 @@
-from .chatHistoryStrore import ChatHistoryStoreService
+from .chatHistoryStrore import ChatHistoryStoreService, ReadOnlyHistoryStore
 from .llm import LlmService
+from .chroma import ChromaService
+from .embedding import EmbeddingService
 import json
 import os
+import time
 from langchain_community.chat_models import ChatTongyi
 from langchain.agents import AgentExecutor, create_react_agent
 from .tools import Tools
 from .prompt import ChatPrompt
-from typing import Optional, Dict, List, Any, Union
+from typing import Optional, Dict, List, Any, Union, AsyncIterator
 from langchain.memory import ConversationBufferMemory
 from langchain.schema import HumanMessage, SystemMessage
 from langchain.prompts import PromptTemplate
 from constant.chatRequest import ChatHistoryConstant
+from .executor import run_blocking
+from .log import get_logger
+from .metrics import Metrics
+from .tracing import start_trace
+from .summaryScheduler import SummaryScheduler, SUMMARY_SCHEDULER_ENABLED
+from .toolRuntime import ToolRuntimeService, request_scope
+from .requestScheduler import UserQueue, background_priority
+
+logger = get_logger(__name__)
+
+ChatRequestHistogram = Metrics.histogram("chat_request_seconds", "/chat 单次请求耗时")
+ChatFirstTokenHistogram = Metrics.histogram("chat_first_token_seconds", "/chat/stream 首个回答 token 的耗时")
+
+# 启动时是否在后台预热模型与数据库
+WARMUP_ON_STARTUP: bool = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# 后台批量总结
+SummarySchedulerService: SummaryScheduler = SummaryScheduler(ChatHistoryStoreService, LlmService)
+
+# 同一用户的请求按到达顺序逐个执行
+UserQueueService: UserQueue = UserQueue()
+
+# 不写入对话的只读历史记录服务，用于批量回放
+ReadOnlyHistoryStoreService: ReadOnlyHistoryStore = ReadOnlyHistoryStore(ChatHistoryStoreService)
+
 
 class Logic:
+    def warmup(self) -> Dict[str, Any]:
+        """加载嵌入模型、连接数据库并创建聊天模型"""
+        EmbeddingService.embed_query("warmup")
+        ChromaService.init()
+        ChatHistoryStoreService.history_index
+        LlmService.init()
+        return self.readiness()
+
+    async def awarmup(self) -> Dict[str, Any]:
+        return await run_blocking(self.warmup)
+
+    def readiness(self) -> Dict[str, Any]:
+        """就绪状态
+
+        启动时预热的实例要等模型与数据库全部加载完才就绪；关闭预热时模型按设计在第一次请求时加载，
+        只要求数据库可连接（未连接时在此处连接一次，之后直接返回），否则实例永远不会接到流量。
+        """
+        if not WARMUP_ON_STARTUP and not ChromaService.loaded:
+            try:
+                ChromaService.init()
+            except Exception:
+                logger.exception("连接向量数据库失败")
+        components = {
+            "embedding": EmbeddingService.loaded,
+            "chroma": ChromaService.loaded,
+            "llm": LlmService.loaded,
+        }
+        ready = all(components.values()) if WARMUP_ON_STARTUP else components["chroma"]
+        return {"ready": ready, "components": components, "lazy": not WARMUP_ON_STARTUP}
+
     def summarize_user_history(self, user_id: str):
-        return ChatHistoryStoreService.summarize_user_history(user_id=user_id, llmService=LlmService)
+        with background_priority():
+            return ChatHistoryStoreService.summarize_user_history(user_id=user_id, llmService=LlmService)
+
+    def start_background_jobs(self) -> None:
+        if SUMMARY_SCHEDULER_ENABLED:
+            SummarySchedulerService.start()
+
+    def stop_background_jobs(self) -> None:
+        SummarySchedulerService.shutdown()
+        # 写完队列中尚未落库的对话
+        ChatHistoryStoreService.writer.shutdown()
+        ToolRuntimeService.close()
+
+    def answer_cache_stats(self) -> Dict[str, Any]:
+        return LlmService.answer_cache.stats()
+
+    def invalidate_answer_cache(self, store_id: Optional[str] = None) -> None:
+        LlmService.answer_cache.invalidate(store_id)
+
+    def embedding_stats(self) -> Dict[str, Any]:
+        return EmbeddingService.stats()
+
+    def writer_stats(self) -> Dict[str, Any]:
+        return ChatHistoryStoreService.writer.stats()
+
+    def tool_stats(self) -> Dict[str, Any]:
+        return ToolRuntimeService.stats()
+
+    async def asummarize_all(self) -> Dict[str, Any]:
+        return await run_blocking(SummarySchedulerService.run_once)
+
+    def summary_stats(self) -> Dict[str, Any]:
+        return SummarySchedulerService.stats()
+
+    def memory_stats(self) -> Dict[str, Any]:
+        return LlmService.user_memories.stats()
+
+    async def asummarize_user_history(self, user_id: str):
+        return await run_blocking(self.summarize_user_history, user_id)
+
+    @staticmethod
+    def _history_store(persist: bool) -> Any:
+        """persist 为 False 时使用只读视图，本次对话不写入历史记录"""
+        return ChatHistoryStoreService if persist else ReadOnlyHistoryStoreService
 
     def generate_text_agent(self, question: str, user_id: Optional[str] = None, 
                            store_id: Optional[str] = None,
                            chat_history: Optional[List[ChatHistoryConstant]] = None,
                            prompt: PromptTemplate = None,
                            tools: List[Any] = None,
-                           use_history: bool = True) -> str:
-        return LlmService.generate_text_agent(question=question, user_id=user_id, 
-                                             store_id=store_id,
-                                             chat_history=chat_history,
-                                             prompt=prompt, tools=tools, use_history=use_history,
-                                             chatHistoryStoreService=ChatHistoryStoreService)
+                           use_history: bool = True,
+                           persist: bool = True) -> str:
+        start = time.perf_counter()
+        try:
+            with start_trace("chat"), request_scope(user_id, store_id), UserQueueService.hold(user_id):
+                return LlmService.generate_text_agent(question=question, user_id=user_id,
+                                                      store_id=store_id,
+                                                      chat_history=chat_history,
+                                                      prompt=prompt, tools=tools, use_history=use_history,
+                                                      chatHistoryStoreService=self._history_store(persist))
+        finally:
+            ChatRequestHistogram.observe(time.perf_counter() - start)
+
+    async def agenerate_text_agent(self, question: str, user_id: Optional[str] = None,
+                                   store_id: Optional[str] = None,
+                                   chat_history: Optional[List[ChatHistoryConstant]] = None,
+                                   prompt: PromptTemplate = None,
+                                   tools: List[Any] = None,
+                                   use_history: bool = True,
+                                   persist: bool = True) -> str:
+        start = time.perf_counter()
+        try:
+            with start_trace("chat"), request_scope(user_id, store_id):
+                async with UserQueueService.ahold(user_id):
+                    return await LlmService.agenerate_text_agent(question=question, user_id=user_id,
+                                                                 store_id=store_id,
+                                                                 chat_history=chat_history,
+                                                                 prompt=prompt, tools=tools,
+                                                                 use_history=use_history,
+                                                                 chatHistoryStoreService=self._history_store(persist))
+        finally:
+            ChatRequestHistogram.observe(time.perf_counter() - start)
+
+    async def astream_text_agent(self, question: str, user_id: Optional[str] = None,
+                                 store_id: Optional[str] = None,
+                                 chat_history: Optional[List[ChatHistoryConstant]] = None,
+                                 use_history: bool = True,
+                                 include_steps: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        start = time.perf_counter()
+        first = True
+        try:
+            with start_trace("chat_stream"), request_scope(user_id, store_id):
+                async with UserQueueService.ahold(user_id):
+                    async for event in LlmService.astream_text_agent(
+                            question=question, user_id=user_id, store_id=store_id, chat_history=chat_history,
+                            use_history=use_history, include_steps=include_steps,
+                            chatHistoryStoreService=ChatHistoryStoreService):
+                        if first and event["event"] == "token":
+                            first = False
+                            ChatFirstTokenHistogram.observe(time.perf_counter() - start)
+                        yield event
+        finally:
+            ChatRequestHistogram.observe(time.perf_counter() - start)
+
+    def check_admission(self, user_id: Optional[str] = None) -> None:
+        """流式请求开始推送前检查排队情况，已过载时抛出 Overloaded"""
+        UserQueueService.check(user_id)
+        LlmService.limiter.check()
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        return {"users": UserQueueService.stats(), "llm": LlmService.limiter.stats()}
+
+    def route_stats(self) -> Dict[str, Any]:
+        return LlmService.router.stats()
+
+    def metrics(self) -> Dict[str, Any]:
+        return Metrics.snapshot()
+
+    def prometheus_metrics(self) -> str:
+        return Metrics.render_prometheus()
@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from langchain.memory import ConversationBufferMemory
+
+MEMORY_CACHE_SIZE: int = int(os.getenv("MEMORY_CACHE_SIZE", "1000"))
+MEMORY_CACHE_MAX_BYTES: int = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+MEMORY_CACHE_TTL: float = float(os.getenv("MEMORY_CACHE_TTL", "1800"))
+
+# 单条消息的固定开销估算（对象头、角色等）
+_MESSAGE_OVERHEAD = 64
+
+
+class _Entry:
+    __slots__ = ("memory", "version", "size", "expires_at")
+
+    def __init__(self, memory: ConversationBufferMemory, version: Optional[int], size: int, expires_at: float) -> None:
+        self.memory = memory
+        self.version = version
+        self.size = size
+        self.expires_at = expires_at
+
+
+class MemoryCache:
+    """按用户缓存 ConversationBufferMemory 的 LRU/TTL 缓存
+
+    每条记录带有对应的历史版本号，版本号与数据库不一致或过期时视为未命中，
+    由调用方重新从 Chroma 加载。版本号为 None 表示记忆来自请求传入的历史记录，不与数据库同步。
+    传入 size_of 时也可缓存其他按用户、带版本号的数据（如历史问题向量矩阵）。
+    """
+
+    def __init__(self, max_entries: int = MEMORY_CACHE_SIZE, max_bytes: int = MEMORY_CACHE_MAX_BYTES,
+                 ttl: float = MEMORY_CACHE_TTL, size_of: Optional[Callable[[Any], int]] = None) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._measure: Callable[[Any], int] = size_of or self._size_of
+        self._entries: "OrderedDict[Optional[str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def new_memory() -> ConversationBufferMemory:
+        return ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True
+        )
+
+    @staticmethod
+    def _size_of(memory: ConversationBufferMemory) -> int:
+        """估算记忆占用的字节数"""
+        return sum(len(str(m.content).encode("utf-8")) + _MESSAGE_OVERHEAD for m in memory.chat_memory.messages)
+
+    def _remove(self, user_id: Optional[str]) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self._bytes > self.max_bytes and len(self._entries) > 1)):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def get(self, user_id: Optional[str], version: Optional[int] = None) -> Optional[ConversationBufferMemory]:
+        """获取当前有效的用户记忆
+
+        Args:
+            user_id: 用户ID
+            version: 数据库中该用户历史的当前版本号，不一致时视为未命中
+
+        Returns:
+            Optional[ConversationBufferMemory]: 命中时返回记忆，否则返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.expires_at < time.monotonic() or entry.version != version:
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry.memory
+
+    def peek(self, user_id: Optional[str]) -> Optional[ConversationBufferMemory]:
+        """获取记忆但不校验版本、不计入命中统计"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            return entry.memory if entry is not None else None
+
+    def put(self, user_id: Optional[str], memory: ConversationBufferMemory, version: Optional[int] = None) -> None:
+        """写入用户记忆"""
+        size = self._measure(memory)
+        with self._lock:
+            self._remove(user_id)
+            self._entries[user_id] = _Entry(memory, version, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            self._evict()
+
+    def sync(self, user_id: Optional[str], expected: Optional[int], version: Optional[int]) -> None:
+        """记忆追加了新一轮对话后更新占用与版本号
+
+        只有记忆在保存前与数据库一致（版本号等于 expected）时才推进到新版本，
+        否则说明期间有其他写入，直接失效等待重新加载。
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry.version is not None and entry.version != expected:
+                self._remove(user_id)
+                return
+            if entry.version is not None:
+                entry.version = version
+            size = self._measure(entry.memory)
+            self._bytes += size - entry.size
+            entry.size = size
+            self._evict()
+
+    def setdefault(self, user_id: Optional[str], memory: Any, version: Optional[int] = None) -> Any:
+        """已有同一版本的有效记录时返回该记录，否则写入并返回 memory"""
+        size = self._measure(memory)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version and entry.expires_at >= time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry.memory
+            self._remove(user_id)
+            self._entries[user_id] = _Entry(memory, version, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            self._evict()
+            return memory
+
+    def replace(self, user_id: Optional[str], memory: Any) -> bool:
+        """替换已缓存的值，保留版本号与过期时间；未缓存时不写入，返回是否已替换"""
+        size = self._measure(memory)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return False
+            entry.memory = memory
+            self._bytes += size - entry.size
+            entry.size = size
+            self._evict()
+            return True
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        with self._lock:
+            self._remove(user_id)
+
+    def __contains__(self, user_id: Optional[str]) -> bool:
+        with self._lock:
+            return user_id in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,154 @@
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 默认耗时分桶（秒）
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# 默认大小分桶（字符数）
+SIZE_BUCKETS: Tuple[float, ...] = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    """按 Prometheus 文本格式输出标签"""
+    pairs = [*key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _header(name: str, description: str, kind: str) -> List[str]:
+    description = description.replace("\\", "\\\\").replace("\n", " ")
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, labels: Optional[Dict[str, Any]] = None) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+    def prometheus(self) -> List[str]:
+        """Prometheus 文本格式"""
+        with self._lock:
+            items = list(self._values.items())
+        lines = _header(self.name, self.description, "counter")
+        lines.extend(f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    """分桶直方图，记录次数、总和与各桶累计次数"""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # key -> [各桶次数..., +Inf 桶次数, 总和]
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        result = []
+        for key, row in items:
+            counts = row[:-1]
+            cumulative, total = [], 0.0
+            for count in counts:
+                total += count
+                cumulative.append(total)
+            result.append({
+                "labels": dict(key),
+                "count": total,
+                "sum": row[-1],
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+            })
+        return result
+
+    def prometheus(self) -> List[str]:
+        """Prometheus 文本格式：累计分桶、_sum 与 _count"""
+        lines = _header(self.name, self.description, "histogram")
+        for item in self.snapshot():
+            key = _label_key(item["labels"])
+            for bound, count in item["buckets"].items():
+                lines.append(f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {_format_value(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(item['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {_format_value(item['count'])}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, description)
+            return self._metrics[name]
+
+    def histogram(self, name: str, description: str = "", buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, buckets)
+            return self._metrics[name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render_prometheus(self) -> str:
+        """按 Prometheus 文本格式输出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+Metrics: MetricsRegistry = MetricsRegistry()
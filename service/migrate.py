@@ -0,0 +1,211 @@
+"""集合迁移
+
+把旧版本共用默认集合中的文档按类型搬到各自的集合：对话 → conversations（按用户哈希分片），
+摘要 → summaries，其余文档 → knowledge。修改 CONVERSATION_SHARDS 后重新运行，
+会把已有对话重新分布到新的分片。迁移直接复用已存储的向量，不重新嵌入；文档ID保持不变，对话索引无需重建。
+旧默认集合中的文档搬走后保留（便于回滚），元数据中记下 migrated_to，再次运行时跳过，
+不会把已被总结删除的对话重新写回。
+
+--convert-records 会把旧格式对话记录（JSON 整体嵌入）转换为新格式：文档内容只保留问题并重新嵌入问题，
+回答与时间戳写入元数据。转换逐批进行，可以重复运行，已是新格式的记录会被跳过。
+
+迁移与转换直接写 Chroma，不更新关键词索引，有文档搬移或转换时会提示重建索引。
+
+运行: python -m service.migrate [--path chroma] [--shards 1] [--batch-size 500] [--drop-legacy] [--convert-records]
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from .chroma import (CHROMA_PATH, CONVERSATION_COLLECTION, CONVERSATION_SHARDS, KNOWLEDGE_COLLECTION,
+                     LEGACY_COLLECTION, MIGRATED_KEY, SUMMARY_COLLECTION, conversation_collection_name,
+                     conversation_collection_names, create_client)
+from .historyRecord import HistoryRecord, is_structured, record_metadata
+
+
+class CollectionMigrator:
+    """按文档类型与分片配置重新分布 Chroma 集合中的文档"""
+
+    def __init__(self, path: str = CHROMA_PATH, shards: int = CONVERSATION_SHARDS, batch_size: int = 500,
+                 client: Any = None) -> None:
+        self.client: Any = client or create_client(path)
+        self.shards = max(1, shards)
+        self.batch_size = batch_size
+        self._targets: Dict[str, Any] = {}
+
+    def _collection_names(self) -> List[str]:
+        # 新版本 chromadb 返回名称，旧版本返回集合对象
+        return [getattr(item, "name", item) for item in self.client.list_collections()]
+
+    def _target(self, name: str) -> Any:
+        if name not in self._targets:
+            # 与 langchain_chroma 一致，不绑定 chromadb 自带的嵌入函数
+            self._targets[name] = self.client.get_or_create_collection(name=name, embedding_function=None)
+        return self._targets[name]
+
+    def target_name(self, metadata: Optional[Dict[str, Any]]) -> str:
+        """根据文档元数据决定目标集合"""
+        metadata = metadata or {}
+        kind = metadata.get("type")
+        if kind == "conversation" and metadata.get("user_id"):
+            return conversation_collection_name(str(metadata["user_id"]), self.shards)
+        if kind == "summary":
+            return SUMMARY_COLLECTION
+        # 旧版知识库文档没有 type 字段
+        return KNOWLEDGE_COLLECTION
+
+    def _move(self, source_name: str, delete_moved: bool) -> Dict[str, int]:
+        """把源集合中归属其他集合的文档写入目标集合
+
+        Args:
+            source_name: 源集合名称
+            delete_moved: 是否从源集合删除已搬走的文档，不删除时标记为已迁移，之后不再搬移
+
+        Returns:
+            Dict[str, int]: 各目标集合写入的文档数
+        """
+        source = self.client.get_collection(name=source_name, embedding_function=None)
+        # 先取出全部ID再按ID分批读取，搬移过程中删除文档不会打乱分页
+        all_ids: List[str] = source.get(include=[])["ids"]
+        moved: Dict[str, int] = {}
+        for start in range(0, len(all_ids), self.batch_size):
+            batch = source.get(ids=all_ids[start:start + self.batch_size],
+                               include=["documents", "metadatas", "embeddings"])
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(batch["metadatas"]):
+                if (metadata or {}).get(MIGRATED_KEY):
+                    continue
+                name = self.target_name(metadata)
+                if name != source_name:
+                    groups.setdefault(name, []).append(i)
+            for name, rows in groups.items():
+                self._target(name).upsert(ids=[batch["ids"][i] for i in rows],
+                                          embeddings=[batch["embeddings"][i] for i in rows],
+                                          documents=[batch["documents"][i] for i in rows],
+                                          metadatas=[batch["metadatas"][i] for i in rows])
+                moved[name] = moved.get(name, 0) + len(rows)
+                if delete_moved:
+                    source.delete(ids=[batch["ids"][i] for i in rows])
+                else:
+                    source.update(ids=[batch["ids"][i] for i in rows],
+                                  metadatas=[{**(batch["metadatas"][i] or {}), MIGRATED_KEY: name} for i in rows])
+        return moved
+
+    def run(self, drop_legacy: bool = False) -> Dict[str, Any]:
+        """执行迁移
+
+        Args:
+            drop_legacy: 迁移完成后是否删除旧的默认集合
+
+        Returns:
+            Dict[str, Any]: 迁移统计
+        """
+        start = time.perf_counter()
+        names = self._collection_names()
+        layout = set(conversation_collection_names(self.shards))
+        stats: Dict[str, Any] = {"moved": {}, "dropped": []}
+
+        sources: List[str] = []
+        if LEGACY_COLLECTION in names:
+            sources.append(LEGACY_COLLECTION)
+        # 分片数变化后，旧分片（或不分片时的单个集合）中的对话需要重新分布
+        sources.extend(name for name in names
+                       if name.startswith(CONVERSATION_COLLECTION) and name not in layout)
+        sources.extend(name for name in names if name in layout and self.shards > 1)
+
+        for source_name in sources:
+            legacy = source_name == LEGACY_COLLECTION
+            moved = self._move(source_name, delete_moved=not legacy)
+            stats["moved"][source_name] = moved
+            if legacy and drop_legacy:
+                self.client.delete_collection(name=source_name)
+                stats["dropped"].append(source_name)
+            elif not legacy and source_name not in layout \
+                    and self.client.get_collection(name=source_name, embedding_function=None).count() == 0:
+                self.client.delete_collection(name=source_name)
+                stats["dropped"].append(source_name)
+
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+
+class RecordMigrator:
+    """把旧格式的对话记录转换为结构化元数据 + 只嵌入问题的新格式"""
+
+    def __init__(self, embedding_function: Any, path: str = CHROMA_PATH, batch_size: int = 500,
+                 client: Any = None) -> None:
+        self.client: Any = client or create_client(path)
+        self.embedding_function = embedding_function
+        self.batch_size = batch_size
+
+    def _convert(self, name: str) -> Dict[str, int]:
+        collection = self.client.get_collection(name=name, embedding_function=None)
+        all_ids: List[str] = collection.get(include=[])["ids"]
+        stats = {"converted": 0, "skipped": 0, "invalid": 0}
+        for start in range(0, len(all_ids), self.batch_size):
+            batch = collection.get(ids=all_ids[start:start + self.batch_size], include=["documents", "metadatas"])
+            ids: List[str] = []
+            documents: List[str] = []
+            metadatas: List[Dict[str, Any]] = []
+            for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                metadata = metadata or {}
+                # 旧默认集合中已搬走的记录由目标集合转换
+                if metadata.get("type") != "conversation" or is_structured(metadata) or metadata.get(MIGRATED_KEY):
+                    stats["skipped"] += 1
+                    continue
+                record = HistoryRecord.from_row(document, metadata)
+                if record is None:
+                    stats["invalid"] += 1
+                    continue
+                # 保留原有元数据字段；没有序号的旧记录不补写 seq
+                converted = {**metadata, **record_metadata(str(metadata.get("user_id", "")), record.bot,
+                                                           record.timestamp or str(metadata.get("timestamp", "")),
+                                                           int(metadata.get("seq", 0)))}
+                if "seq" not in metadata:
+                    converted.pop("seq")
+                ids.append(doc_id)
+                documents.append(record.user)
+                metadatas.append(converted)
+            if ids:
+                # 问题一次批量嵌入，作为新的文档向量
+                embeddings = self.embedding_function.embed_documents(documents)
+                collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+                stats["converted"] += len(ids)
+        return stats
+
+    def run(self) -> Dict[str, Any]:
+        """转换全部对话集合（以及尚未迁移的旧默认集合）中的旧格式记录"""
+        start = time.perf_counter()
+        names = [getattr(item, "name", item) for item in self.client.list_collections()]
+        stats: Dict[str, Any] = {"collections": {}}
+        for name in names:
+            if name.startswith(CONVERSATION_COLLECTION) or name == LEGACY_COLLECTION:
+                stats["collections"][name] = self._convert(name)
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="按文档类型与分片迁移 Chroma 集合")
+    parser.add_argument("--path", default=CHROMA_PATH, help="数据库目录")
+    parser.add_argument("--shards", type=int, default=CONVERSATION_SHARDS, help="对话集合分片数")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批搬移的文档数")
+    parser.add_argument("--drop-legacy", action="store_true", help="迁移完成后删除旧的默认集合")
+    parser.add_argument("--convert-records", action="store_true", help="把旧格式对话记录转换为新格式")
+    args = parser.parse_args()
+    migrator = CollectionMigrator(path=args.path, shards=args.shards, batch_size=args.batch_size)
+    stats = migrator.run(drop_legacy=args.drop_legacy)
+    if args.convert_records:
+        # 只有转换记录时才需要加载嵌入模型
+        from .embedding import EmbeddingService
+        stats["records"] = RecordMigrator(EmbeddingService, batch_size=args.batch_size,
+                                          client=migrator.client).run()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    converted = sum(item["converted"] for item in stats.get("records", {}).get("collections", {}).values())
+    if any(stats["moved"].values()) or converted:
+        print("文档已迁移或转换，请重建关键词索引: python -m service.hybridSearch --rebuild")
+
+
+if __name__ == "__main__":
+    main()
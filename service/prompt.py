@@ -1,44 +1,124 @@
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.tools import render_text_description
 import pytz
+import threading
+from collections import OrderedDict
 from datetime import datetime
-class ChatPrompt:
+from typing import Any, List, Optional, Tuple
 
-    def agent(self):
-        # 获取当前北京时间
-        beijing_tz = pytz.timezone('Asia/Shanghai')
-        current_time = datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M:%S")
+# 直接回答时的系统提示
+DIRECT_SYSTEM_PROMPT = "你是一个智能客服助手。请简洁、礼貌地直接回答用户，不要编造订单、商品或售后政策等业务信息。"
+
+# agent 提示分为两段：固定的指令与工具说明放在系统消息，作为每次请求都相同、可被服务端缓存的前缀；
+# 用户、历史、时间与问题等每次请求不同的内容放在最后的用户消息
+AGENT_SYSTEM_TEMPLATE = """你是一个智能助手。
+
+工具列表:
+{tools}
+
+请严格按以下格式回答：
+Question: 需要回答的问题
+Thought: 你的思考过程（保持用户原始关键词格式）
+Action: 需要使用的工具名称（必须是[{tool_names}]中的一个）
+Action Input: 工具需要的输入（保持用户原始关键词格式）
+Observation: 工具返回的结果
+
+Thought: 我现在知道最终答案
+Final Answer: 最终回答内容"""
+
+# 同一用户的历史在连续几轮之间变化较小，排在时间之前，时间只精确到分钟
+AGENT_INPUT_TEMPLATE = """用户id: {user_id}
+店铺id: {store_id}
+
+对话历史（如没有就不使用）：
+{chat_history}
+
+当前北京时间：{current_time}
 
-        # 修改代理提示模板
-        return ChatPromptTemplate.from_template(f"""
-            你是一个智能助手。
+用户问题：{input}
+{agent_scratchpad}"""
 
-            当前北京时间：{current_time}
+# 按工具集缓存的已渲染提示数量
+AGENT_PROMPT_CACHE_SIZE = 64
 
-            对话历史（如没有就不使用）：
-            {{chat_history}}
 
-            工具列表: {{tools}}
+class ChatPrompt:
+    # 模板只构建一次，当前时间等每次请求不同的值作为运行时变量传入
+    _agent_prompt: ChatPromptTemplate = None
+    # 工具集 -> (工具列表, 工具说明已渲染进系统消息的提示)；持有工具引用，保证 id 在缓存期间不会被复用
+    _tool_prompts: "OrderedDict[Tuple[int, ...], Tuple[List[Any], ChatPromptTemplate]]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def current_time() -> str:
+        """获取当前北京时间（精确到分钟）"""
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        return datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M")
+
+    def agent(self, tools: Optional[List[Any]] = None) -> ChatPromptTemplate:
+        """agent 提示模板
+
+        Args:
+            tools: 传入时把工具说明预先渲染进系统消息并按工具集缓存，每次请求不再重新格式化固定前缀
 
-            用户id: {{user_id}}
-            店铺id: {{store_id}}
+        Returns:
+            ChatPromptTemplate: 系统消息（固定前缀）+ 用户消息（每次请求不同的内容）
+        """
+        if tools is None:
+            if ChatPrompt._agent_prompt is None:
+                ChatPrompt._agent_prompt = ChatPromptTemplate.from_messages([
+                    ("system", AGENT_SYSTEM_TEMPLATE),
+                    ("human", AGENT_INPUT_TEMPLATE),
+                ])
+            return ChatPrompt._agent_prompt
 
-            请严格按以下格式回答：
-            Question: 需要回答的问题
-            Thought: 你的思考过程（保持用户原始关键词格式）
-            Action: 需要使用的工具名称（必须是[{{tool_names}}]中的一个）
-            Action Input: 工具需要的输入（保持用户原始关键词格式）
-            Observation: 工具返回的结果
+        key = tuple(id(tool) for tool in tools)
+        with ChatPrompt._lock:
+            entry = ChatPrompt._tool_prompts.get(key)
+            if entry is not None:
+                ChatPrompt._tool_prompts.move_to_end(key)
+                return entry[1]
 
-            Thought: 我现在知道最终答案
-            Final Answer: 最终回答内容
+        rendered = render_text_description(list(tools))
+        tool_names = ", ".join(tool.name for tool in tools)
+        system = SystemMessage(content=AGENT_SYSTEM_TEMPLATE.format(tools=rendered, tool_names=tool_names))
+        # create_react_agent 要求提示中声明 tools 与 tool_names，以相同的值作为部分变量
+        prompt = ChatPromptTemplate.from_messages([system, ("human", AGENT_INPUT_TEMPLATE)]).partial(
+            tools=rendered, tool_names=tool_names)
+        with ChatPrompt._lock:
+            # 并发构建时保留先写入的一份，同一工具集始终对应同一个提示对象（执行器池按提示复用）
+            entry = ChatPrompt._tool_prompts.setdefault(key, (list(tools), prompt))
+            while len(ChatPrompt._tool_prompts) > AGENT_PROMPT_CACHE_SIZE:
+                ChatPrompt._tool_prompts.popitem(last=False)
+        return entry[1]
 
-            用户问题：{{input}}
-            {{agent_scratchpad}}
-            """)
+    def direct(self, question: str, chat_history: str = "") -> str:
+        # 不需要调用工具的简单问题，一次调用直接回答；与 agent 一样，时间与问题放在最后
+        prompt = ""
+        if chat_history:
+            prompt += f"对话历史：\n{chat_history}\n\n"
+        prompt += f"当前北京时间：{self.current_time()}\n\n用户问题：{question}"
+        return prompt
 
     def summarize(self,conversations:list):
         # 构建用于总结的文本
         summary_text = "以下是用户的聊天记录，请总结主要内容和关键信息，越简洁越好：\n\n"
         for conv in conversations:
             summary_text += f"用户: {conv['user']}\n回复: {conv['bot']}\n\n"
-        return summary_text
\ No newline at end of file
+        return summary_text
+
+    def summarize_incremental(self, summary: str, conversations: list):
+        # 把新的聊天记录合并进已有摘要
+        summary_text = "以下是用户之前聊天记录的摘要，以及之后新增的聊天记录。请把新增内容合并进摘要，保留主要内容和关键信息，越简洁越好：\n\n"
+        summary_text += f"已有摘要：\n{summary}\n\n新增聊天记录：\n"
+        for conv in conversations:
+            summary_text += f"用户: {conv['user']}\n回复: {conv['bot']}\n\n"
+        return summary_text
+
+    def merge_summaries(self, summaries: list):
+        # 合并分段总结的结果
+        summary_text = "以下是同一用户不同时间段聊天记录的摘要，请合并为一份摘要，保留主要内容和关键信息，越简洁越好：\n\n"
+        for index, summary in enumerate(summaries, 1):
+            summary_text += f"摘要{index}: {summary}\n\n"
+        return summary_text
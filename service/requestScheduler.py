@@ -0,0 +1,326 @@
+"""请求调度：同一用户的请求按顺序执行，大模型调用全局限流
+
+- UserQueue：每个用户一个有序队列，同一用户的多次提问按到达顺序逐个执行，
+  避免并发修改同一个 ConversationBufferMemory 和交错写入对话
+- LlmLimiter：全局并发上限 + 令牌桶速率限制，等待中的在线对话优先于后台总结
+- 队列已满时抛出 Overloaded，接口层转换为 429 并带上 Retry-After
+
+同步线程与事件循环中的协程共用同一套队列，等待者由持锁方直接唤醒（线程用 Event，协程用 Future）。
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional
+
+from .metrics import Metrics
+
+# 同时进行的大模型调用数（每次模型调用占用一个名额，流式调用到最后一个片段为止；agent 的工具调用期间不占名额）
+LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# 每秒允许发起的大模型调用数，0 表示不限速
+LLM_RATE_LIMIT: float = float(os.getenv("LLM_RATE_LIMIT", "0"))
+# 等待大模型名额的在线请求数上限，超过后返回 429
+LLM_MAX_WAITING: int = int(os.getenv("LLM_MAX_WAITING", "64"))
+# 每个用户排队中的请求数上限，超过后返回 429
+USER_QUEUE_SIZE: int = int(os.getenv("USER_QUEUE_SIZE", "4"))
+
+# 优先级，数值越小越先获得名额
+INTERACTIVE = 0
+BACKGROUND = 1
+
+LlmPriority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+QueueWaitHistogram = Metrics.histogram("scheduler_wait_seconds", "排队等待耗时")
+RejectedCounter = Metrics.counter("scheduler_rejected_total", "因队列已满被拒绝的请求数")
+
+
+class Overloaded(Exception):
+    """队列已满，调用方应在 retry_after 秒后重试"""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """等待中的调用方，线程通过 Event 等待，协程通过 Future 等待"""
+
+    __slots__ = ("event", "loop", "future", "granted", "enqueued")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop is not None else None
+        self.event: Optional[threading.Event] = threading.Event() if loop is None else None
+        self.granted = False
+        self.enqueued = time.perf_counter()
+
+    def wake(self) -> None:
+        """在持有调度锁时调用，把名额交给该等待者"""
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+    async def wait(self) -> None:
+        await self.future
+
+    def waited(self) -> float:
+        return time.perf_counter() - self.enqueued
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+
+class LlmLimiter:
+    """大模型调用的全局限流：并发上限、令牌桶速率与优先级"""
+
+    def __init__(self, permits: int = LLM_MAX_CONCURRENCY, rate: float = LLM_RATE_LIMIT,
+                 max_waiting: int = LLM_MAX_WAITING) -> None:
+        self.permits = permits
+        self.rate = rate
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._lock = threading.Lock()
+        # (优先级, 序号, 等待者)
+        self._waiting: List[Any] = []
+        self._sequence = itertools.count()
+        # 令牌桶：下一个令牌可用的时间
+        self._next_token = 0.0
+        # 单次占用时长的滑动平均，用于估算 Retry-After
+        self._avg_hold = 1.0
+        self.counts: Dict[str, int] = {"acquired": 0, "waited": 0, "rejected": 0}
+
+    def _interactive_waiting(self) -> int:
+        return sum(1 for priority, _, _ in self._waiting if priority == INTERACTIVE)
+
+    def retry_after(self) -> float:
+        depth = len(self._waiting) + self.active
+        return max(1.0, round(self._avg_hold * depth / max(self.permits, 1), 1))
+
+    def _try_acquire(self, priority: int, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """有空闲名额时直接占用并返回 None，否则返回加入队列的等待者"""
+        with self._lock:
+            if self.active < self.permits and not self._waiting:
+                self.active += 1
+                self.counts["acquired"] += 1
+                return None
+            if priority == INTERACTIVE and self._interactive_waiting() >= self.max_waiting:
+                self.counts["rejected"] += 1
+                RejectedCounter.inc(labels={"queue": "llm"})
+                raise Overloaded("大模型请求排队已满", self.retry_after())
+            waiter = _Waiter(loop)
+            heapq.heappush(self._waiting, (priority, next(self._sequence), waiter))
+            self.counts["waited"] += 1
+            return waiter
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        """等待被取消：已拿到名额则归还，否则移出队列"""
+        with self._lock:
+            if not waiter.granted:
+                self._waiting = [entry for entry in self._waiting if entry[2] is not waiter]
+                heapq.heapify(self._waiting)
+                return
+        self.release(0.0)
+
+    def _reserve_token(self) -> float:
+        """按令牌桶预约一次调用，返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_token)
+            self._next_token = start + 1.0 / self.rate
+            return start - now
+
+    def acquire(self, priority: int = INTERACTIVE) -> None:
+        waiter = self._try_acquire(priority, None)
+        if waiter is not None:
+            waiter.event.wait()
+            QueueWaitHistogram.observe(waiter.waited(), labels={"queue": "llm"})
+        delay = self._reserve_token()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, priority: int = INTERACTIVE) -> None:
+        waiter = self._try_acquire(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.wait()
+            except asyncio.CancelledError:
+                self._cancel(waiter)
+                raise
+            QueueWaitHistogram.observe(waiter.waited(), labels={"queue": "llm"})
+        delay = self._reserve_token()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.release(0.0)
+                raise
+
+    def release(self, held: float) -> None:
+        with self._lock:
+            if held:
+                self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+            if self._waiting:
+                # 名额直接转交给优先级最高的等待者
+                _, _, waiter = heapq.heappop(self._waiting)
+                self.counts["acquired"] += 1
+                waiter.wake()
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def hold(self, priority: Optional[int] = None) -> Iterator[None]:
+        """占用一个名额，优先级默认取当前上下文的 LlmPriority"""
+        self.acquire(LlmPriority.get() if priority is None else priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def ahold(self, priority: Optional[int] = None) -> AsyncIterator[None]:
+        await self.aacquire(LlmPriority.get() if priority is None else priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def check(self) -> None:
+        """在线请求开始前检查是否已过载，不占用名额"""
+        with self._lock:
+            if self._interactive_waiting() >= self.max_waiting:
+                self.counts["rejected"] += 1
+                RejectedCounter.inc(labels={"queue": "llm"})
+                raise Overloaded("大模型请求排队已满", self.retry_after())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting = [priority for priority, _, _ in self._waiting]
+            return {"permits": self.permits, "rate": self.rate, "active": self.active,
+                    "waiting_interactive": waiting.count(INTERACTIVE),
+                    "waiting_background": waiting.count(BACKGROUND),
+                    "avg_hold_seconds": round(self._avg_hold, 3), **self.counts}
+
+
+class UserQueue:
+    """按用户串行执行请求，同一用户的请求按到达顺序获得执行权"""
+
+    def __init__(self, max_pending: int = USER_QUEUE_SIZE) -> None:
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # user_id -> 排队中的等待者；存在该键即表示该用户有请求正在执行
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._avg_hold = 1.0
+        self.counts: Dict[str, int] = {"acquired": 0, "waited": 0, "rejected": 0}
+
+    def _try_acquire(self, user_id: str, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                self._queues[user_id] = deque()
+                self.counts["acquired"] += 1
+                return None
+            if len(queue) >= self.max_pending:
+                self.counts["rejected"] += 1
+                RejectedCounter.inc(labels={"queue": "user"})
+                raise Overloaded("该用户的请求排队已满", max(1.0, round(self._avg_hold * (len(queue) + 1), 1)))
+            waiter = _Waiter(loop)
+            queue.append(waiter)
+            self.counts["waited"] += 1
+            return waiter
+
+    def release(self, user_id: str, held: float) -> None:
+        with self._lock:
+            if held:
+                self._avg_hold = 0.9 * self._avg_hold + 0.1 * held
+            queue = self._queues.get(user_id)
+            if queue:
+                self.counts["acquired"] += 1
+                queue.popleft().wake()
+            else:
+                self._queues.pop(user_id, None)
+
+    def _cancel(self, user_id: str, waiter: _Waiter) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._queues[user_id].remove(waiter)
+                return
+        self.release(user_id, 0.0)
+
+    @contextmanager
+    def hold(self, user_id: Optional[str]) -> Iterator[None]:
+        """获取用户的执行权，user_id 为空时不排队"""
+        if not user_id:
+            yield
+            return
+        waiter = self._try_acquire(user_id, None)
+        if waiter is not None:
+            waiter.event.wait()
+            QueueWaitHistogram.observe(waiter.waited(), labels={"queue": "user"})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(user_id, time.perf_counter() - start)
+
+    async def aacquire(self, user_id: str) -> None:
+        waiter = self._try_acquire(user_id, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await waiter.wait()
+            except asyncio.CancelledError:
+                self._cancel(user_id, waiter)
+                raise
+            QueueWaitHistogram.observe(waiter.waited(), labels={"queue": "user"})
+
+    @asynccontextmanager
+    async def ahold(self, user_id: Optional[str]) -> AsyncIterator[None]:
+        if not user_id:
+            yield
+            return
+        await self.aacquire(user_id)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(user_id, time.perf_counter() - start)
+
+    def check(self, user_id: Optional[str]) -> None:
+        """请求开始前检查该用户的队列是否已满，不占用执行权"""
+        if not user_id:
+            return
+        with self._lock:
+            queue = self._queues.get(user_id)
+            if queue is not None and len(queue) >= self.max_pending:
+                self.counts["rejected"] += 1
+                RejectedCounter.inc(labels={"queue": "user"})
+                raise Overloaded("该用户的请求排队已满", max(1.0, round(self._avg_hold * (len(queue) + 1), 1)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(queue) for queue in self._queues.values())
+            return {"active_users": len(self._queues), "pending": pending, "max_pending": self.max_pending,
+                    "avg_hold_seconds": round(self._avg_hold, 3), **self.counts}
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """在该上下文中发起的大模型调用按后台任务排队"""
+    token = LlmPriority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        LlmPriority.reset(token)
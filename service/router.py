@@ -0,0 +1,187 @@
+"""问题路由：在 ReAct agent 之前按问题向量做一次轻量分类
+
+- direct：问候、感谢等不需要工具的短问题，直接调用 generate_text 一次回答，不经过 ReAct 循环；
+  含数字（订单号、手机号等）、编码或业务关键词的问题即使与问候相似也不走 direct，避免不查数据就作答
+- agent：按问题与各工具说明（及工具 metadata 中的 examples 示例问题）的相似度预选最相关的几个工具，
+  提示中的工具列表更短，模型也更不容易选错工具
+
+问题向量与回答缓存共用同一次嵌入，工具说明的向量按工具集只计算一次。
+每个路由的请求数、耗时与大模型调用次数记录在 route_* 指标中。
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embedding import EmbeddingService
+from .metrics import Metrics
+from .tracing import current_trace
+
+ROUTER_ENABLED: bool = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# 与直接回答示例的相似度达到该值、且高于所有工具时走 direct 路由
+ROUTER_DIRECT_THRESHOLD: float = float(os.getenv("ROUTER_DIRECT_THRESHOLD", "0.8"))
+# 超过该字数的问题始终交给 agent
+ROUTER_DIRECT_MAX_CHARS: int = int(os.getenv("ROUTER_DIRECT_MAX_CHARS", "20"))
+# 提示中最多保留的工具数，工具总数不超过该值时不做筛选
+ROUTER_TOP_TOOLS: int = int(os.getenv("ROUTER_TOP_TOOLS", "3"))
+# 与最相关工具的相似度差距在该值以内的工具一并保留
+ROUTER_TOOL_MARGIN: float = float(os.getenv("ROUTER_TOOL_MARGIN", "0.1"))
+
+# 不需要调用工具的常见问题
+DIRECT_EXAMPLES: Tuple[str, ...] = (
+    "你好", "您好", "在吗", "有人吗", "哈喽", "早上好", "晚上好",
+    "谢谢", "谢谢你", "好的", "知道了", "嗯嗯", "辛苦了", "没事了", "再见", "拜拜",
+    "你是谁", "你是机器人吗",
+)
+
+# 出现这些词的问题需要查询业务数据，不走 direct 路由
+BUSINESS_KEYWORDS: Tuple[str, ...] = (
+    "订单", "单号", "物流", "快递", "发货", "到货", "收货", "签收", "退货", "退款", "换货", "售后", "发票",
+    "价格", "多少钱", "优惠", "库存", "有货", "商品", "尺码", "地址", "运费", "投诉", "账号", "会员",
+)
+# 数字（含全角），以及带连接符的字母编码（如 SKU-AB）
+_ID_TOKEN = re.compile(r"[0-9０-９]|[A-Za-z]+[-_][A-Za-z0-9]+")
+
+RouteCounter = Metrics.counter("route_requests_total", "按路由统计的请求数")
+RouteHistogram = Metrics.histogram("route_seconds", "按路由统计的回答耗时")
+RouteLlmCallsCounter = Metrics.counter("route_llm_calls_total", "按路由统计的大模型调用次数")
+
+
+class RouteDecision:
+    """路由结果"""
+
+    __slots__ = ("route", "tools", "score")
+
+    def __init__(self, route: str, tools: List[Any], score: float) -> None:
+        self.route = route
+        self.tools = tools
+        self.score = score
+
+
+class QuestionRouter:
+    """基于问题向量的路由与工具预选"""
+
+    def __init__(self, embedding_function: Any = None, direct_examples: Sequence[str] = DIRECT_EXAMPLES,
+                 direct_threshold: float = ROUTER_DIRECT_THRESHOLD, direct_max_chars: int = ROUTER_DIRECT_MAX_CHARS,
+                 top_tools: int = ROUTER_TOP_TOOLS, tool_margin: float = ROUTER_TOOL_MARGIN,
+                 business_keywords: Sequence[str] = BUSINESS_KEYWORDS) -> None:
+        self.embedding_function: Any = embedding_function or EmbeddingService
+        self.direct_examples = list(direct_examples)
+        self.business_keywords = tuple(business_keywords)
+        self.direct_threshold = direct_threshold
+        self.direct_max_chars = direct_max_chars
+        self.top_tools = top_tools
+        self.tool_margin = tool_margin
+        self._direct_vectors: Optional[np.ndarray] = None
+        # 工具集 -> (工具列表, 示例向量矩阵, 每行所属的工具下标)
+        self._tool_vectors: Dict[Tuple[int, ...], Tuple[List[Any], np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def tool_texts(tool: Any) -> List[str]:
+        """用于分类的工具文本：名称与说明，以及 metadata 中的示例问题"""
+        texts = [f"{tool.name}: {tool.description or ''}"]
+        texts.extend((getattr(tool, "metadata", None) or {}).get("examples") or [])
+        return texts
+
+    def direct_allowed(self, question: str) -> bool:
+        """问题是否可能走 direct 路由：足够短，且不含数字、编码与业务关键词"""
+        text = question.strip()
+        return len(text) <= self.direct_max_chars and not _ID_TOKEN.search(text) \
+            and not any(keyword in text for keyword in self.business_keywords)
+
+    def _direct_matrix(self) -> np.ndarray:
+        if self._direct_vectors is None:
+            vectors = self._normalize(self.embedding_function.embed_documents(self.direct_examples))
+            with self._lock:
+                self._direct_vectors = vectors
+        return self._direct_vectors
+
+    def _tool_matrix(self, tools: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        key = tuple(id(tool) for tool in tools)
+        entry = self._tool_vectors.get(key)
+        if entry is None:
+            texts: List[str] = []
+            owners: List[int] = []
+            for index, tool in enumerate(tools):
+                for text in self.tool_texts(tool):
+                    texts.append(text)
+                    owners.append(index)
+            entry = (list(tools), self._normalize(self.embedding_function.embed_documents(texts)),
+                     np.asarray(owners, dtype=np.int64))
+            with self._lock:
+                self._tool_vectors[key] = entry
+        return entry[1], entry[2]
+
+    def route(self, question: str, tools: List[Any], question_vector: Optional[List[float]] = None) -> RouteDecision:
+        """决定问题的路由，agent 路由同时给出预选的工具（保持原有顺序）
+
+        Args:
+            question: 用户问题
+            tools: 全部可用工具
+            question_vector: 已计算好的问题向量，传入时不再重复嵌入
+
+        Returns:
+            RouteDecision: 路由结果
+        """
+        if question_vector is None:
+            question_vector = self.embedding_function.embed_query(question)
+        query = self._normalize(question_vector)[0]
+
+        tool_scores = np.full(len(tools), -1.0, dtype=np.float32)
+        if tools:
+            matrix, owners = self._tool_matrix(tools)
+            # 每个工具取其各条示例中的最高相似度
+            np.maximum.at(tool_scores, owners, matrix @ query)
+        best_tool = float(tool_scores.max()) if tools else -1.0
+
+        if self.direct_allowed(question):
+            direct_score = float((self._direct_matrix() @ query).max())
+            if direct_score >= self.direct_threshold and direct_score > best_tool:
+                return RouteDecision("direct", [], direct_score)
+
+        if len(tools) <= self.top_tools:
+            return RouteDecision("agent", list(tools), best_tool)
+        ranked = np.argsort(-tool_scores)[:self.top_tools]
+        keep = {int(i) for i in ranked if tool_scores[i] >= best_tool - self.tool_margin}
+        return RouteDecision("agent", [tool for i, tool in enumerate(tools) if i in keep], best_tool)
+
+    @contextmanager
+    def measure(self, route: str) -> Iterator[None]:
+        """记录该路由的请求数、耗时与期间的大模型调用次数"""
+        trace = current_trace()
+        before = trace.count("llm") if trace is not None else 0
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            labels = {"route": route}
+            RouteCounter.inc(labels={**labels, "status": status})
+            RouteHistogram.observe(time.perf_counter() - start, labels=labels)
+            if trace is not None:
+                RouteLlmCallsCounter.inc(trace.count("llm") - before, labels=labels)
+
+    def stats(self) -> Dict[str, Any]:
+        routes: Dict[str, Any] = {}
+        for item in RouteHistogram.snapshot():
+            route = item["labels"].get("route")
+            calls = RouteLlmCallsCounter.value({"route": route})
+            routes[route] = {"requests": item["count"], "avg_seconds": round(item["sum"] / item["count"], 4)
+                             if item["count"] else 0.0,
+                             "llm_calls_per_request": round(calls / item["count"], 2) if item["count"] else 0.0}
+        return {"enabled": ROUTER_ENABLED, "routes": routes}
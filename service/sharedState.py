@@ -0,0 +1,112 @@
+"""多进程部署时各 worker 共享的状态
+
+用户历史版本号决定缓存的记忆与去重向量是否仍然有效。单进程时保存在进程内即可；
+多个 uvicorn worker 同时服务时，版本号存放在同一台机器上共享的 SQLite 文件中，
+任一 worker 写入或总结后，其他 worker 读取到新的版本号即会重新加载。
+"""
+import os
+import sqlite3
+import threading
+from typing import IO, Dict, Optional, Union
+
+from .chroma import CHROMA_PATH
+
+# local: 进程内；sqlite: 同机多进程共享
+SHARED_STATE_BACKEND: str = os.getenv("SHARED_STATE_BACKEND", "local").lower()
+SHARED_STATE_PATH: str = os.getenv("SHARED_STATE_PATH", os.path.join(CHROMA_PATH, "shared_state.sqlite3"))
+
+
+class LocalVersionStore:
+    """进程内的用户历史版本号"""
+
+    shared = False
+
+    def __init__(self) -> None:
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: str) -> int:
+        """推进版本号并返回新的版本号"""
+        with self._lock:
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+            return version
+
+
+class SqliteVersionStore:
+    """存放在 SQLite 文件中、同机多进程共享的用户历史版本号"""
+
+    shared = True
+
+    def __init__(self, path: str = SHARED_STATE_PATH) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS versions (
+                    user_id TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def get(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, user_id: str) -> int:
+        """推进版本号并返回新的版本号，跨进程原子执行"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO versions (user_id, version) VALUES (?, 1) "
+                    "ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+                    (user_id,)
+                )
+                row = self._conn.execute("SELECT version FROM versions WHERE user_id = ?", (user_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0]
+
+
+def create_version_store() -> Union[LocalVersionStore, SqliteVersionStore]:
+    """按 SHARED_STATE_BACKEND 创建版本号存储"""
+    if SHARED_STATE_BACKEND == "sqlite":
+        return SqliteVersionStore()
+    return LocalVersionStore()
+
+
+def acquire_leader(name: str, directory: str = CHROMA_PATH) -> Optional[IO]:
+    """尝试获取同机进程间的独占文件锁，用于只让一个 worker 运行后台任务
+
+    Args:
+        name: 锁名称
+        directory: 锁文件所在目录
+
+    Returns:
+        Optional[IO]: 获取成功时返回需保持打开的文件句柄，被其他进程持有时返回 None
+    """
+    os.makedirs(directory, exist_ok=True)
+    handle = open(os.path.join(directory, f"{name}.lock"), "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
@@ -0,0 +1,44 @@
+import json
+from typing import Any, Dict, Optional
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+class FinalAnswerStreamer:
+    """从 ReAct 模型的流式输出中截取 Final Answer 之后的内容
+
+    每次模型调用（run_id）单独缓冲，出现 "Final Answer:" 之前的 Thought/Action 不输出，
+    标记可能被切分在多个 token 中，因此在找到标记前保留完整缓冲。
+    """
+
+    def __init__(self) -> None:
+        self._buffers: Dict[str, str] = {}
+        self._answering: Dict[str, bool] = {}
+        self.emitted = False
+
+    def feed(self, run_id: str, text: str) -> Optional[str]:
+        """输入一个 token，返回应推送给客户端的文本"""
+        if not text:
+            return None
+        if self._answering.get(run_id):
+            self.emitted = True
+            return text
+
+        buffer = self._buffers.get(run_id, "") + text
+        index = buffer.find(FINAL_ANSWER_MARKER)
+        if index < 0:
+            self._buffers[run_id] = buffer
+            return None
+
+        self._answering[run_id] = True
+        self._buffers.pop(run_id, None)
+        answer = buffer[index + len(FINAL_ANSWER_MARKER):].lstrip()
+        if answer:
+            self.emitted = True
+            return answer
+        return None
+
+
+def sse(event: str, data: Any) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from .log import get_logger
+from .metrics import Metrics
+from .requestScheduler import background_priority
+from .sharedState import acquire_leader
+
+# 定时总结的间隔（秒）
+SUMMARY_INTERVAL: int = int(os.getenv("SUMMARY_INTERVAL", "3600"))
+# 未总结的对话条数达到该值才触发总结
+SUMMARY_THRESHOLD: int = int(os.getenv("SUMMARY_THRESHOLD", "20"))
+# 同时请求大模型进行总结的用户数
+SUMMARY_CONCURRENCY: int = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+SUMMARY_SCHEDULER_ENABLED: bool = os.getenv("SUMMARY_SCHEDULER_ENABLED", "true").lower() == "true"
+
+logger = get_logger(__name__)
+
+SummaryUsersCounter = Metrics.counter("summary_users_total", "后台总结处理的用户数")
+SummaryUserHistogram = Metrics.histogram("summary_user_seconds", "单个用户总结耗时")
+
+
+class SummaryScheduler:
+    """后台批量总结调度器
+
+    定时查找未总结对话超过阈值的用户，以有限并发调用大模型进行总结。
+    每个用户的删除与保存由 ChatHistoryStore.summarize_user_history 在用户写锁内完成。
+    """
+
+    def __init__(self, chatHistoryStoreService: Any, llmService: Any, interval: int = SUMMARY_INTERVAL,
+                 threshold: int = SUMMARY_THRESHOLD, concurrency: int = SUMMARY_CONCURRENCY) -> None:
+        self.chatHistoryStoreService = chatHistoryStoreService
+        self.llmService = llmService
+        self.interval = interval
+        self.threshold = threshold
+        self.concurrency = concurrency
+        self._scheduler: Optional[BackgroundScheduler] = None
+        # 多 worker 部署时只有持有文件锁的进程运行定时总结
+        self._leader: Any = None
+        self._run_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # 当前/最近一次任务的进度
+        self.job: Dict[str, Any] = {"running": False, "total": 0, "done": 0, "succeeded": 0, "failed": 0,
+                                    "started_at": None, "finished_at": None, "elapsed": 0.0}
+        # 累计统计
+        self.totals: Dict[str, Any] = {"runs": 0, "users": 0, "succeeded": 0, "failed": 0, "busy_seconds": 0.0}
+
+    def start(self) -> None:
+        """启动定时任务"""
+        if self._scheduler is not None:
+            return
+        if self.chatHistoryStoreService.versions.shared:
+            self._leader = acquire_leader("summary_scheduler")
+            if self._leader is None:
+                logger.info("其他 worker 已在运行后台总结，本进程跳过")
+                return
+        self._scheduler = BackgroundScheduler(daemon=True)
+        self._scheduler.add_job(self.run_once, "interval", seconds=self.interval, id="summarize_all",
+                                max_instances=1, coalesce=True)
+        self._scheduler.start()
+        logger.info("后台总结调度已启动", extra={"interval": self.interval, "threshold": self.threshold})
+
+    def shutdown(self) -> None:
+        if self._scheduler is not None:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+
+    def _summarize(self, user_id: str) -> bool:
+        start = time.perf_counter()
+        try:
+            # 总结请求排在在线对话之后
+            with background_priority():
+                return self.chatHistoryStoreService.summarize_user_history(user_id=user_id,
+                                                                           llmService=self.llmService)
+        except Exception:
+            logger.exception("后台总结用户失败", extra={"user_id": user_id})
+            return False
+        finally:
+            SummaryUserHistogram.observe(time.perf_counter() - start)
+
+    def _record(self, success: bool) -> None:
+        with self._stats_lock:
+            self.job["done"] += 1
+            self.job["succeeded" if success else "failed"] += 1
+        SummaryUsersCounter.inc(labels={"result": "success" if success else "failed"})
+
+    def run_once(self) -> Dict[str, Any]:
+        """执行一轮批量总结，已有任务在运行时直接返回当前进度"""
+        if not self._run_lock.acquire(blocking=False):
+            return self.stats()
+        try:
+            users: List[str] = [user_id for user_id, _ in
+                                self.chatHistoryStoreService.find_users_to_summarize(self.threshold)]
+            start = time.perf_counter()
+            with self._stats_lock:
+                self.job = {"running": True, "total": len(users), "done": 0, "succeeded": 0, "failed": 0,
+                            "started_at": time.time(), "finished_at": None, "elapsed": 0.0}
+
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="summarize") as pool:
+                for success in pool.map(self._summarize, users):
+                    self._record(success)
+
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.job.update(running=False, finished_at=time.time(), elapsed=elapsed)
+                self.totals["runs"] += 1
+                self.totals["users"] += self.job["done"]
+                self.totals["succeeded"] += self.job["succeeded"]
+                self.totals["failed"] += self.job["failed"]
+                self.totals["busy_seconds"] += elapsed
+            if users:
+                logger.info("后台总结完成", extra={"succeeded": self.job["succeeded"], "users": len(users),
+                                                  "seconds": round(elapsed, 2)})
+            return self.stats()
+        finally:
+            self._run_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """任务进度与吞吐统计"""
+        with self._stats_lock:
+            job = dict(self.job)
+            totals = dict(self.totals)
+        if job["running"] and job["started_at"]:
+            job["elapsed"] = time.time() - job["started_at"]
+        job["users_per_second"] = job["done"] / job["elapsed"] if job["elapsed"] else 0.0
+        totals["users_per_second"] = totals["users"] / totals["busy_seconds"] if totals["busy_seconds"] else 0.0
+        return {"enabled": self._scheduler is not None, "interval": self.interval, "threshold": self.threshold,
+                "concurrency": self.concurrency, "job": job, "totals": totals}
@@ -0,0 +1,393 @@
+"""业务接口工具运行时
+
+agent 的工具通过店铺后端接口查询订单、商品等信息。所有请求都在运行时自己的事件循环线程上执行，
+共用一个带连接池的 httpx.AsyncClient；同步与异步的工具调用都提交到这个循环，缓存与合并无需加锁。
+
+- 超时与重试：连接错误、超时与 5xx 按指数退避重试
+- 熔断：同一主机连续失败达到阈值后在一段时间内直接失败，之后放行一次试探请求
+- 缓存：幂等查询按 (store_id, 路径, 参数) 缓存，TTL 较短
+- 合并：相同的查询正在进行时，后到的调用等待同一个结果，不再重复请求上游
+
+业务工具通过 ToolRuntimeService.tool(...) 创建，例如:
+    ToolRuntimeService.tool("query_order", "按订单号查询订单状态", "/api/order")
+"""
+import asyncio
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Coroutine, Dict, Iterator, Optional, Tuple
+
+import httpx
+from langchain_core.tools import StructuredTool
+
+from .log import get_logger
+from .metrics import Metrics
+from .tracing import record_span
+
+logger = get_logger(__name__)
+
+# 业务接口地址，工具中的相对路径基于该地址
+BUSINESS_API_BASE_URL: str = os.getenv("BUSINESS_API_BASE_URL", "")
+TOOL_HTTP_TIMEOUT: float = float(os.getenv("TOOL_HTTP_TIMEOUT", "5"))
+TOOL_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("TOOL_HTTP_CONNECT_TIMEOUT", "2"))
+TOOL_HTTP_RETRIES: int = int(os.getenv("TOOL_HTTP_RETRIES", "2"))
+TOOL_HTTP_MAX_CONNECTIONS: int = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "100"))
+# 查询结果缓存时间（秒），0 表示不缓存
+TOOL_CACHE_TTL: float = float(os.getenv("TOOL_CACHE_TTL", "30"))
+TOOL_CACHE_SIZE: int = int(os.getenv("TOOL_CACHE_SIZE", "5000"))
+# 连续失败多少次后熔断，以及熔断持续的秒数
+TOOL_BREAKER_FAILURES: int = int(os.getenv("TOOL_BREAKER_FAILURES", "5"))
+TOOL_BREAKER_RESET: float = float(os.getenv("TOOL_BREAKER_RESET", "30"))
+
+ToolRequestCounter = Metrics.counter("tool_requests_total", "业务接口工具调用次数")
+
+# 当前请求的店铺与用户：store_id 优先于工具输入中的 store_id，user_id 随查询传给业务接口
+CurrentStoreId: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("store_id", default=None)
+CurrentUserId: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("user_id", default=None)
+
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...]]
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断期间拒绝请求"""
+
+
+class CircuitBreaker:
+    """按连续失败次数熔断，冷却后放行一次试探请求"""
+
+    def __init__(self, failures: int = TOOL_BREAKER_FAILURES, reset_timeout: float = TOOL_BREAKER_RESET) -> None:
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._trial = False
+        if self.state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+
+    def release(self) -> None:
+        """请求既未成功也未计入失败（被取消、响应无法解码等）时调用，允许下一次试探请求"""
+        self._trial = False
+
+    def failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                logger.warning("业务接口熔断", extra={"failures": self.consecutive_failures})
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class ToolRuntime:
+    """带连接池、重试、熔断、缓存与请求合并的业务接口客户端"""
+
+    def __init__(self, base_url: str = BUSINESS_API_BASE_URL, timeout: float = TOOL_HTTP_TIMEOUT,
+                 connect_timeout: float = TOOL_HTTP_CONNECT_TIMEOUT, retries: int = TOOL_HTTP_RETRIES,
+                 max_connections: int = TOOL_HTTP_MAX_CONNECTIONS, cache_ttl: float = TOOL_CACHE_TTL,
+                 cache_size: int = TOOL_CACHE_SIZE, breaker_failures: int = TOOL_BREAKER_FAILURES,
+                 breaker_reset: float = TOOL_BREAKER_RESET, backoff: float = 0.1) -> None:
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.retries = retries
+        self.max_connections = max_connections
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.backoff = backoff
+        # 以下状态只在运行时的事件循环线程上访问
+        self._cache: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"calls": 0, "upstream": 0, "cache_hits": 0, "coalesced": 0, "retries": 0,
+                                       "failures": 0, "rejected": 0}
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="tool-runtime", daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """把协程提交到运行时的事件循环"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _client_for_loop(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    def _breaker(self, url: httpx.URL) -> CircuitBreaker:
+        host = url.host or "default"
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+        return self._breakers[host]
+
+    def _cache_get(self, key: CacheKey) -> Tuple[bool, Any]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, entry[1]
+
+    def _cache_put(self, key: CacheKey, value: Any, ttl: float) -> None:
+        self._cache[key] = (time.monotonic() + ttl, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, path: str, params: Dict[str, Any]) -> Any:
+        client = self._client_for_loop()
+        breaker = self._breaker(client.build_request("GET", path).url)
+        if not breaker.allow():
+            self.counts["rejected"] += 1
+            raise CircuitOpenError(f"业务接口熔断中: {path}")
+
+        settled = False
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self.counts["upstream"] += 1
+                    response = await client.get(path, params=params)
+                    if response.status_code >= 500:
+                        response.raise_for_status()
+                    breaker.success()
+                    settled = True
+                    # 4xx 属于请求本身的问题，不重试也不计入熔断
+                    response.raise_for_status()
+                    if "json" in response.headers.get("content-type", ""):
+                        return response.json()
+                    return response.text
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                        raise
+                    if attempt >= self.retries:
+                        breaker.failure()
+                        settled = True
+                        self.counts["failures"] += 1
+                        raise
+                    self.counts["retries"] += 1
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        finally:
+            # 半开状态下的试探请求被取消或因其他异常结束时，不能一直占着试探名额
+            if not settled:
+                breaker.release()
+
+    async def _get(self, path: str, params: Dict[str, Any], store_id: Optional[str], ttl: Optional[float]) -> Any:
+        ttl = self.cache_ttl if ttl is None else ttl
+        key: CacheKey = (store_id or "", path, tuple(sorted((k, str(v)) for k, v in params.items())))
+        self.counts["calls"] += 1
+        if ttl > 0:
+            hit, value = self._cache_get(key)
+            if hit:
+                self.counts["cache_hits"] += 1
+                return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.counts["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            query = dict(params, store_id=store_id) if store_id else dict(params)
+            value = await self._fetch(path, query)
+            if ttl > 0:
+                self._cache_put(key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 “exception was never retrieved” 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, store_id: Optional[str] = None,
+            ttl: Optional[float] = None) -> Any:
+        """同步查询业务接口
+
+        Args:
+            path: 接口路径（相对 BUSINESS_API_BASE_URL）或完整地址
+            params: 查询参数
+            store_id: 店铺ID，参与缓存键并作为查询参数传给接口
+            ttl: 缓存时间，默认使用 TOOL_CACHE_TTL，0 表示不缓存
+
+        Returns:
+            Any: JSON 接口返回解析后的对象，否则为文本
+        """
+        return self.submit(self._get(path, params or {}, store_id, ttl)).result()
+
+    async def aget(self, path: str, params: Optional[Dict[str, Any]] = None, store_id: Optional[str] = None,
+                   ttl: Optional[float] = None) -> Any:
+        """get 的异步版本"""
+        return await asyncio.wrap_future(self.submit(self._get(path, params or {}, store_id, ttl)))
+
+    @staticmethod
+    def _parse_input(text: str) -> Tuple[str, Optional[str]]:
+        """工具输入可以是关键词，也可以是带 keyword/store_id 的 JSON
+
+        店铺以请求范围内的 store_id 为准，模型给出的 store_id 只在没有请求范围（如离线脚本）时使用，
+        避免模型输入越权查询其他店铺。
+        """
+        text = (text or "").strip()
+        store_id = CurrentStoreId.get()
+        if text.startswith("{"):
+            try:
+                data = json.loads(text)
+                return str(data.get("keyword", "")), store_id or str(data.get("store_id") or "") or None
+            except ValueError:
+                pass
+        return text, store_id
+
+    @staticmethod
+    def _dump(value: Any) -> str:
+        return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+    def tool(self, name: str, description: str, path: str, param: str = "keyword",
+             ttl: Optional[float] = None, answer_cacheable: bool = False) -> StructuredTool:
+        """创建调用业务接口的 agent 工具，同步与异步执行共用同一个运行时
+
+        Args:
+            name: 工具名称
+            description: 工具说明，供模型选择工具
+            path: 接口路径
+            param: 关键词对应的查询参数名
+            ttl: 缓存时间，默认使用 TOOL_CACHE_TTL，0 表示不缓存
+            answer_cacheable: 结果与用户、订单无关（如店铺政策），调用过该工具的回答仍可写入语义回答缓存；
+                其余工具把当前请求的 user_id 传给接口，由接口校验订单等数据的归属，查询结果按用户缓存
+
+        Returns:
+            StructuredTool: 单输入工具
+        """
+        def _record(start: float, status: str) -> None:
+            ToolRequestCounter.inc(labels={"tool": name, "status": status})
+            record_span("tool_http", time.perf_counter() - start, tool=name, status=status)
+
+        def _query(keyword: str) -> Tuple[Dict[str, Any], Optional[str]]:
+            text, store_id = self._parse_input(keyword)
+            params: Dict[str, Any] = {param: text}
+            user_id = CurrentUserId.get()
+            if user_id and not answer_cacheable:
+                params["user_id"] = user_id
+            return params, store_id
+
+        def run(keyword: str) -> str:
+            params, store_id = _query(keyword)
+            start = time.perf_counter()
+            try:
+                result = self._dump(self.get(path, params, store_id=store_id, ttl=ttl))
+            except CircuitOpenError:
+                _record(start, "rejected")
+                return "业务接口暂时不可用，请稍后再试"
+            except Exception as e:
+                _record(start, "error")
+                logger.warning("业务接口调用失败", extra={"tool": name, "error": str(e)})
+                return f"查询失败: {e}"
+            _record(start, "ok")
+            return result
+
+        async def arun(keyword: str) -> str:
+            params, store_id = _query(keyword)
+            start = time.perf_counter()
+            try:
+                result = self._dump(await self.aget(path, params, store_id=store_id, ttl=ttl))
+            except CircuitOpenError:
+                _record(start, "rejected")
+                return "业务接口暂时不可用，请稍后再试"
+            except Exception as e:
+                _record(start, "error")
+                logger.warning("业务接口调用失败", extra={"tool": name, "error": str(e)})
+                return f"查询失败: {e}"
+            _record(start, "ok")
+            return result
+
+        return StructuredTool.from_function(func=run, coroutine=arun, name=name, description=description,
+                                            metadata={"answer_cacheable": answer_cacheable})
+
+    def invalidate(self, store_id: Optional[str] = None) -> None:
+        """清除缓存，传入 store_id 时只清除该店铺的缓存"""
+        async def clear() -> None:
+            if store_id is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[0] == store_id]:
+                del self._cache[key]
+
+        if self._loop is not None:
+            self.submit(clear()).result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.counts,
+            "cache_entries": len(self._cache),
+            "inflight": len(self._inflight),
+            "breakers": {host: breaker.state for host, breaker in self._breakers.items()},
+        }
+
+    def close(self) -> None:
+        """关闭连接池并停止事件循环"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+            self._client = None
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+@contextmanager
+def request_scope(user_id: Optional[str], store_id: Optional[str]) -> Iterator[None]:
+    """设置当前请求的用户与店铺，工具查询业务接口时使用"""
+    user_token = CurrentUserId.set(user_id)
+    store_token = CurrentStoreId.set(store_id)
+    try:
+        yield
+    finally:
+        CurrentStoreId.reset(store_token)
+        CurrentUserId.reset(user_token)
+
+
+# 全局工具运行时（事件循环与连接池在第一次调用时创建）
+ToolRuntimeService: ToolRuntime = ToolRuntime()
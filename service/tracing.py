@@ -0,0 +1,248 @@
+"""请求级链路追踪
+
+每个 /chat 请求开启一个 Trace，期间的历史读取、相似度检查、对话保存、ReAct 每一步的模型调用与工具调用
+都记录为 span：耗时进入 span_seconds 直方图，同时汇总到当前 Trace，请求结束时输出一条耗时分解日志。
+模型调用与工具调用通过 LangChain 回调获取，其余阶段使用 span/traced 包裹。
+"""
+import contextvars
+import functools
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .log import TraceId, get_logger
+from .metrics import Metrics
+
+T = TypeVar("T")
+
+logger = get_logger(__name__)
+
+SpanHistogram = Metrics.histogram("span_seconds", "各阶段耗时")
+LlmTokensCounter = Metrics.counter("llm_tokens_total", "大模型消耗的 token 数")
+AgentStepsCounter = Metrics.counter("agent_steps_total", "ReAct 迭代次数")
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """一次请求内的 span 汇总"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, Dict[str, Any]]] = []
+        # cached_prompt 为输入中命中服务端前缀缓存的部分，已包含在 prompt 中
+        self.tokens: Dict[str, int] = {"prompt": 0, "cached_prompt": 0, "completion": 0}
+        self.steps = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, labels: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append((name, seconds, labels))
+
+    def add_tokens(self, prompt: int, completion: int, cached: int = 0) -> None:
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["cached_prompt"] += cached
+            self.tokens["completion"] += completion
+
+    def add_step(self) -> None:
+        with self._lock:
+            self.steps += 1
+
+    def count(self, name: str) -> int:
+        """已记录的指定名称 span 数"""
+        with self._lock:
+            return sum(1 for span_name, _, _ in self.spans if span_name == name)
+
+    def labels(self, name: str) -> List[Dict[str, Any]]:
+        """已记录的指定名称 span 的标签，按记录顺序排列"""
+        with self._lock:
+            return [labels for span_name, _, labels in self.spans if span_name == name]
+
+    def breakdown(self) -> Dict[str, Any]:
+        """按 span 名称汇总的耗时分解"""
+        with self._lock:
+            spans = list(self.spans)
+            tokens = dict(self.tokens)
+        summary: Dict[str, Dict[str, float]] = {}
+        for name, seconds, _ in spans:
+            entry = summary.setdefault(name, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] = round(entry["seconds"] + seconds, 6)
+        tokens["uncached_prompt"] = tokens["prompt"] - tokens["cached_prompt"]
+        return {"trace": self.name, "total_seconds": round(time.perf_counter() - self.started, 6),
+                "agent_steps": self.steps, "tokens": tokens, "spans": summary}
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def start_trace(name: str) -> Iterator[Trace]:
+    """开启一次请求追踪，结束时输出耗时分解日志"""
+    trace = Trace(name)
+    token = _current.set(trace)
+    id_token = TraceId.set(trace.trace_id)
+    try:
+        yield trace
+    finally:
+        logger.info("请求耗时分解", extra=trace.breakdown())
+        TraceId.reset(id_token)
+        _current.reset(token)
+
+
+def record_span(name: str, seconds: float, trace: Optional[Trace] = None, **labels: Any) -> None:
+    """记录一个 span 的耗时"""
+    SpanHistogram.observe(seconds, labels={"span": name, **labels})
+    trace = trace or current_trace()
+    if trace is not None:
+        trace.add(name, seconds, labels)
+
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[None]:
+    """记录代码块耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start, **labels)
+
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """记录函数耗时的装饰器"""
+    def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def token_usage(response: Any) -> Tuple[int, int]:
+    """从模型返回结果中读取 (输入 token 数, 输出 token 数)
+
+    兼容 llm_output.token_usage、消息的 usage_metadata 以及通义千问 response_metadata 中的
+    input_tokens/output_tokens 与 prompt_tokens/completion_tokens 写法。
+    """
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage:
+        return (int(usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0),
+                int(usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0))
+    prompt = completion = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None)
+            if metadata:
+                prompt += int(metadata.get("input_tokens", 0) or 0)
+                completion += int(metadata.get("output_tokens", 0) or 0)
+                continue
+            usage = ((getattr(message, "response_metadata", None) or {}).get("token_usage")
+                     or (getattr(generation, "generation_info", None) or {}).get("token_usage") or {})
+            prompt += int(usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0)
+            completion += int(usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0)
+    return prompt, completion
+
+
+def _cached_of(usage: Dict[str, Any]) -> int:
+    details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+    return int(details.get("cached_tokens", 0) or 0)
+
+
+def cached_tokens(response: Any) -> int:
+    """从模型返回结果中读取输入中命中服务端缓存的 token 数
+
+    兼容通义千问 usage 中的 prompt_tokens_details.cached_tokens 与 usage_metadata 中的
+    input_token_details.cache_read；未返回时为 0。
+    """
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage:
+        return _cached_of(usage)
+    cached = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None)
+            if metadata and metadata.get("input_token_details"):
+                cached += int(metadata["input_token_details"].get("cache_read", 0) or 0)
+                continue
+            usage = ((getattr(message, "response_metadata", None) or {}).get("token_usage")
+                     or (getattr(generation, "generation_info", None) or {}).get("token_usage") or {})
+            cached += _cached_of(usage)
+    return cached
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """记录模型调用、工具调用与 ReAct 步数的 LangChain 回调
+
+    创建时绑定当前请求的 Trace，回调在线程池中执行时同样能写入同一个 Trace。
+    """
+
+    def __init__(self, trace: Optional[Trace] = None) -> None:
+        self.trace = trace or current_trace()
+        # run_id -> (span 名称, 开始时间, 标签)
+        self._runs: Dict[Any, Tuple[str, float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: Any, name: str, **labels: Any) -> None:
+        with self._lock:
+            self._runs[run_id] = (name, time.perf_counter(), labels)
+
+    def _end(self, run_id: Any, status: str) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        name, started, labels = run
+        record_span(name, time.perf_counter() - started, trace=self.trace, status=status, **labels)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: Any, **kwargs: Any) -> None:
+        self._start(run_id, "llm")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: Any,
+                            **kwargs: Any) -> None:
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id, "ok")
+        prompt, completion = token_usage(response)
+        cached = cached_tokens(response)
+        if prompt:
+            LlmTokensCounter.inc(prompt, labels={"type": "prompt"})
+        if cached:
+            LlmTokensCounter.inc(cached, labels={"type": "cached_prompt"})
+        if completion:
+            LlmTokensCounter.inc(completion, labels={"type": "completion"})
+        if self.trace is not None:
+            self.trace.add_tokens(prompt, completion, cached)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id, "error")
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: Any, **kwargs: Any) -> None:
+        self._start(run_id, "tool", tool=(serialized or {}).get("name") or kwargs.get("name") or "unknown")
+
+    def on_tool_end(self, output: Any, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: Any, **kwargs: Any) -> None:
+        self._end(run_id, "error")
+
+    def on_agent_action(self, action: Any, *, run_id: Any, **kwargs: Any) -> None:
+        AgentStepsCounter.inc()
+        if self.trace is not None:
+            self.trace.add_step()
+
+
+def trace_config() -> Dict[str, Any]:
+    """传给 invoke/ainvoke 的 config，绑定当前请求的追踪"""
+    return {"callbacks": [TracingCallbackHandler()]}
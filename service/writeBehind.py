@@ -0,0 +1,128 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .log import get_logger
+from .metrics import Metrics
+
+logger = get_logger(__name__)
+
+WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+# 达到该条数立即写入
+WRITE_BATCH_SIZE: int = int(os.getenv("WRITE_BATCH_SIZE", "32"))
+# 队列中最早一条等待超过该时间（秒）即写入
+WRITE_FLUSH_INTERVAL: float = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))
+# 队列上限，队列满时退化为同步写入
+WRITE_QUEUE_SIZE: int = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+
+WriteFlushHistogram = Metrics.histogram("conversation_flush_seconds", "批量写入对话耗时")
+WriteBatchHistogram = Metrics.histogram("conversation_flush_batch_size", "每批写入的对话条数",
+                                        (1, 2, 4, 8, 16, 32, 64, 128))
+
+# (用户ID, 用户问题, 机器人回答, 对话时间)，对话时间在入队时记录，同一批写入的对话各自保留
+ConversationItem = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+class ConversationWriter:
+    """对话写入队列
+
+    请求线程只负责入队，后台线程按条数或时间触发批量写入，关闭时写完队列中剩余的对话。
+    """
+
+    def __init__(self, flush_func: Callable[[List[ConversationItem]], Any], batch_size: int = WRITE_BATCH_SIZE,
+                 interval: float = WRITE_FLUSH_INTERVAL, max_queue: int = WRITE_QUEUE_SIZE) -> None:
+        self.flush_func = flush_func
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.Queue[ConversationItem]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self.sync_writes = 0
+        self.last_flush_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, item: ConversationItem) -> None:
+        """对话入队，队列已满时在当前线程同步写入"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.sync_writes += 1
+            self._flush([item])
+
+    def _flush(self, batch: List[ConversationItem]) -> None:
+        start = time.perf_counter()
+        try:
+            self.flush_func(batch)
+            self.flushed += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("批量写入对话失败", extra={"batch_size": len(batch)})
+        finally:
+            self.last_flush_seconds = time.perf_counter() - start
+            self.batches += 1
+            WriteFlushHistogram.observe(self.last_flush_seconds)
+            WriteBatchHistogram.observe(len(batch))
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """阻塞直到当前队列中的对话全部写入"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def shutdown(self) -> None:
+        """写完剩余对话后停止后台线程"""
+        if self._thread is None:
+            return
+        self.flush()
+        self._stopping.set()
+        self._thread.join(timeout=self.interval * 2 + 1)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": WRITE_BEHIND_ENABLED,
+            "queue_depth": self._queue.qsize(),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed": self.failed,
+            "sync_writes": self.sync_writes,
+            "last_flush_seconds": self.last_flush_seconds,
+        }